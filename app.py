@@ -1,5 +1,6 @@
 import os
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
 from extensions import db, login_manager, csrf
 
 def create_app():
@@ -12,12 +13,43 @@ def create_app():
         'pool_recycle': 300,
         'pool_pre_ping': True,
     }
+    # Per request: larger materials arrive in chunks (services/uploads.py, UPLOAD_MAX_SIZE).
     app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
     app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    # 'direct', 'x-accel' (nginx) or 'x-sendfile' (Apache/lighttpd); see DEPLOY_PYTHONANYWHERE.md
+    app.config['FILE_DELIVERY'] = os.environ.get('FILE_DELIVERY', 'direct')
+    app.config['FILE_ACCEL_PREFIX'] = os.environ.get('FILE_ACCEL_PREFIX', '/_uploads/')
+    # Compiled templates shared by every worker; fill it with `flask templates-compile`.
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja'))
+    # /metrics answers `Authorization: Bearer <token>` and logged-in admins;
+    # METRICS_PUBLIC=1 opens it to anyone (only behind a private network).
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['METRICS_PUBLIC'] = os.environ.get('METRICS_PUBLIC', '').lower() in ('1', 'true', 'yes')
+    # Per-request query counts, Server-Timing and /admin/sql-stats; costs a little on every query.
+    app.config['SQL_INSTRUMENTATION'] = os.environ.get('SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+    # Sampled request profiles for /admin/profiles: 1 in PROFILE_SAMPLE_RATE, slower than
+    # PROFILE_SLOW_MS, or sent by an admin with the X-Profile header.
+    app.config['PROFILING'] = os.environ.get('PROFILING', '').lower() in ('1', 'true', 'yes')
+    app.config['PROFILE_SAMPLE_RATE'] = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_SLOW_MS'] = int(os.environ.get('PROFILE_SLOW_MS', 0))
+    # {% cache %} fragments: 'lru' per worker, 'filesystem' shared by the workers, '' off.
+    app.config['FRAGMENT_CACHE'] = os.environ.get('FRAGMENT_CACHE', 'lru')
+    # gzip/Brotli for dynamic pages; turn off when the front server already compresses.
+    app.config['COMPRESS'] = os.environ.get('COMPRESS', '1').lower() in ('1', 'true', 'yes')
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
     
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
     
+    if app.config['TEMPLATE_CACHE_DIR']:
+        os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+    
+    # Before db.init_app: it chooses the pool class the engine is built with.
+    from services import metrics
+    
+    metrics.init_app(app)
+    
     db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
@@ -26,11 +58,33 @@ def create_app():
     login_manager.login_message = 'Por favor, faça login para acessar esta página.'
     login_manager.login_message_category = 'info'
     
-    from models import User
+    # Schema, indexes and the first admin come from `flask init-db` and
+    # `flask create-admin`, not from every worker boot.
+    from services import search, progress, score_stats, catalog, user_cache, quiz_cache, storage, delivery, uploads, extraction, heartbeats, instrumentation, profiling, fragment_cache, assets, compression
+    
+    search.init_app(app)
+    progress.init_app(app)
+    score_stats.init_app(app)
+    catalog.init_app(app)
+    user_cache.init_app(app)
+    quiz_cache.init_app(app)
+    storage.init_app(app)
+    delivery.init_app(app)
+    uploads.init_app(app)
+    extraction.init_app(app)
+    heartbeats.init_app(app)
+    instrumentation.init_app(app)
+    profiling.init_app(app)
+    fragment_cache.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
+    
+    from commands import register_commands
+    register_commands(app)
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
     
     from routes.auth import auth_bp
     from routes.main import main_bp
@@ -46,31 +100,13 @@ def create_app():
     app.register_blueprint(simulados_bp, url_prefix='/simulados')
     app.register_blueprint(materiais_bp, url_prefix='/materiais')
     
-    with app.app_context():
-        db.create_all()
-        create_admin_user()
-    
     return app
 
-def create_admin_user():
-    from models import User
-    from werkzeug.security import generate_password_hash
-    
-    admin = User.query.filter_by(email='admin@nerdsplantao.com').first()
-    if not admin:
-        admin = User(
-            username='admin',
-            email='admin@nerdsplantao.com',
-            password_hash=generate_password_hash('admin123'),
-            is_admin=True,
-            is_approved=True,
-            is_active=True
-        )
-        db.session.add(admin)
-        db.session.commit()
-        print('Admin user created: admin@nerdsplantao.com / admin123')
-
 app = create_app()
 
 if __name__ == '__main__':
+    from commands import init_database
+    
+    with app.app_context():
+        init_database()
     app.run(host='0.0.0.0', port=5000, debug=True)
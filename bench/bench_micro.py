@@ -0,0 +1,41 @@
+"""pytest-benchmark microbenchmarks of the hottest views, through the test client.
+
+Usage:
+    python -m pytest bench/bench_micro.py --benchmark-json=micro.json
+
+See bench/conftest.py for the dataset options (--bench-users, ...).
+"""
+import datagen
+from conftest import attempt_id
+
+def get(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, (url, response.status_code)
+
+def test_submit_grading(benchmark, student, quiz_form):
+    quiz_id, answers = quiz_form
+    
+    def take():
+        # A fresh attempt per round; only the submit is timed.
+        return (attempt_id(student.get(f'/simulados/take/{quiz_id}')),), {}
+    
+    def submit(attempt):
+        response = student.post(f'/simulados/submit/{attempt}', data=dict(answers, time_spent='600'))
+        assert response.status_code == 302
+    
+    benchmark.pedantic(submit, setup=take, rounds=50, warmup_rounds=2)
+
+def test_search(benchmark, student):
+    terms = iter(datagen.SEARCH_TERMS * 1000)
+    
+    def search():
+        response = student.get('/search', query_string={'q': next(terms)})
+        assert response.status_code == 200
+    
+    benchmark(search)
+
+def test_dashboard(benchmark, student):
+    benchmark(get, student, '/dashboard')
+
+def test_admin_index(benchmark, admin):
+    benchmark(get, admin, '/admin/')
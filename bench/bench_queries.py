@@ -0,0 +1,25 @@
+"""Query budgets of the hottest views, through the test client.
+
+Usage:
+    python -m pytest bench/bench_queries.py
+
+See bench/conftest.py for the dataset options (--bench-users, ...). A view
+going over its budget fails with the statements it repeated, which is
+usually an N+1 in a template loop.
+"""
+import pytest
+from services.instrumentation import assert_max_queries
+
+BUDGETS = [
+    ('/dashboard', 3),
+    ('/videoaulas/watch/1', 2),
+    ('/simulados/history', 3),
+]
+
+@pytest.mark.parametrize('url, limit', BUDGETS)
+def test_query_budget(student, url, limit):
+    # The first request fills the per-worker caches (catalog, compiled quizzes).
+    assert student.get(url).status_code == 200
+    with assert_max_queries(limit):
+        response = student.get(url)
+    assert response.status_code == 200, (url, response.status_code)
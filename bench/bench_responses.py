@@ -0,0 +1,131 @@
+"""Compare the quiz_attempts.answers JSON blob with the question_responses table.
+
+Usage:
+    python bench/bench_responses.py --attempts 10000 100000
+
+Seeds attempts with legacy JSON answers, measures the blob, runs the
+backfill, then measures the table. Runs against DATABASE_URL when set (use a
+throwaway Postgres database), otherwise against a temporary SQLite file.
+Prints one JSON object per size.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_responses.db')
+
+from datetime import datetime
+from sqlalchemy import insert, text
+from app import app
+from extensions import db
+from models import User, Discipline, Module, Quiz, Question, QuizAttempt
+from services import responses
+from services.quiz_cache import OPTIONS
+
+def seed(attempts, questions, rng):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(User), [{'id': 1, 'username': 'bench', 'email': 'bench@example.com', 'password_hash': 'x'}])
+    db.session.execute(insert(Discipline), [{'id': 1, 'name': 'Bench', 'order': 0}])
+    db.session.execute(insert(Module), [{'id': 1, 'name': 'Bench', 'discipline_id': 1, 'order': 0}])
+    db.session.execute(insert(Quiz), [{'id': 1, 'title': 'Bench', 'module_id': 1, 'order': 0}])
+    keys = {str(i): rng.choice(OPTIONS) for i in range(1, questions + 1)}
+    db.session.execute(insert(Question), [
+        {'id': i, 'quiz_id': 1, 'text': f'Q{i}', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd',
+         'option_e': 'e', 'correct_answer': keys[str(i)], 'order': i}
+        for i in range(1, questions + 1)
+    ])
+    
+    now = datetime.utcnow()
+    batch = []
+    for i in range(1, attempts + 1):
+        answers = {str(q): rng.choice(OPTIONS) if rng.random() < 0.95 else '' for q in range(1, questions + 1)}
+        # Graded under the same key, as submit() did, so backfill moves every attempt.
+        correct = sum(answer == keys[question] for question, answer in answers.items())
+        batch.append({'id': i, 'user_id': 1, 'quiz_id': 1, 'total_questions': questions, 'completed': True,
+                      'correct_answers': correct, 'score': 0, 'finished_at': now, 'answers': json.dumps(answers)})
+        if len(batch) == 5000:
+            db.session.execute(insert(QuizAttempt), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(QuizAttempt), batch)
+    db.session.commit()
+
+def table_bytes(table):
+    # VACUUM first so space freed by the backfill is not counted.
+    postgres = db.engine.dialect.name == 'postgresql'
+    db.session.commit()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text(f'VACUUM FULL {table}' if postgres else 'VACUUM'))
+    if postgres:
+        return db.session.execute(text('SELECT pg_total_relation_size(:table)'), {'table': table}).scalar()
+    return db.session.execute(text(
+        'SELECT sum(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = :table)'
+    ), {'table': table}).scalar()
+
+def blob_choice_counts(question_id):
+    key = str(question_id)
+    counts = {}
+    for (answers,) in db.session.query(QuizAttempt.answers).filter(QuizAttempt.quiz_id == 1):
+        choice = json.loads(answers).get(key, '')
+        counts[choice] = counts.get(choice, 0) + 1
+    return counts
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        db.session.expire_all()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': round(statistics.median(samples), 3), 'max_ms': round(max(samples), 3)}
+
+def run(attempts, questions, repeat, rng):
+    seed(attempts, questions, rng)
+    question_id = questions // 2
+    sample = [db.session.get(QuizAttempt, rng.randint(1, attempts)) for _ in range(repeat)]
+    
+    report = {'attempts': attempts, 'questions': questions, 'dialect': db.engine.dialect.name}
+    attempts_with_blob = table_bytes('quiz_attempts')
+    report['blob'] = {
+        'choice_counts': timed(lambda: blob_choice_counts(question_id), repeat),
+        'attempt_answers': timed(lambda: [json.loads(attempt.answers) for attempt in sample], repeat),
+    }
+    
+    started = time.perf_counter()
+    responses.backfill()
+    report['backfill_s'] = round(time.perf_counter() - started, 3)
+    
+    report['storage_bytes'] = {
+        'blob': attempts_with_blob - table_bytes('quiz_attempts'),
+        'table': table_bytes('question_responses'),
+    }
+    sample = [db.session.get(QuizAttempt, attempt.id) for attempt in sample]
+    report['table'] = {
+        'choice_counts': timed(lambda: responses.choice_counts(question_id), repeat),
+        'attempt_answers': timed(lambda: [responses.attempt_answers(attempt) for attempt in sample], repeat),
+    }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--attempts', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--questions', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    with app.app_context():
+        for attempts in args.attempts:
+            print(json.dumps(run(attempts, args.questions, args.repeat, random.Random(args.seed))))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Compare the ILIKE scan against the indexed search engine.
+
+Usage:
+    python bench/bench_search.py --rows 10000 100000
+
+Runs against DATABASE_URL when set (use a throwaway Postgres database),
+otherwise against a temporary SQLite file. Prints one JSON object per size.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.environ.get('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+
+from sqlalchemy import insert
+from app import app
+from extensions import db
+from models import Discipline, Module, VideoLesson, Quiz, Material
+from services import search as search_engine
+
+WORDS = [
+    'cardiologia', 'arritmia', 'fibrilação', 'insuficiência', 'cardíaca', 'pneumonia', 'asma',
+    'diabetes', 'hipertensão', 'sepse', 'choque', 'trauma', 'fratura', 'anemia', 'leucemia',
+    'nefrologia', 'diálise', 'pediatria', 'neonatal', 'obstetrícia', 'gestação', 'pré-eclâmpsia',
+    'cirurgia', 'apendicite', 'colecistite', 'neurologia', 'avc', 'epilepsia', 'cefaleia',
+    'infectologia', 'hiv', 'tuberculose', 'dengue', 'emergência', 'intubação', 'ventilação',
+]
+QUERIES = ['fibrilacao', 'insuficiência cardíaca', 'pre-eclampsia', 'sepse choque', 'tuberculose']
+
+FILLER = ['termo%04d' % i for i in range(5000)]
+
+def phrase(rng, size):
+    # Clinical terms are rare against a large filler vocabulary, like real catalog text.
+    return ' '.join(rng.choice(WORDS) if rng.random() < 0.05 else rng.choice(FILLER) for _ in range(size)).capitalize()
+
+def seed(rows, rng):
+    db.drop_all()
+    db.create_all()
+    search_engine.ensure_search_index()
+    
+    disciplines = [{'id': i, 'name': phrase(rng, 2), 'description': phrase(rng, 8), 'order': i} for i in range(1, 21)]
+    modules = [
+        {'id': i, 'name': phrase(rng, 3), 'description': phrase(rng, 10), 'discipline_id': 1 + i % 20, 'order': i}
+        for i in range(1, 201)
+    ]
+    db.session.execute(insert(Discipline), disciplines)
+    db.session.execute(insert(Module), modules)
+    
+    per_type = rows // 3
+    for model, extra in ((VideoLesson, {'video_url': 'https://youtu.be/abcdefghijk'}), (Quiz, {}), (Material, {})):
+        batch = []
+        for i in range(per_type):
+            row = {'title': phrase(rng, 4), 'description': phrase(rng, 30), 'module_id': 1 + i % 200, 'order': i}
+            row.update(extra)
+            batch.append(row)
+            if len(batch) == 5000:
+                db.session.execute(insert(model), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(model), batch)
+    db.session.commit()
+    
+    started = time.perf_counter()
+    search_engine.rebuild_index()
+    return time.perf_counter() - started
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        db.session.expire_all()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': round(statistics.median(samples), 3), 'max_ms': round(max(samples), 3)}
+
+def run(rows, repeat, rng):
+    report = {'rows': rows, 'dialect': db.engine.dialect.name, 'rebuild_s': round(seed(rows, rng), 3), 'queries': {}}
+    for query in QUERIES:
+        report['queries'][query] = {
+            'ilike': timed(lambda: search_engine.ilike_search(query), repeat),
+            'indexed': timed(lambda: search_engine.search(query), repeat),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    with app.app_context():
+        for rows in args.rows:
+            print(json.dumps(run(rows, args.repeat, random.Random(args.seed)), ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Measure worker startup: seconds from `import app` to the first response.
+
+Usage:
+    python bench/bench_startup.py --repeat 10
+
+Every sample is a fresh interpreter, like a gunicorn worker boot. Modes:
+    legacy  what create_app() used to do on import: create_all(), the ensure_*
+            schema checks, the admin lookup, NumPy via routes.admin, and no
+            template bytecode cache
+    cold    current boot with an empty template cache
+    warm    current boot after `flask templates-compile`
+
+Runs against DATABASE_URL when set, otherwise against a temporary SQLite file.
+Prints one JSON object per mode with the median of each phase.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from app import app
+imported = time.perf_counter()
+if {legacy!r}:
+    import numpy
+    from commands import init_database
+    from models import User
+    with app.app_context():
+        init_database()
+        User.query.filter_by(email='admin@nerdsplantao.com').first()
+booted = time.perf_counter()
+response = app.test_client().get('/login')
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'boot': booted - started, 'first_request': done - started}}))
+'''
+
+SETUP = '''
+import sys
+sys.path.insert(0, {root!r})
+from app import app
+from commands import init_database
+with app.app_context():
+    init_database()
+    if {compile_templates!r}:
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+'''
+
+def run_child(code, env):
+    output = subprocess.run([sys.executable, '-c', code], env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1]) if output.strip() else None
+
+def sample(mode, repeat, env):
+    cache_dir = tempfile.mkdtemp()
+    env = dict(env, TEMPLATE_CACHE_DIR='' if mode == 'legacy' else cache_dir)
+    if mode == 'warm':
+        run_child(SETUP.format(root=ROOT, compile_templates=True), env)
+    samples = []
+    for _ in range(repeat):
+        if mode == 'cold':
+            shutil.rmtree(cache_dir)
+            os.makedirs(cache_dir)
+        samples.append(run_child(CHILD.format(root=ROOT, legacy=mode == 'legacy'), env))
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return {
+        'mode': mode,
+        'repeat': repeat,
+        **{f'{phase}_ms': round(statistics.median(s[phase] for s in samples) * 1000, 1)
+           for phase in ('import', 'boot', 'first_request')},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--modes', nargs='+', default=['legacy', 'cold', 'warm'], choices=['legacy', 'cold', 'warm'])
+    args = parser.parse_args()
+    
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_startup.db')
+    # The schema exists before any timed boot, as after a deploy's `flask init-db`.
+    run_child(SETUP.format(root=ROOT, compile_templates=False), dict(env, TEMPLATE_CACHE_DIR=''))
+    for mode in args.modes:
+        print(json.dumps(sample(mode, args.repeat, env)))
+
+if __name__ == '__main__':
+    main()
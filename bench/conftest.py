@@ -0,0 +1,79 @@
+"""Fixtures for the pytest-benchmark microbenchmarks (bench/bench_micro.py).
+
+Usage:
+    pip install pytest-benchmark
+    python -m pytest bench/bench_micro.py --benchmark-json=micro.json
+
+Seeds a dataset with bench/datagen.py into DATABASE_URL when set (it is
+dropped and recreated), otherwise into a temporary SQLite file.
+"""
+import os
+import re
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def pytest_addoption(parser):
+    parser.addoption('--bench-users', type=int, default=2000)
+    parser.addoption('--bench-attempts', type=int, default=100000)
+    parser.addoption('--bench-progress', type=int, default=100000)
+    parser.addoption('--bench-seed', type=int, default=42)
+
+@pytest.fixture(scope='session')
+def app(pytestconfig):
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_micro.db')
+    import datagen
+    from app import app
+    
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        datagen.generate(
+            seed=pytestconfig.getoption('bench_seed'),
+            users=pytestconfig.getoption('bench_users'),
+            attempts=pytestconfig.getoption('bench_attempts'),
+            progress=pytestconfig.getoption('bench_progress'),
+        )
+    return app
+
+def _client(app, email):
+    import datagen
+    
+    client = app.test_client()
+    response = client.post('/login', data={'email': email, 'password': datagen.PASSWORD})
+    assert response.status_code == 302, response.status_code
+    return client
+
+@pytest.fixture(scope='session')
+def student(app):
+    # The busiest student, so per-user pages have real history to read.
+    from sqlalchemy import func
+    from extensions import db
+    from models import QuizAttempt, User
+    
+    with app.app_context():
+        user_id = QuizAttempt.query.with_entities(QuizAttempt.user_id).group_by(QuizAttempt.user_id).order_by(
+            func.count().desc()
+        ).limit(1).scalar()
+        email = db.session.get(User, user_id).email
+    return _client(app, email)
+
+@pytest.fixture(scope='session')
+def admin(app):
+    import datagen
+    
+    return _client(app, datagen.ADMIN_EMAIL)
+
+@pytest.fixture(scope='session')
+def quiz_form(app):
+    # quiz id and the answer fields of its submit form.
+    from models import Question
+    
+    with app.app_context():
+        questions = Question.query.filter_by(quiz_id=1).all()
+        return 1, {f'question_{question.id}': 'A' for question in questions}
+
+def attempt_id(response):
+    return int(re.search(r'/simulados/submit/(\d+)', response.get_data(as_text=True)).group(1))
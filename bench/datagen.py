@@ -0,0 +1,233 @@
+"""Fill the database with a reproducible synthetic catalog, users and history.
+
+Usage:
+    python bench/datagen.py --users 10000 --attempts 1000000 --progress 1000000
+
+Drops and recreates every table in DATABASE_URL (use a throwaway database;
+without DATABASE_URL a temporary SQLite file is used and its URL printed).
+The same --seed always produces the same rows. Every account's password is
+PASSWORD; the admin is ADMIN_EMAIL and students are student<n>@example.com.
+The rollups, score statistics and search index are rebuilt at the end.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'bench123'
+ADMIN_EMAIL = 'admin@example.com'
+BATCH_SIZE = 5000
+# Attempts and progress spread over this many days before now.
+HISTORY_DAYS = 90
+
+DEFAULTS = {
+    'disciplines': 10,
+    'modules': 8,       # per discipline
+    'videos': 12,       # per module
+    'quizzes': 3,       # per module
+    'questions': 40,    # per quiz
+    'materials': 4,     # per module
+    'users': 1000,
+    'attempts': 20000,
+    'progress': 20000,
+    'responses': False,
+}
+
+WORDS = [
+    'cardiologia', 'arritmia', 'fibrilação', 'insuficiência', 'cardíaca', 'pneumonia', 'asma',
+    'diabetes', 'hipertensão', 'sepse', 'choque', 'trauma', 'fratura', 'anemia', 'leucemia',
+    'nefrologia', 'diálise', 'pediatria', 'neonatal', 'obstetrícia', 'gestação', 'pré-eclâmpsia',
+    'cirurgia', 'apendicite', 'colecistite', 'neurologia', 'avc', 'epilepsia', 'cefaleia',
+    'infectologia', 'hiv', 'tuberculose', 'dengue', 'emergência', 'intubação', 'ventilação',
+    'conduta', 'diagnóstico', 'tratamento', 'paciente', 'quadro', 'clínico', 'exame', 'achado',
+]
+OPTIONS = ('A', 'B', 'C', 'D', 'E')
+SEARCH_TERMS = ['sepse', 'fibrilacao', 'insuficiência cardíaca', 'pre-eclampsia', 'tuberculose']
+
+def phrase(rng, size):
+    return ' '.join(rng.choice(WORDS) for _ in range(size)).capitalize()
+
+def _insert(model, rows):
+    from sqlalchemy import insert
+    from extensions import db
+    
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+    db.session.commit()
+
+def _reset_sequences(tables):
+    # Rows were inserted with explicit ids; Postgres sequences must catch up.
+    from sqlalchemy import text
+    from extensions import db
+    
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 0) + 1, false) FROM {table}"
+        ))
+    db.session.commit()
+
+def generate(seed=42, on_progress=None, **sizes):
+    from werkzeug.security import generate_password_hash
+    from commands import init_database
+    from extensions import db
+    from models import (User, Discipline, Module, VideoLesson, Quiz, Question, Material, QuizAttempt,
+                        QuestionResponse, UserProgress)
+    from services import progress, score_stats, search
+    
+    sizes = {**DEFAULTS, **{key: value for key, value in sizes.items() if value is not None}}
+    rng = random.Random(seed)
+    report = on_progress or (lambda step: None)
+    now = datetime.utcnow().replace(microsecond=0)
+    
+    db.drop_all()
+    init_database()
+    
+    password_hash = generate_password_hash(PASSWORD)
+    _insert(User, [{'id': 1, 'username': 'admin', 'email': ADMIN_EMAIL, 'password_hash': password_hash,
+                    'is_admin': True, 'is_approved': True, 'is_active': True, 'created_at': now}] + [
+        {'id': i + 1, 'username': f'student{i}', 'email': f'student{i}@example.com', 'password_hash': password_hash,
+         'is_approved': True, 'is_active': True, 'created_at': now - timedelta(minutes=rng.randrange(HISTORY_DAYS * 1440))}
+        for i in range(1, sizes['users'] + 1)
+    ])
+    report('users')
+    
+    disciplines = sizes['disciplines']
+    modules = disciplines * sizes['modules']
+    _insert(Discipline, [{'id': i, 'name': phrase(rng, 2), 'description': phrase(rng, 8), 'order': i}
+                         for i in range(1, disciplines + 1)])
+    _insert(Module, [{'id': i, 'name': phrase(rng, 3), 'description': phrase(rng, 10),
+                      'discipline_id': 1 + (i - 1) // sizes['modules'], 'order': i} for i in range(1, modules + 1)])
+    
+    videos = modules * sizes['videos']
+    _insert(VideoLesson, (
+        {'id': i, 'title': phrase(rng, 4), 'description': phrase(rng, 25), 'video_url': 'https://youtu.be/abcdefghijk',
+         'video_type': 'youtube', 'duration_minutes': rng.randint(5, 60), 'module_id': 1 + (i - 1) // sizes['videos'],
+         # Repeated orders on purpose: navigation must not depend on them being unique.
+         'order': ((i - 1) % sizes['videos']) // 2, 'created_at': now - timedelta(days=rng.randrange(HISTORY_DAYS))}
+        for i in range(1, videos + 1)
+    ))
+    quizzes = modules * sizes['quizzes']
+    _insert(Quiz, [{'id': i, 'title': phrase(rng, 3), 'description': phrase(rng, 12), 'time_limit_minutes': 60,
+                    'module_id': 1 + (i - 1) // sizes['quizzes'], 'order': i, 'created_at': now}
+                   for i in range(1, quizzes + 1)])
+    answer_keys = {}
+    questions = []
+    for quiz_id in range(1, quizzes + 1):
+        answer_keys[quiz_id] = []
+        for position in range(sizes['questions']):
+            question_id = len(questions) + 1
+            correct = rng.choice(OPTIONS)
+            answer_keys[quiz_id].append((question_id, correct))
+            questions.append({
+                'id': question_id, 'quiz_id': quiz_id, 'text': phrase(rng, 30),
+                **{f'option_{option.lower()}': phrase(rng, 5) for option in OPTIONS},
+                'correct_answer': correct, 'explanation': phrase(rng, 15), 'order': position,
+            })
+    _insert(Question, questions)
+    _insert(Material, [{'id': i, 'title': phrase(rng, 4), 'description': phrase(rng, 20),
+                        'external_url': f'https://example.com/material/{i}', 'module_id': 1 + (i - 1) // sizes['materials'],
+                        'order': i, 'created_at': now} for i in range(1, modules * sizes['materials'] + 1)])
+    report('catalog')
+    
+    responses = []
+    
+    def attempts():
+        for attempt_id in range(1, sizes['attempts'] + 1):
+            quiz_id = rng.randint(1, quizzes)
+            skill = rng.betavariate(4, 3)
+            completed = rng.random() < 0.97
+            picks = [correct if rng.random() < skill else rng.choice(OPTIONS) for _, correct in answer_keys[quiz_id]]
+            correct_count = sum(pick == correct for pick, (_, correct) in zip(picks, answer_keys[quiz_id]))
+            finished = now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+            if completed and sizes['responses']:
+                responses.extend(
+                    {'attempt_id': attempt_id, 'question_id': question_id, 'choice': OPTIONS.index(pick),
+                     'is_correct': pick == correct}
+                    for pick, (question_id, correct) in zip(picks, answer_keys[quiz_id])
+                )
+            yield {
+                'id': attempt_id, 'user_id': rng.randint(2, sizes['users'] + 1), 'quiz_id': quiz_id,
+                'total_questions': len(picks), 'correct_answers': correct_count if completed else 0,
+                'score': correct_count * 100 / len(picks) if completed else 0,
+                'time_spent_seconds': rng.randint(600, 3600) if completed else None, 'completed': completed,
+                'started_at': finished - timedelta(hours=1), 'finished_at': finished if completed else None,
+            }
+    
+    batch = []
+    for row in attempts():
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            _insert(QuizAttempt, batch)
+            _insert(QuestionResponse, responses)
+            batch = []
+            responses.clear()
+    _insert(QuizAttempt, batch)
+    _insert(QuestionResponse, responses)
+    report('attempts')
+    
+    # Distinct (user, video) pairs without keeping a set: pair k is user
+    # k % users and a video offset by the user, wrapping every `users` pairs.
+    users = sizes['users']
+    pairs = min(sizes['progress'], users * videos)
+    
+    def progress_rows():
+        for k in range(pairs):
+            watched = now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+            completed = rng.random() < 0.8
+            yield {
+                'id': k + 1, 'user_id': 2 + k % users, 'video_id': 1 + (k // users + (k % users) * 7) % videos,
+                'completed': completed, 'completed_at': watched if completed else None,
+                'position_seconds': rng.randint(0, 3600),
+                'watched_percent': 100.0 if completed else round(rng.uniform(0, 89), 1), 'last_watched_at': watched,
+            }
+    
+    _insert(UserProgress, progress_rows())
+    report('progress')
+    
+    _reset_sequences(['users', 'disciplines', 'modules', 'video_lessons', 'quizzes', 'questions', 'materials',
+                      'quiz_attempts', 'user_progress'])
+    progress.rebuild_rollups()
+    score_stats.rebuild_statistics()
+    search.rebuild_index()
+    report('derived')
+    return {**sizes, 'seed': seed, 'videos_total': videos, 'quizzes_total': quizzes, 'progress_rows': pairs}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for name, default in DEFAULTS.items():
+        if isinstance(default, bool):
+            parser.add_argument(f'--{name}', action='store_true', help='Also write question_responses (large).')
+        else:
+            parser.add_argument(f'--{name}', type=int, default=default)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    from app import app
+    
+    started = time.perf_counter()
+    with app.app_context():
+        summary = generate(seed=args.seed, on_progress=lambda step: print(
+            f'{step} done after {time.perf_counter() - started:.1f}s', file=sys.stderr
+        ), **{name: getattr(args, name) for name in DEFAULTS})
+    summary['database_url'] = os.environ['DATABASE_URL']
+    summary['seconds'] = round(time.perf_counter() - started, 1)
+    print(json.dumps(summary))
+
+if __name__ == '__main__':
+    main()
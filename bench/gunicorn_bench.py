@@ -0,0 +1,32 @@
+"""gunicorn settings for bench/loadtest.py.
+
+Each worker counts the SQL statements a request runs with
+services.instrumentation.count_queries and returns the count in an
+X-Bench-Queries response header.
+"""
+
+def post_worker_init(worker):
+    from flask import g
+    from services import instrumentation
+    
+    app = worker.wsgi
+    
+    def start_counting():
+        g.bench_counter = instrumentation.count_queries()
+        g.bench_queries = g.bench_counter.__enter__()
+    
+    def add_header(response):
+        queries = g.get('bench_queries')
+        if queries is not None:
+            response.headers['X-Bench-Queries'] = str(len(queries))
+        return response
+    
+    def stop_counting(error):
+        counter = g.pop('bench_counter', None)
+        if counter is not None:
+            counter.__exit__(None, None, None)
+    
+    # First, so queries made by the other before_request hooks count too.
+    app.before_request_funcs.setdefault(None, []).insert(0, start_counting)
+    app.after_request(add_header)
+    app.teardown_request(stop_counting)
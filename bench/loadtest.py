@@ -0,0 +1,213 @@
+"""Exam night: many students take and submit the same quiz at the same time.
+
+Usage:
+    python bench/loadtest.py --students 500 --clients 8 --workers 4
+
+Starts gunicorn (app:app, bench/gunicorn_bench.py) on a local port. Then
+--clients processes each log in their share of student<n>@example.com. After
+a barrier, every student runs take -> submit --rounds times. The output is
+one JSON object with p50/p95/p99 latency, error count and SQL queries per
+request for each endpoint, plus the overall throughput.
+
+Runs against DATABASE_URL when set, which must already hold a bench/datagen.py
+dataset (or pass --generate). Without DATABASE_URL, a temporary SQLite file
+is generated.
+"""
+import argparse
+import http.cookiejar
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CSRF_RE = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+SUBMIT_RE = re.compile(r'/simulados/submit/(\d+)')
+QUESTION_RE = re.compile(r'name="(question_\d+)"')
+VERSION_RE = re.compile(r'name="quiz_version"[^>]*value="([^"]*)"')
+OPTIONS = ('A', 'B', 'C', 'D', 'E')
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Time each endpoint alone, not the page it redirects to.
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class Student:
+    def __init__(self, base_url, email, password, samples):
+        self.base_url = base_url
+        self.email = email
+        self.password = password
+        self.samples = samples
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect()
+        )
+    
+    def request(self, endpoint, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        try:
+            response = self.opener.open(self.base_url + path, body, timeout=60)
+        except urllib.error.HTTPError as error:
+            response = error
+        except OSError:
+            self.samples.append((endpoint, time.perf_counter() - started, 0, None))
+            return 0, ''
+        text = response.read().decode('utf-8', 'replace')
+        queries = response.headers.get('X-Bench-Queries')
+        self.samples.append((endpoint, time.perf_counter() - started, response.status,
+                             int(queries) if queries is not None else None))
+        return response.status, text
+    
+    def login(self):
+        _, page = self.request('login_form', '/login')
+        token = CSRF_RE.search(page)
+        status, _ = self.request('login', '/login', {
+            'email': self.email, 'password': self.password, 'csrf_token': token.group(1) if token else '',
+        })
+        return status == 302
+    
+    def exam(self, quiz_id, rng, think):
+        status, page = self.request('take', f'/simulados/take/{quiz_id}')
+        attempt = SUBMIT_RE.search(page)
+        if status != 200 or attempt is None:
+            return
+        if think:
+            time.sleep(rng.uniform(0, think))
+        form = {name: rng.choice(OPTIONS) for name in set(QUESTION_RE.findall(page))}
+        token = CSRF_RE.search(page)
+        version = VERSION_RE.search(page)
+        form.update(csrf_token=token.group(1) if token else '', quiz_version=version.group(1) if version else '',
+                    time_spent=str(rng.randint(600, 3600)))
+        self.request('submit', f'/simulados/submit/{attempt.group(1)}', form)
+
+def client(index, args, base_url, barrier, results):
+    import datagen
+    
+    rng = random.Random(args.seed * 1000 + index)
+    samples = []
+    students = [
+        Student(base_url, f'student{n}@example.com', datagen.PASSWORD, samples)
+        for n in range(1 + index, args.students + 1, args.clients)
+    ]
+    students = [student for student in students if student.login()]
+    barrier.wait()
+    for _ in range(args.rounds):
+        for student in students:
+            student.exam(args.quiz_id, rng, args.think)
+    results.put(samples)
+
+def percentiles(values):
+    if len(values) < 2:
+        value = round(values[0] * 1000, 1) if values else None
+        return {'p50_ms': value, 'p95_ms': value, 'p99_ms': value}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50_ms': round(cuts[49] * 1000, 1), 'p95_ms': round(cuts[94] * 1000, 1), 'p99_ms': round(cuts[98] * 1000, 1)}
+
+def summarize(samples):
+    endpoints = {}
+    for endpoint in sorted({sample[0] for sample in samples}):
+        rows = [sample for sample in samples if sample[0] == endpoint]
+        queries = [sample[3] for sample in rows if sample[3] is not None]
+        endpoints[endpoint] = {
+            'requests': len(rows),
+            'errors': sum(1 for sample in rows if not sample[2] or sample[2] >= 500),
+            **percentiles([sample[1] for sample in rows]),
+            'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+        }
+    return endpoints
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(args, env):
+    port = args.port or free_port()
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--workers', str(args.workers), '--threads', str(args.threads),
+        '--bind', f'127.0.0.1:{port}', '--config', os.path.join(ROOT, 'bench', 'gunicorn_bench.py'),
+        '--log-level', 'warning',
+    ], cwd=ROOT, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=1).read()
+            return server, base_url
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit('gunicorn did not start')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=1, help='take + submit cycles per student.')
+    parser.add_argument('--quiz-id', type=int, default=1)
+    parser.add_argument('--think', type=float, default=0, help='Max seconds a student spends between take and submit.')
+    parser.add_argument('--clients', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers.')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker.')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--generate', action='store_true', help='Seed DATABASE_URL with bench/datagen.py first.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    if not os.environ.get('DATABASE_URL'):
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_load.db')
+        args.generate = True
+    if args.generate:
+        import datagen
+        from app import app
+        
+        with app.app_context():
+            datagen.generate(seed=args.seed, users=max(args.students, datagen.DEFAULTS['users']))
+    
+    server, base_url = start_server(args, dict(os.environ))
+    try:
+        barrier = multiprocessing.Barrier(args.clients + 1)
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(index, args, base_url, barrier, results))
+                   for index in range(args.clients)]
+        for process in clients:
+            process.start()
+        barrier.wait()
+        started = time.perf_counter()
+        samples = [sample for _ in clients for sample in results.get()]
+        elapsed = time.perf_counter() - started
+        for process in clients:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait()
+    
+    exam = [sample for sample in samples if sample[0] in ('take', 'submit')]
+    print(json.dumps({
+        'dialect': os.environ['DATABASE_URL'].split(':', 1)[0].split('+', 1)[0],
+        'students': args.students,
+        'rounds': args.rounds,
+        'clients': args.clients,
+        'workers': args.workers,
+        'threads': args.threads,
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(len(exam) / elapsed, 1) if elapsed else None,
+        'endpoints': summarize(samples),
+    }))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import click
+from flask.cli import with_appcontext
+
+def register_commands(app):
+    app.cli.add_command(init_db)
+    app.cli.add_command(create_admin)
+    app.cli.add_command(templates_compile)
+    app.cli.add_command(assets_build)
+    app.cli.add_command(search_reindex)
+    app.cli.add_command(progress_rebuild)
+    app.cli.add_command(stats_rebuild)
+    app.cli.add_command(quiz_regrade)
+    app.cli.add_command(responses_backfill)
+    app.cli.add_command(storage_import)
+    app.cli.add_command(storage_gc)
+    app.cli.add_command(materials_extract)
+
+def init_database():
+    # Idempotent: create_all() and the ensure_* helpers only add what is missing.
+    from extensions import db
+    from services import storage, extraction, search, heartbeats, progress, attempt_stats, pagination, score_stats
+    
+    db.create_all()
+    storage.ensure_storage()
+    extraction.ensure_extraction()
+    search.ensure_search_index()
+    heartbeats.ensure_heartbeats()
+    progress.ensure_progress_rollups()
+    attempt_stats.ensure_attempt_indexes()
+    pagination.ensure_listing_indexes()
+    score_stats.ensure_score_statistics()
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Create missing tables, columns and indexes. Safe to run on every deploy."""
+    init_database()
+    click.echo('Database schema up to date.')
+
+@click.command('create-admin')
+@click.option('--email', default='admin@nerdsplantao.com', show_default=True)
+@click.option('--username', default='admin', show_default=True)
+@click.password_option()
+@with_appcontext
+def create_admin(email, username, password):
+    """Create an approved admin account, or promote an existing one and reset its password."""
+    from werkzeug.security import generate_password_hash
+    from extensions import db
+    from models import User
+    
+    admin = User.query.filter_by(email=email).first()
+    if admin is None:
+        if User.query.filter_by(username=username).first() is not None:
+            raise click.ClickException(f'Username {username} is taken.')
+        admin = User(username=username, email=email)
+        db.session.add(admin)
+    admin.password_hash = generate_password_hash(password)
+    admin.is_admin = admin.is_approved = admin.is_active = True
+    db.session.commit()
+    click.echo(f'Admin ready: {email}')
+
+@click.command('templates-compile')
+@with_appcontext
+def templates_compile():
+    """Compile every template into TEMPLATE_CACHE_DIR, so workers skip parsing them."""
+    from flask import current_app
+    
+    env = current_app.jinja_env
+    if env.bytecode_cache is None:
+        raise click.ClickException('TEMPLATE_CACHE_DIR is not set.')
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    click.echo(f'{len(names)} templates compiled.')
+
+@click.command('assets-build')
+@with_appcontext
+def assets_build():
+    """Write content-hashed, precompressed copies of static/ into static/dist and its manifest."""
+    from flask import current_app
+    from services import assets
+    
+    manifest, with_brotli = assets.build(current_app.static_folder)
+    click.echo(f'{len(manifest)} static files built.')
+    if not with_brotli:
+        click.echo('Brotli is not installed: only .gz variants were written.')
+    click.echo('Reload the workers to serve the new manifest.')
+
+@click.command('search-reindex')
+@with_appcontext
+def search_reindex():
+    """Rebuild the full-text search index from the content tables."""
+    from services import search
+    
+    search.rebuild_index()
+    click.echo('Search index rebuilt.')
+
+@click.command('progress-rebuild')
+@with_appcontext
+def progress_rebuild():
+    """Recompute the per-user and per-module progress rollups from user_progress."""
+    from services import progress
+    
+    progress.rebuild_rollups()
+    click.echo('Progress rollups rebuilt.')
+
+@click.command('stats-rebuild')
+@with_appcontext
+def stats_rebuild():
+    """Recompute the quiz score statistics (global, discipline, quiz, day) from quiz_attempts."""
+    from services import score_stats
+    
+    score_stats.rebuild_statistics()
+    click.echo('Score statistics rebuilt.')
+
+@click.command('quiz-regrade')
+@click.argument('quiz_id', type=int)
+@click.option('--apply', is_flag=True, help='Write the new scores; without it only the score deltas are reported.')
+@click.option('--chunk-size', default=2000, show_default=True, help='Attempts graded per batch.')
+@with_appcontext
+def quiz_regrade(quiz_id, apply, chunk_size):
+    """Re-grade every completed attempt of a quiz against its current answer key."""
+    import json
+    from models import Quiz, RegradeJob
+    from extensions import db
+    from services import regrade
+    
+    if db.session.get(Quiz, quiz_id) is None:
+        raise click.ClickException(f'Quiz {quiz_id} not found.')
+    if regrade.active_job(quiz_id) is not None:
+        raise click.ClickException('A regrade job is already running for this quiz.')
+    job = RegradeJob(quiz_id=quiz_id, dry_run=not apply)
+    db.session.add(job)
+    db.session.commit()
+    
+    job = regrade.run_job(job.id, chunk_size=chunk_size, on_progress=lambda job: click.echo(
+        f'{job.processed}/{job.total_attempts} attempts, {job.changed} changed'
+    ))
+    if job.status == 'failed':
+        raise click.ClickException(job.error)
+    click.echo(json.dumps(json.loads(job.summary) if job.summary else {}, indent=2))
+    click.echo('Scores updated.' if apply else 'Dry run, nothing written.')
+
+@click.command('responses-backfill')
+@click.option('--batch-size', default=2000, show_default=True, help='Attempts moved per transaction.')
+@with_appcontext
+def responses_backfill(batch_size):
+    """Move the legacy quiz_attempts.answers JSON into question_responses."""
+    from services import responses
+    
+    migrated, skipped = responses.backfill(batch_size=batch_size, on_progress=lambda migrated: click.echo(f'{migrated} attempts moved'))
+    click.echo(f'Backfill finished: {migrated} attempts.')
+    if skipped:
+        click.echo(f'{skipped} attempts no longer match their stored score under the current answer key and kept '
+                   'their JSON answers; run quiz-regrade --apply on their quizzes, then backfill again.')
+
+@click.command('storage-import')
+@with_appcontext
+def storage_import():
+    """Move material files saved by name in UPLOAD_FOLDER into the content-addressed store."""
+    from services import storage
+    
+    imported = storage.import_legacy_files()
+    click.echo(f'{imported} files moved into the store.')
+
+@click.command('storage-gc')
+@with_appcontext
+def storage_gc():
+    """Delete abandoned uploads and stored files no material references any more."""
+    from services import storage, uploads
+    
+    dropped = uploads.collect_stale()
+    removed = storage.collect_orphans()
+    click.echo(f'{dropped} abandoned uploads dropped, {removed} unreferenced files removed.')
+
+@click.command('materials-extract')
+@click.option('--force', is_flag=True, help='Redo files already extracted by the current version.')
+@with_appcontext
+def materials_extract(force):
+    """Extract page count, thumbnail and text for every material file and link."""
+    from models import ContentExtract
+    from services import extraction
+    
+    extraction.extract_all(force=force)
+    extraction.wait_for_running()
+    done = ContentExtract.query.filter_by(status='done').count()
+    failed = ContentExtract.query.filter_by(status='failed').count()
+    click.echo(f'Extraction finished: {done} done, {failed} failed.')
@@ -1,8 +1,10 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, PasswordField, TextAreaField, IntegerField, SelectField, BooleanField, SubmitField
+from wtforms import StringField, PasswordField, TextAreaField, IntegerField, SelectField, BooleanField, SubmitField, HiddenField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, ValidationError, NumberRange
 
+DOCUMENT_EXTENSIONS = ['pdf', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx']
+
 class LoginForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Senha', validators=[DataRequired()])
@@ -42,7 +44,8 @@ class VideoLessonForm(FlaskForm):
 class MaterialForm(FlaskForm):
     title = StringField('Título', validators=[DataRequired(), Length(max=200)])
     description = TextAreaField('Descrição', validators=[Optional()])
-    file = FileField('Arquivo (PDF, DOC, etc)', validators=[FileAllowed(['pdf', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx'], 'Apenas documentos são permitidos!')])
+    file = FileField('Arquivo (PDF, DOC, etc)', validators=[FileAllowed(DOCUMENT_EXTENSIONS, 'Apenas documentos são permitidos!')])
+    upload_id = HiddenField(validators=[Optional(), Length(max=32)])
     external_url = StringField('URL Externa (opcional)', validators=[Optional(), Length(max=500)])
     module_id = SelectField('Módulo', coerce=int, validators=[DataRequired()])
     order = IntegerField('Ordem', validators=[Optional()], default=0)
@@ -0,0 +1,18 @@
+# Loaded automatically by `gunicorn app:app` from the project directory.
+import os
+import shutil
+import tempfile
+
+# Workers share their Prometheus samples through mmap'd files here
+# (services/metrics.py); it must exist, empty, before the app is imported.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'nerds-metrics'))
+
+def on_starting(server):
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,5 +1,6 @@
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from extensions import db
 
 class User(UserMixin, db.Model):
@@ -16,13 +17,18 @@ class User(UserMixin, db.Model):
     
     progress = db.relationship('UserProgress', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     quiz_attempts = db.relationship('QuizAttempt', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    progress_summary = db.relationship('UserProgressSummary', uselist=False, cascade='all, delete-orphan')
+    module_progress = db.relationship('ModuleProgressSummary', lazy='dynamic', cascade='all, delete-orphan')
     
-    def get_progress_percentage(self):
-        total_videos = VideoLesson.query.count()
+    __table_args__ = (db.Index('ix_users_created_at', 'created_at', 'id'),)
+    
+    def get_progress_percentage(self, total_videos=None):
+        if total_videos is None:
+            total_videos = VideoLesson.query.count()
         if total_videos == 0:
             return 0
-        completed = UserProgress.query.filter_by(user_id=self.id, completed=True).count()
-        return int((completed / total_videos) * 100)
+        completed = self.progress_summary.completed_videos if self.progress_summary else 0
+        return min(100, int((completed / total_videos) * 100))
 
 class Discipline(db.Model):
     __tablename__ = 'disciplines'
@@ -72,9 +78,31 @@ class UserProgress(db.Model):
     video_id = db.Column(db.Integer, db.ForeignKey('video_lessons.id'), nullable=False)
     completed = db.Column(db.Boolean, default=False)
     completed_at = db.Column(db.DateTime)
+    # Written by services/heartbeats.py from the player; percent is the furthest point reached.
+    position_seconds = db.Column(db.Integer)
+    watched_percent = db.Column(db.Float)
+    last_watched_at = db.Column(db.DateTime)
     
     __table_args__ = (db.UniqueConstraint('user_id', 'video_id', name='unique_user_video'),)
 
+class UserProgressSummary(db.Model):
+    __tablename__ = 'user_progress_summaries'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    completed_videos = db.Column(db.Integer, nullable=False, default=0)
+
+class ModuleProgressSummary(db.Model):
+    __tablename__ = 'module_progress_summaries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Rollup keys, not foreign keys: rows are recomputed when modules move or disappear.
+    discipline_id = db.Column(db.Integer, nullable=False, index=True)
+    module_id = db.Column(db.Integer, nullable=False, index=True)
+    completed_videos = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'module_id', name='unique_user_module_progress'),)
+
 class Material(db.Model):
     __tablename__ = 'materials'
     
@@ -87,6 +115,15 @@ class Material(db.Model):
     module_id = db.Column(db.Integer, db.ForeignKey('modules.id'), nullable=False)
     order = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Content lives in the hash store; file_path keeps the uploaded name.
+    # Materials uploaded before the store have no stored_file.
+    stored_file_id = db.Column(db.Integer, db.ForeignKey('stored_files.id'))
+    # Key of the extracted preview/text: the file's SHA-256, or the URL's.
+    content_key = db.Column(db.String(64), index=True)
+    
+    stored_file = db.relationship('StoredFile')
+    extract = db.relationship('ContentExtract', primaryjoin='foreign(Material.content_key) == ContentExtract.key',
+                              viewonly=True, uselist=False)
 
 class Quiz(db.Model):
     __tablename__ = 'quizzes'
@@ -101,6 +138,9 @@ class Quiz(db.Model):
     
     questions = db.relationship('Question', backref='quiz', lazy='dynamic', cascade='all, delete-orphan', order_by='Question.order')
     attempts = db.relationship('QuizAttempt', backref='quiz', lazy='dynamic', cascade='all, delete-orphan')
+    regrade_jobs = db.relationship('RegradeJob', backref='quiz', lazy='dynamic', cascade='all, delete-orphan')
+    item_analysis = db.relationship('ItemAnalysisState', uselist=False, cascade='all, delete-orphan')
+    item_statistics = db.relationship('ItemOptionStatistic', lazy='dynamic', cascade='all, delete-orphan')
 
 class Question(db.Model):
     __tablename__ = 'questions'
@@ -130,4 +170,177 @@ class QuizAttempt(db.Model):
     completed = db.Column(db.Boolean, default=False)
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     finished_at = db.Column(db.DateTime)
-    answers = db.Column(db.Text)
+    answers = db.Column(db.Text)  # legacy JSON, emptied by `flask responses-backfill`
+    
+    responses = db.relationship('QuestionResponse', lazy='dynamic', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_quiz_attempts_user_quiz', 'user_id', 'quiz_id', 'completed'),
+        db.Index('ix_quiz_attempts_quiz_id', 'quiz_id', 'id'),
+        db.Index('ix_quiz_attempts_quiz_finished', 'quiz_id', 'finished_at'),
+        db.Index('ix_quiz_attempts_user_finished', 'user_id', 'completed', 'finished_at', 'id'),
+    )
+
+class QuestionResponse(db.Model):
+    __tablename__ = 'question_responses'
+    
+    attempt_id = db.Column(db.Integer, db.ForeignKey('quiz_attempts.id'), primary_key=True)
+    # Plain id: responses outlive edits to the quiz, like the answers they replace.
+    question_id = db.Column(db.Integer, primary_key=True)
+    choice = db.Column(db.SmallInteger)  # 0-4 for A-E, NULL when left blank
+    is_correct = db.Column(db.Boolean, nullable=False, default=False)
+    
+    __table_args__ = (
+        db.Index('ix_question_responses_question_choice', 'question_id', 'choice'),
+        {'sqlite_with_rowid': False},
+    )
+
+class SearchDocument(db.Model):
+    __tablename__ = 'search_documents'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doc_type = db.Column(db.String(20), nullable=False)
+    doc_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text)
+    # Weighted title + body, written by services/search.py on Postgres and
+    # GIN-indexed; unused (NULL) on SQLite, which indexes through FTS5.
+    search_vector = db.deferred(db.Column(db.Text().with_variant(TSVECTOR(), 'postgresql')))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('doc_type', 'doc_id', name='unique_search_document'),)
+
+class ScoreStatistic(db.Model):
+    __tablename__ = 'score_statistics'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # scope is 'global', 'discipline', 'quiz' or 'day'; scope_key is the id or ISO date ('' for global).
+    scope = db.Column(db.String(20), nullable=False)
+    scope_key = db.Column(db.String(20), nullable=False, default='')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0)
+    time_sum = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.UniqueConstraint('scope', 'scope_key', name='unique_score_statistic'),)
+    
+    @property
+    def avg_score(self):
+        return self.score_sum / self.attempts if self.attempts else 0
+
+class ScoreDistribution(db.Model):
+    __tablename__ = 'score_distributions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(20), nullable=False)
+    scope_key = db.Column(db.String(20), nullable=False, default='')
+    bucket = db.Column(db.Integer, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.UniqueConstraint('scope', 'scope_key', 'bucket', name='unique_score_distribution'),)
+
+class CacheGeneration(db.Model):
+    __tablename__ = 'cache_generations'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+class RegradeJob(db.Model):
+    __tablename__ = 'regrade_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False, index=True)
+    dry_run = db.Column(db.Boolean, default=True)
+    status = db.Column(db.String(20), default='pending')  # pending, running, done, failed
+    total_attempts = db.Column(db.Integer, default=0)
+    processed = db.Column(db.Integer, default=0)
+    changed = db.Column(db.Integer, default=0)
+    summary = db.Column(db.Text)  # JSON: score deltas of the run
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    @property
+    def progress_percentage(self):
+        if not self.total_attempts:
+            return 100 if self.status == 'done' else 0
+        return min(100, int(self.processed * 100 / self.total_attempts))
+    
+    @property
+    def is_active(self):
+        return self.status in ('pending', 'running')
+
+class ItemAnalysisState(db.Model):
+    __tablename__ = 'item_analysis_states'
+    
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), primary_key=True)
+    version = db.Column(db.String(16), nullable=False)  # CompiledQuiz.version the sums were graded with
+    last_finished_at = db.Column(db.DateTime)
+    last_attempt_id = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    total_sum = db.Column(db.Float, nullable=False, default=0)
+    total_sq_sum = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+class ItemOptionStatistic(db.Model):
+    __tablename__ = 'item_option_statistics'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quizzes.id'), nullable=False)
+    question_id = db.Column(db.Integer, nullable=False)
+    choice = db.Column(db.SmallInteger, nullable=False)  # 0-4 for A-E, -1 for blank
+    responses = db.Column(db.Integer, nullable=False, default=0)
+    total_sum = db.Column(db.Float, nullable=False, default=0)  # sum of the attempts' correct counts
+    
+    __table_args__ = (db.UniqueConstraint('quiz_id', 'question_id', 'choice'),)
+
+class StoredFile(db.Model):
+    __tablename__ = 'stored_files'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # When ref_count last dropped to zero; NULL while the file is in use.
+    unreferenced_since = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def path(self):
+        return self.path_for(self.sha256)
+    
+    @staticmethod
+    def path_for(sha256):
+        # Two levels of 256-way sharding keep directories small.
+        return f'{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+class MaterialUpload(db.Model):
+    __tablename__ = 'material_uploads'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    # Set once every byte has arrived and been hashed.
+    sha256 = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def is_complete(self):
+        return self.sha256 is not None
+
+class ContentExtract(db.Model):
+    __tablename__ = 'content_extracts'
+    
+    key = db.Column(db.String(64), primary_key=True)
+    source = db.Column(db.String(10), nullable=False)  # file, url
+    version = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, done, failed
+    page_count = db.Column(db.Integer)
+    has_thumbnail = db.Column(db.Boolean, default=False)
+    text = db.Column(db.Text)
+    error = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1,14 +1,62 @@
 import os
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+import json
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, abort, Response
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from functools import wraps
 from extensions import db
-from models import User, Discipline, Module, VideoLesson, Material, Quiz, Question, QuizAttempt, UserProgress
-from forms import DisciplineForm, ModuleForm, VideoLessonForm, MaterialForm, QuizForm, QuestionForm, UserStatusForm
+from models import User, Discipline, Module, VideoLesson, Material, Quiz, Question, QuizAttempt, UserProgress, RegradeJob
+from forms import DisciplineForm, ModuleForm, VideoLessonForm, MaterialForm, QuizForm, QuestionForm, UserStatusForm, DOCUMENT_EXTENSIONS
+from sqlalchemy import func
+from sqlalchemy.orm import contains_eager
+from services import score_stats, user_cache, quiz_cache, storage, uploads, heartbeats, instrumentation, profiling, fragment_cache
+from services.pagination import Sort, paginate
+from services.catalog import get_catalog
 
 admin_bp = Blueprint('admin', __name__)
 
+USER_FILTERS = {
+    'pending': (User.is_approved.is_(False),),
+    'active': (User.is_approved.is_(True), User.is_active.is_(True)),
+    'inactive': (User.is_active.is_(False),),
+    'admins': (User.is_admin.is_(True),),
+}
+
+USER_SORTS = {
+    'recentes': Sort('Mais recentes', User.created_at.desc(), User.id.desc()),
+    'antigos': Sort('Mais antigos', User.created_at, User.id),
+    'nome': Sort('Nome', User.username, User.id),
+}
+
+MODULE_SORTS = {
+    'curso': Sort('Ordem do curso', func.coalesce(Discipline.order, 0), Discipline.id, func.coalesce(Module.order, 0), Module.name, Module.id),
+    'nome': Sort('Nome', Module.name, Module.id),
+}
+
+def _content_sorts(model):
+    return {
+        'curso': Sort('Ordem do curso', func.coalesce(Discipline.order, 0), Discipline.id, func.coalesce(Module.order, 0),
+                      Module.id, func.coalesce(model.order, 0), model.title, model.id),
+        'titulo': Sort('Título', model.title, model.id),
+        'recentes': Sort('Mais recentes', model.created_at.desc(), model.id.desc()),
+    }
+
+VIDEO_SORTS = _content_sorts(VideoLesson)
+MATERIAL_SORTS = _content_sorts(Material)
+QUIZ_SORTS = _content_sorts(Quiz)
+
+def _content_page(model, sorts):
+    query = model.query.join(model.module).join(Module.discipline).options(
+        contains_eager(model.module).contains_eager(Module.discipline)
+    )
+    module_id = request.args.get('module_id', type=int)
+    if module_id:
+        query = query.filter(model.module_id == module_id)
+    search = request.args.get('q', '').strip()
+    if search:
+        query = query.filter(model.title.ilike(f'%{search}%'))
+    return paginate(query, sorts)
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -24,16 +72,22 @@ def admin_required(f):
 def index():
     total_users = User.query.count()
     pending_users = User.query.filter_by(is_approved=False).count()
-    total_videos = VideoLesson.query.count()
-    total_quizzes = Quiz.query.count()
-    total_materials = Material.query.count()
+    catalog = get_catalog()
+    total_videos = catalog.total_videos
+    total_quizzes = catalog.total_quizzes
+    total_materials = catalog.total_materials
     
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
     
-    quiz_attempts = QuizAttempt.query.filter_by(completed=True).all()
-    avg_score = 0
-    if quiz_attempts:
-        avg_score = sum(a.score for a in quiz_attempts) / len(quiz_attempts)
+    global_statistic = score_stats.global_statistic()
+    avg_score = global_statistic.avg_score if global_statistic else 0
+    total_attempts = global_statistic.attempts if global_statistic else 0
+    
+    daily_statistics = score_stats.daily_statistics(days=30)
+    max_daily_attempts = max([row.attempts for _, row in daily_statistics if row] or [0])
+    score_distribution = score_stats.score_distribution()
+    max_bucket = max(score_distribution) if score_distribution else 0
+    discipline_statistics = score_stats.discipline_statistics()
     
     return render_template('admin/index.html',
                          total_users=total_users,
@@ -42,7 +96,90 @@ def index():
                          total_quizzes=total_quizzes,
                          total_materials=total_materials,
                          recent_users=recent_users,
-                         avg_score=avg_score)
+                         avg_score=avg_score,
+                         total_attempts=total_attempts,
+                         daily_statistics=daily_statistics,
+                         max_daily_attempts=max_daily_attempts,
+                         score_distribution=score_distribution,
+                         max_bucket=max_bucket,
+                         discipline_statistics=discipline_statistics)
+
+@admin_bp.route('/cache-stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify({
+        'user_cache': user_cache.stats(),
+        'quiz_cache': quiz_cache.stats(),
+        'heartbeats': heartbeats.queue.stats(),
+        'fragments': fragment_cache.stats(),
+        'catalog_generation': get_catalog().generation,
+    })
+
+@admin_bp.route('/sql-stats')
+@login_required
+@admin_required
+def sql_stats():
+    sort = request.args.get('sort', 'total_ms')
+    if sort not in instrumentation.SORTS:
+        sort = 'total_ms'
+    return render_template('admin/sql_stats.html',
+                         enabled=instrumentation.enabled(current_app),
+                         endpoints=instrumentation.endpoints.report(sort)[:50],
+                         sorts=instrumentation.SORTS,
+                         sort=sort,
+                         threshold=current_app.config['SQL_REPEAT_THRESHOLD'])
+
+@admin_bp.route('/sql-stats/reset', methods=['POST'])
+@login_required
+@admin_required
+def reset_sql_stats():
+    instrumentation.endpoints.clear()
+    flash('Estatísticas SQL deste processo zeradas.', 'success')
+    return redirect(url_for('admin.sql_stats'))
+
+@admin_bp.route('/profiles')
+@login_required
+@admin_required
+def profiles():
+    captured = profiling.list_profiles(current_app.config['PROFILE_DIR'])
+    endpoints = {}
+    for profile in captured:
+        summary = endpoints.setdefault(profile['endpoint'], {'endpoint': profile['endpoint'], 'count': 0, 'max_ms': 0})
+        summary['count'] += 1
+        summary['max_ms'] = max(summary['max_ms'], profile['duration_ms'])
+    endpoint = request.args.get('route')
+    if endpoint:
+        captured = [profile for profile in captured if profile['endpoint'] == endpoint]
+    return render_template('admin/profiles.html',
+                         enabled=profiling.enabled(current_app),
+                         endpoints=sorted(endpoints.values(), key=lambda summary: -summary['max_ms']),
+                         profiles=captured,
+                         endpoint=endpoint,
+                         reasons=profiling.REASONS)
+
+@admin_bp.route('/profiles/<name>/<kind>')
+@login_required
+@admin_required
+def download_profile(name, kind):
+    if kind not in ('speedscope', 'pstats'):
+        abort(404)
+    profile = profiling.load(current_app.config['PROFILE_DIR'], name)
+    if profile is None:
+        abort(404)
+    if kind == 'speedscope':
+        body, mimetype, filename = json.dumps(profiling.to_speedscope(profile)), 'application/json', f'{name}.speedscope.json'
+    else:
+        body, mimetype, filename = profiling.to_pstats(profile), 'application/octet-stream', f'{name}.pstats'
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@admin_bp.route('/profiles/clear', methods=['POST'])
+@login_required
+@admin_required
+def clear_profiles():
+    profiling.clear(current_app.config['PROFILE_DIR'])
+    flash('Perfis apagados.', 'success')
+    return redirect(url_for('admin.profiles'))
 
 @admin_bp.route('/users')
 @login_required
@@ -50,16 +187,11 @@ def index():
 def users():
     filter_type = request.args.get('filter', 'all')
     
-    if filter_type == 'pending':
-        users = User.query.filter_by(is_approved=False).order_by(User.created_at.desc()).all()
-    elif filter_type == 'active':
-        users = User.query.filter_by(is_approved=True, is_active=True).order_by(User.created_at.desc()).all()
-    elif filter_type == 'inactive':
-        users = User.query.filter_by(is_active=False).order_by(User.created_at.desc()).all()
-    elif filter_type == 'admins':
-        users = User.query.filter_by(is_admin=True).order_by(User.created_at.desc()).all()
-    else:
-        users = User.query.order_by(User.created_at.desc()).all()
+    query = User.query.filter(*USER_FILTERS.get(filter_type, ()))
+    search = request.args.get('q', '').strip()
+    if search:
+        query = query.filter(db.or_(User.username.ilike(f'%{search}%'), User.email.ilike(f'%{search}%')))
+    users = paginate(query, USER_SORTS)
     
     return render_template('admin/users.html', users=users, filter_type=filter_type)
 
@@ -70,6 +202,7 @@ def approve_user(user_id):
     user = User.query.get_or_404(user_id)
     user.is_approved = True
     db.session.commit()
+    user_cache.invalidate(user_id)
     flash(f'Usuário {user.username} aprovado com sucesso!', 'success')
     return redirect(url_for('admin.users', filter='pending'))
 
@@ -80,6 +213,7 @@ def reject_user(user_id):
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user_id)
     flash(f'Cadastro de {user.username} rejeitado e removido.', 'info')
     return redirect(url_for('admin.users', filter='pending'))
 
@@ -94,6 +228,7 @@ def toggle_user_status(user_id):
     
     user.is_active = not user.is_active
     db.session.commit()
+    user_cache.invalidate(user_id)
     status = 'ativado' if user.is_active else 'desativado'
     flash(f'Usuário {user.username} {status}.', 'success')
     return redirect(url_for('admin.users'))
@@ -109,6 +244,7 @@ def toggle_user_admin(user_id):
     
     user.is_admin = not user.is_admin
     db.session.commit()
+    user_cache.invalidate(user_id)
     status = 'promovido a administrador' if user.is_admin else 'rebaixado para usuário comum'
     flash(f'Usuário {user.username} {status}.', 'success')
     return redirect(url_for('admin.users'))
@@ -125,6 +261,7 @@ def delete_user(user_id):
     username = user.username
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user_id)
     flash(f'Usuário {username} excluído.', 'success')
     return redirect(url_for('admin.users'))
 
@@ -132,7 +269,7 @@ def delete_user(user_id):
 @login_required
 @admin_required
 def disciplines():
-    disciplines = Discipline.query.order_by(Discipline.order, Discipline.name).all()
+    disciplines = get_catalog().disciplines
     return render_template('admin/disciplines.html', disciplines=disciplines)
 
 @admin_bp.route('/disciplines/new', methods=['GET', 'POST'])
@@ -181,15 +318,25 @@ def delete_discipline(id):
 @login_required
 @admin_required
 def modules():
-    modules = Module.query.join(Discipline).order_by(Discipline.order, Module.order, Module.name).all()
-    return render_template('admin/modules.html', modules=modules)
+    catalog = get_catalog()
+    query = Module.query.join(Module.discipline)
+    discipline_id = request.args.get('discipline_id', type=int)
+    if discipline_id:
+        query = query.filter(Module.discipline_id == discipline_id)
+    search = request.args.get('q', '').strip()
+    if search:
+        query = query.filter(Module.name.ilike(f'%{search}%'))
+    page = paginate(query, MODULE_SORTS)
+    # Content counts come from the cached catalog rather than per-row queries.
+    modules = [catalog.get_module(module.id) for module in page if catalog.get_module(module.id)]
+    return render_template('admin/modules.html', modules=modules, page=page, disciplines=catalog.disciplines)
 
 @admin_bp.route('/modules/new', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def new_module():
     form = ModuleForm()
-    form.discipline_id.choices = [(d.id, d.name) for d in Discipline.query.order_by(Discipline.order, Discipline.name).all()]
+    form.discipline_id.choices = get_catalog().discipline_choices()
     
     if form.validate_on_submit():
         module = Module(
@@ -210,7 +357,7 @@ def new_module():
 def edit_module(id):
     module = Module.query.get_or_404(id)
     form = ModuleForm(obj=module)
-    form.discipline_id.choices = [(d.id, d.name) for d in Discipline.query.order_by(Discipline.order, Discipline.name).all()]
+    form.discipline_id.choices = get_catalog().discipline_choices()
     
     if form.validate_on_submit():
         module.name = form.name.data
@@ -236,17 +383,15 @@ def delete_module(id):
 @login_required
 @admin_required
 def videos():
-    videos = VideoLesson.query.join(Module).join(Discipline).order_by(
-        Discipline.order, Module.order, VideoLesson.order, VideoLesson.title
-    ).all()
-    return render_template('admin/videos.html', videos=videos)
+    videos = _content_page(VideoLesson, VIDEO_SORTS)
+    return render_template('admin/videos.html', videos=videos, modules=get_catalog().module_choices())
 
 @admin_bp.route('/videos/new', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def new_video():
     form = VideoLessonForm()
-    form.module_id.choices = [(m.id, f'{m.discipline.name} - {m.name}') for m in Module.query.join(Discipline).order_by(Discipline.order, Module.order).all()]
+    form.module_id.choices = get_catalog().module_choices()
     
     if form.validate_on_submit():
         video = VideoLesson(
@@ -270,7 +415,7 @@ def new_video():
 def edit_video(id):
     video = VideoLesson.query.get_or_404(id)
     form = VideoLessonForm(obj=video)
-    form.module_id.choices = [(m.id, f'{m.discipline.name} - {m.name}') for m in Module.query.join(Discipline).order_by(Discipline.order, Module.order).all()]
+    form.module_id.choices = get_catalog().module_choices()
     
     if form.validate_on_submit():
         video.title = form.title.data
@@ -299,27 +444,27 @@ def delete_video(id):
 @login_required
 @admin_required
 def materials():
-    materials = Material.query.join(Module).join(Discipline).order_by(
-        Discipline.order, Module.order, Material.order, Material.title
-    ).all()
-    return render_template('admin/materials.html', materials=materials)
+    materials = _content_page(Material, MATERIAL_SORTS)
+    return render_template('admin/materials.html', materials=materials, modules=get_catalog().module_choices())
 
 @admin_bp.route('/materials/new', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def new_material():
     form = MaterialForm()
-    form.module_id.choices = [(m.id, f'{m.discipline.name} - {m.name}') for m in Module.query.join(Discipline).order_by(Discipline.order, Module.order).all()]
+    form.module_id.choices = get_catalog().module_choices()
     
     if form.validate_on_submit():
         file_path = None
         file_type = None
         
-        if form.file.data:
-            file = form.file.data
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+        stored_file_id = None
+        
+        upload = _material_file(form)
+        if upload is False:
+            return render_template('admin/material_form.html', form=form, title='Novo Material')
+        if upload:
+            stored_file_id, filename = upload
             file_type = filename.rsplit('.', 1)[1].lower() if '.' in filename else None
             file_path = filename
         
@@ -328,6 +473,7 @@ def new_material():
             description=form.description.data,
             file_path=file_path,
             file_type=file_type,
+            stored_file_id=stored_file_id,
             external_url=form.external_url.data,
             module_id=form.module_id.data,
             order=form.order.data or 0
@@ -344,14 +490,14 @@ def new_material():
 def edit_material(id):
     material = Material.query.get_or_404(id)
     form = MaterialForm(obj=material)
-    form.module_id.choices = [(m.id, f'{m.discipline.name} - {m.name}') for m in Module.query.join(Discipline).order_by(Discipline.order, Module.order).all()]
+    form.module_id.choices = get_catalog().module_choices()
     
     if form.validate_on_submit():
-        if form.file.data:
-            file = form.file.data
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+        upload = _material_file(form)
+        if upload is False:
+            return render_template('admin/material_form.html', form=form, title='Editar Material')
+        if upload:
+            material.stored_file_id, filename = upload
             material.file_path = filename
             material.file_type = filename.rsplit('.', 1)[1].lower() if '.' in filename else None
         
@@ -365,12 +511,86 @@ def edit_material(id):
         return redirect(url_for('admin.materials'))
     return render_template('admin/material_form.html', form=form, title='Editar Material')
 
+def _material_file(form):
+    # (stored_file_id, filename) of the form's file, None without one, False if
+    # a chunked upload it points to has expired.
+    if form.upload_id.data:
+        claimed = uploads.claim_upload(form.upload_id.data, current_user.id)
+        if claimed is None:
+            flash('O envio do arquivo expirou. Selecione o arquivo novamente.', 'warning')
+            return False
+        stored, filename = claimed
+        return stored.id, filename
+    if form.file.data:
+        file = form.file.data
+        return storage.store_stream(file.stream).id, secure_filename(file.filename)
+    return None
+
+@admin_bp.route('/uploads', methods=['POST'])
+@login_required
+@admin_required
+def start_upload():
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename') or ''))
+    if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in DOCUMENT_EXTENSIONS:
+        return jsonify({'error': 'Apenas documentos são permitidos!'}), 400
+    try:
+        upload = uploads.start_upload(current_user.id, filename, int(data.get('size', -1)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Tamanho inválido.'}), 400
+    except uploads.UploadError as error:
+        return jsonify({'error': str(error)}), error.status
+    return jsonify(_upload_status(upload)), 201
+
+@admin_bp.route('/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+@login_required
+@admin_required
+def upload_chunk(upload_id):
+    upload = uploads.get_upload(upload_id, current_user.id)
+    if upload is None:
+        return jsonify({'error': 'Envio não encontrado.'}), 404
+    if request.method == 'DELETE':
+        uploads.cancel_upload(upload)
+        return '', 204
+    if request.method == 'PUT':
+        try:
+            uploads.append_chunk(upload, request.args.get('offset', type=int), request.stream,
+                                 request.headers.get('X-Chunk-SHA256'))
+        except uploads.UploadError as error:
+            return jsonify({'error': str(error), 'received': error.received}), error.status
+    return jsonify(_upload_status(upload))
+
+@admin_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+@admin_required
+def complete_upload(upload_id):
+    upload = uploads.get_upload(upload_id, current_user.id)
+    if upload is None:
+        return jsonify({'error': 'Envio não encontrado.'}), 404
+    try:
+        uploads.complete_upload(upload, (request.get_json(silent=True) or {}).get('sha256'))
+    except uploads.UploadError as error:
+        return jsonify({'error': str(error), 'received': error.received}), error.status
+    return jsonify(_upload_status(upload))
+
+def _upload_status(upload):
+    return {
+        'id': upload.id,
+        'filename': upload.filename,
+        'size': upload.size,
+        'received': upload.received,
+        'complete': upload.is_complete,
+        'chunk_size': uploads.CHUNK_SIZE,
+    }
+
 @admin_bp.route('/materials/<int:id>/delete', methods=['POST'])
 @login_required
 @admin_required
 def delete_material(id):
     material = Material.query.get_or_404(id)
-    if material.file_path:
+    # Stored files are released by reference count; only pre-store files are removed by name.
+    if material.file_path and material.stored_file_id is None and Material.query.filter(
+            Material.id != id, Material.file_path == material.file_path, Material.stored_file_id.is_(None)).first() is None:
         file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], material.file_path)
         if os.path.exists(file_path):
             os.remove(file_path)
@@ -383,17 +603,19 @@ def delete_material(id):
 @login_required
 @admin_required
 def quizzes():
-    quizzes = Quiz.query.join(Module).join(Discipline).order_by(
-        Discipline.order, Module.order, Quiz.order, Quiz.title
-    ).all()
-    return render_template('admin/quizzes.html', quizzes=quizzes)
+    quizzes = _content_page(Quiz, QUIZ_SORTS)
+    question_counts = dict(db.session.query(Question.quiz_id, func.count(Question.id)).filter(
+        Question.quiz_id.in_([quiz.id for quiz in quizzes])
+    ).group_by(Question.quiz_id).all())
+    return render_template('admin/quizzes.html', quizzes=quizzes, question_counts=question_counts,
+                           modules=get_catalog().module_choices())
 
 @admin_bp.route('/quizzes/new', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def new_quiz():
     form = QuizForm()
-    form.module_id.choices = [(m.id, f'{m.discipline.name} - {m.name}') for m in Module.query.join(Discipline).order_by(Discipline.order, Module.order).all()]
+    form.module_id.choices = get_catalog().module_choices()
     
     if form.validate_on_submit():
         quiz = Quiz(
@@ -415,7 +637,7 @@ def new_quiz():
 def edit_quiz(id):
     quiz = Quiz.query.get_or_404(id)
     form = QuizForm(obj=quiz)
-    form.module_id.choices = [(m.id, f'{m.discipline.name} - {m.name}') for m in Module.query.join(Discipline).order_by(Discipline.order, Module.order).all()]
+    form.module_id.choices = get_catalog().module_choices()
     
     if form.validate_on_submit():
         quiz.title = form.title.data
@@ -446,6 +668,66 @@ def quiz_questions(id):
     questions = Question.query.filter_by(quiz_id=id).order_by(Question.order).all()
     return render_template('admin/quiz_questions.html', quiz=quiz, questions=questions)
 
+@admin_bp.route('/quizzes/<int:id>/regrade', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def quiz_regrade(id):
+    # NumPy is only needed here and in the analysis page; keep it out of worker boot.
+    from services import regrade
+    
+    quiz = Quiz.query.get_or_404(id)
+    
+    if request.method == 'POST':
+        if regrade.active_job(id) is not None:
+            flash('Já existe uma recorreção em andamento para este simulado.', 'warning')
+        else:
+            dry_run = request.form.get('mode') != 'apply'
+            regrade.start_job(id, dry_run=dry_run)
+            flash('Simulação iniciada.' if dry_run else 'Recorreção iniciada.', 'info')
+        return redirect(url_for('admin.quiz_regrade', id=id))
+    
+    jobs = RegradeJob.query.filter_by(quiz_id=id).order_by(RegradeJob.id.desc()).limit(10).all()
+    latest = jobs[0] if jobs else None
+    summary = json.loads(latest.summary) if latest and latest.summary else None
+    users = {}
+    if summary:
+        user_ids = {sample['user_id'] for sample in summary['samples']}
+        users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+    attempts_count = QuizAttempt.query.filter_by(quiz_id=id, completed=True).count()
+    return render_template('admin/quiz_regrade.html', quiz=quiz, jobs=jobs, latest=latest, summary=summary,
+                           users=users, attempts_count=attempts_count)
+
+@admin_bp.route('/quizzes/<int:id>/analysis', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def quiz_analysis(id):
+    from services import item_analysis
+    
+    quiz = Quiz.query.get_or_404(id)
+    if request.method == 'POST':
+        item_analysis.quiz_analysis(id, rebuild=True)
+        flash('Análise recalculada a partir de todas as tentativas.', 'success')
+        return redirect(url_for('admin.quiz_analysis', id=id))
+    analysis = item_analysis.quiz_analysis(id)
+    return render_template('admin/quiz_analysis.html', quiz=quiz, analysis=analysis)
+
+@admin_bp.route('/regrade-jobs/<int:id>')
+@login_required
+@admin_required
+def regrade_job_status(id):
+    job = RegradeJob.query.get_or_404(id)
+    return jsonify({
+        'id': job.id,
+        'status': job.status,
+        'dry_run': job.dry_run,
+        'processed': job.processed,
+        'total': job.total_attempts,
+        'changed': job.changed,
+        'percentage': job.progress_percentage,
+        'summary': json.loads(job.summary) if job.summary else None,
+        'error': job.error,
+    })
+
 @admin_bp.route('/quizzes/<int:quiz_id>/questions/new', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -480,6 +762,7 @@ def edit_question(id):
     form = QuestionForm(obj=question)
     
     if form.validate_on_submit():
+        key_changed = (question.correct_answer or '').upper() != (form.correct_answer.data or '').upper()
         question.text = form.text.data
         question.option_a = form.option_a.data
         question.option_b = form.option_b.data
@@ -491,6 +774,9 @@ def edit_question(id):
         question.order = form.order.data or 0
         db.session.commit()
         flash('Questão atualizada com sucesso!', 'success')
+        if key_changed and QuizAttempt.query.filter_by(quiz_id=question.quiz_id, completed=True).first() is not None:
+            flash('O gabarito mudou. Simule e aplique a recorreção das tentativas já realizadas.', 'warning')
+            return redirect(url_for('admin.quiz_regrade', id=question.quiz_id))
         return redirect(url_for('admin.quiz_questions', id=question.quiz_id))
     return render_template('admin/question_form.html', form=form, quiz=question.quiz, title='Editar Questão')
 
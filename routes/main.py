@@ -1,8 +1,10 @@
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
-from models import VideoLesson, Quiz, Material, Discipline, Module, UserProgress, QuizAttempt
+from sqlalchemy.orm import joinedload
+from models import VideoLesson, Quiz, Material, UserProgress, QuizAttempt
 from forms import SearchForm
-from sqlalchemy import or_
+from services import search as search_engine
+from services.catalog import get_catalog
 
 main_bp = Blueprint('main', __name__)
 
@@ -15,15 +17,17 @@ def index():
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
-    total_videos = VideoLesson.query.count()
-    total_quizzes = Quiz.query.count()
-    total_materials = Material.query.count()
+    catalog = get_catalog()
+    total_videos = catalog.total_videos
+    total_quizzes = catalog.total_quizzes
+    total_materials = catalog.total_materials
     
-    recent_videos = VideoLesson.query.order_by(VideoLesson.created_at.desc()).limit(5).all()
-    recent_quizzes = Quiz.query.order_by(Quiz.created_at.desc()).limit(5).all()
-    recent_materials = Material.query.order_by(Material.created_at.desc()).limit(5).all()
+    # Left unexecuted: the template only runs them when its cached fragment is stale.
+    recent_videos = VideoLesson.query.options(joinedload(VideoLesson.module)).order_by(VideoLesson.created_at.desc()).limit(5)
+    recent_quizzes = Quiz.query.options(joinedload(Quiz.module)).order_by(Quiz.created_at.desc()).limit(5)
+    recent_materials = Material.query.options(joinedload(Material.module)).order_by(Material.created_at.desc()).limit(5)
     
-    progress = current_user.get_progress_percentage()
+    progress = current_user.get_progress_percentage(total_videos)
     
     quiz_attempts = QuizAttempt.query.filter_by(user_id=current_user.id, completed=True).all()
     avg_score = 0
@@ -46,37 +50,10 @@ def search():
     query = request.args.get('q', '')
     
     if len(query) < 2:
-        return render_template('search_results.html', query=query, results=[], message='Digite pelo menos 2 caracteres para buscar.')
+        return render_template('search_results.html', query=query, results=None, message='Digite pelo menos 2 caracteres para buscar.')
     
-    search_term = f'%{query}%'
-    
-    videos = VideoLesson.query.filter(
-        or_(VideoLesson.title.ilike(search_term), VideoLesson.description.ilike(search_term))
-    ).all()
-    
-    quizzes = Quiz.query.filter(
-        or_(Quiz.title.ilike(search_term), Quiz.description.ilike(search_term))
-    ).all()
-    
-    materials = Material.query.filter(
-        or_(Material.title.ilike(search_term), Material.description.ilike(search_term))
-    ).all()
-    
-    disciplines = Discipline.query.filter(
-        or_(Discipline.name.ilike(search_term), Discipline.description.ilike(search_term))
-    ).all()
-    
-    modules = Module.query.filter(
-        or_(Module.name.ilike(search_term), Module.description.ilike(search_term))
-    ).all()
-    
-    results = {
-        'videos': videos,
-        'quizzes': quizzes,
-        'materials': materials,
-        'disciplines': disciplines,
-        'modules': modules
-    }
+    page = request.args.get('page', 1, type=int)
+    results = search_engine.search(query, page=page)
     
     return render_template('search_results.html', query=query, results=results)
 
@@ -1,28 +1,30 @@
-import os
-from flask import Blueprint, render_template, redirect, url_for, flash, send_from_directory, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, abort, send_from_directory
 from flask_login import login_required, current_user
-from models import Discipline, Module, Material
+from sqlalchemy.orm import joinedload
+from models import Material
+from services import delivery, extraction
+from services.catalog import get_catalog
 
 materiais_bp = Blueprint('materiais', __name__)
 
 @materiais_bp.route('/')
 @login_required
 def index():
-    disciplines = Discipline.query.order_by(Discipline.order, Discipline.name).all()
+    disciplines = get_catalog().disciplines
     return render_template('materiais/index.html', disciplines=disciplines)
 
 @materiais_bp.route('/discipline/<int:id>')
 @login_required
 def discipline(id):
-    discipline = Discipline.query.get_or_404(id)
-    modules = Module.query.filter_by(discipline_id=id).order_by(Module.order, Module.name).all()
+    discipline = get_catalog().get_discipline_or_404(id)
+    modules = discipline.modules
     return render_template('materiais/discipline.html', discipline=discipline, modules=modules)
 
 @materiais_bp.route('/module/<int:id>')
 @login_required
 def module(id):
-    module = Module.query.get_or_404(id)
-    materials = Material.query.filter_by(module_id=id).order_by(Material.order, Material.title).all()
+    module = get_catalog().get_module_or_404(id)
+    materials = Material.query.options(joinedload(Material.extract)).filter_by(module_id=id).order_by(Material.order, Material.title).all()
     return render_template('materiais/module.html', module=module, materials=materials)
 
 @materiais_bp.route('/view/<int:id>')
@@ -48,13 +50,22 @@ def download(id):
         flash('Arquivo não disponível para download.', 'warning')
         return redirect(url_for('materiais.module', id=material.module_id))
     
-    return send_from_directory(
-        current_app.config['UPLOAD_FOLDER'],
-        material.file_path,
-        as_attachment=True
-    )
+    return delivery.send_material(material, as_attachment=True)
 
-@materiais_bp.route('/file/<filename>')
+@materiais_bp.route('/file/<int:id>/<filename>')
 @login_required
-def serve_file(filename):
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+def serve_file(id, filename):
+    material = Material.query.get_or_404(id)
+    if not material.file_path:
+        abort(404)
+    return delivery.send_material(material)
+
+@materiais_bp.route('/thumb/<key>.jpg')
+@login_required
+def thumbnail(key):
+    # Named by content hash, so a browser never needs to revalidate it.
+    response = send_from_directory(extraction.thumbnail_folder(), extraction.thumbnail_path(key), max_age=365 * 24 * 3600)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
@@ -1,37 +1,45 @@
-import json
 from datetime import datetime
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from extensions import db
-from models import Discipline, Module, Quiz, Question, QuizAttempt
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload
+from models import Module, Quiz, QuizAttempt
+from services import metrics
+from services.catalog import get_catalog
+from services.quiz_cache import compiled_quiz
+from services.responses import record_responses, attempt_answers
+from services.attempt_stats import attempt_stats
+from services.pagination import Sort, paginate
 
 simulados_bp = Blueprint('simulados', __name__)
 
+HISTORY_SORTS = {
+    'recentes': Sort('Mais recentes', QuizAttempt.finished_at.desc(), QuizAttempt.id.desc()),
+    'antigos': Sort('Mais antigos', QuizAttempt.finished_at, QuizAttempt.id),
+    'nota': Sort('Maior nota', QuizAttempt.score.desc(), QuizAttempt.id.desc()),
+}
+
 @simulados_bp.route('/')
 @login_required
 def index():
-    disciplines = Discipline.query.order_by(Discipline.order, Discipline.name).all()
+    disciplines = get_catalog().disciplines
     return render_template('simulados/index.html', disciplines=disciplines)
 
 @simulados_bp.route('/discipline/<int:id>')
 @login_required
 def discipline(id):
-    discipline = Discipline.query.get_or_404(id)
-    modules = Module.query.filter_by(discipline_id=id).order_by(Module.order, Module.name).all()
+    discipline = get_catalog().get_discipline_or_404(id)
+    modules = discipline.modules
     return render_template('simulados/discipline.html', discipline=discipline, modules=modules)
 
 @simulados_bp.route('/module/<int:id>')
 @login_required
 def module(id):
-    module = Module.query.get_or_404(id)
+    module = get_catalog().get_module_or_404(id)
     quizzes = Quiz.query.filter_by(module_id=id).order_by(Quiz.order, Quiz.title).all()
     
-    user_attempts = {}
-    for quiz in quizzes:
-        attempts = QuizAttempt.query.filter_by(user_id=current_user.id, quiz_id=quiz.id, completed=True).all()
-        if attempts:
-            best_score = max(a.score for a in attempts)
-            user_attempts[quiz.id] = {'count': len(attempts), 'best_score': best_score}
+    user_attempts = attempt_stats(current_user.id, [quiz.id for quiz in quizzes])
     
     return render_template('simulados/module.html', module=module, quizzes=quizzes, user_attempts=user_attempts)
 
@@ -39,21 +47,23 @@ def module(id):
 @login_required
 def start(id):
     quiz = Quiz.query.get_or_404(id)
-    questions_count = Question.query.filter_by(quiz_id=id).count()
+    questions_count = len(compiled_quiz(id).questions)
     
     if questions_count == 0:
         flash('Este simulado ainda não possui questões.', 'warning')
         return redirect(url_for('simulados.module', id=quiz.module_id))
     
     previous_attempts = QuizAttempt.query.filter_by(user_id=current_user.id, quiz_id=id, completed=True).order_by(QuizAttempt.finished_at.desc()).limit(5).all()
+    stats = attempt_stats(current_user.id, [id]).get(id)
     
-    return render_template('simulados/start.html', quiz=quiz, questions_count=questions_count, previous_attempts=previous_attempts)
+    return render_template('simulados/start.html', quiz=quiz, questions_count=questions_count, previous_attempts=previous_attempts, stats=stats)
 
 @simulados_bp.route('/take/<int:id>')
 @login_required
 def take(id):
     quiz = Quiz.query.get_or_404(id)
-    questions = Question.query.filter_by(quiz_id=id).order_by(Question.order).all()
+    compiled = compiled_quiz(id)
+    questions = compiled.questions
     
     if not questions:
         flash('Este simulado não possui questões.', 'warning')
@@ -68,7 +78,7 @@ def take(id):
     db.session.add(attempt)
     db.session.commit()
     
-    return render_template('simulados/take.html', quiz=quiz, questions=questions, attempt=attempt)
+    return render_template('simulados/take.html', quiz=quiz, questions=questions, attempt=attempt, quiz_version=compiled.version)
 
 @simulados_bp.route('/submit/<int:attempt_id>', methods=['POST'])
 @login_required
@@ -83,29 +93,38 @@ def submit(attempt_id):
         flash('Este simulado já foi finalizado.', 'warning')
         return redirect(url_for('simulados.result', attempt_id=attempt_id))
     
-    questions = Question.query.filter_by(quiz_id=attempt.quiz_id).order_by(Question.order).all()
-    
-    answers = {}
-    correct_count = 0
+    compiled = compiled_quiz(attempt.quiz_id)
+    answers, correct_count = compiled.grade(request.form)
     
-    for question in questions:
-        answer_key = f'question_{question.id}'
-        user_answer = request.form.get(answer_key, '')
-        answers[str(question.id)] = user_answer
-        
-        if user_answer.upper() == question.correct_answer.upper():
-            correct_count += 1
+    version = request.form.get('quiz_version')
+    if version and version != compiled.version:
+        flash('As questões deste simulado foram atualizadas durante a prova; a correção usa a versão atual.', 'warning')
     
     time_spent = request.form.get('time_spent', 0)
     
-    attempt.answers = json.dumps(answers)
+    # Claim the attempt before writing responses: of two concurrent submits
+    # only one updates the row, the other waits for it and gets 0 rows. The
+    # ORM object is left as loaded, so the completed transition still reaches
+    # the statistics hooks when it is flushed below.
+    claimed = db.session.execute(
+        update(QuizAttempt).where(QuizAttempt.id == attempt.id, QuizAttempt.completed.isnot(True)).values(completed=True),
+        execution_options={'synchronize_session': False},
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        flash('Este simulado já foi finalizado.', 'warning')
+        return redirect(url_for('simulados.result', attempt_id=attempt_id))
+    
+    record_responses(attempt.id, compiled, answers)
     attempt.correct_answers = correct_count
-    attempt.score = (correct_count / len(questions)) * 100 if questions else 0
+    attempt.total_questions = len(compiled.questions)
+    attempt.score = compiled.score(correct_count)
     attempt.time_spent_seconds = int(time_spent) if time_spent else 0
     attempt.completed = True
     attempt.finished_at = datetime.utcnow()
     
     db.session.commit()
+    metrics.quiz_submitted()
     
     flash('Simulado finalizado com sucesso!', 'success')
     return redirect(url_for('simulados.result', attempt_id=attempt_id))
@@ -123,13 +142,22 @@ def result(attempt_id):
         flash('Este simulado ainda não foi finalizado.', 'warning')
         return redirect(url_for('simulados.take', id=attempt.quiz_id))
     
-    questions = Question.query.filter_by(quiz_id=attempt.quiz_id).order_by(Question.order).all()
-    user_answers = json.loads(attempt.answers) if attempt.answers else {}
+    questions = compiled_quiz(attempt.quiz_id).questions
+    user_answers = attempt_answers(attempt)
     
     return render_template('simulados/result.html', attempt=attempt, questions=questions, user_answers=user_answers)
 
 @simulados_bp.route('/history')
 @login_required
 def history():
-    attempts = QuizAttempt.query.filter_by(user_id=current_user.id, completed=True).order_by(QuizAttempt.finished_at.desc()).all()
-    return render_template('simulados/history.html', attempts=attempts)
+    query = QuizAttempt.query.options(
+        joinedload(QuizAttempt.quiz).joinedload(Quiz.module).joinedload(Module.discipline)
+    ).filter_by(user_id=current_user.id, completed=True)
+    quiz_id = request.args.get('quiz_id', type=int)
+    if quiz_id:
+        query = query.filter_by(quiz_id=quiz_id)
+    attempts = paginate(query, HISTORY_SORTS)
+    stats = attempt_stats(current_user.id)
+    quizzes = {quiz.id: quiz for quiz in Quiz.query.filter(Quiz.id.in_(list(stats)))} if stats else {}
+    summary = sorted(stats.values(), key=lambda s: s.last_attempt_at or datetime.min, reverse=True)
+    return render_template('simulados/history.html', attempts=attempts, summary=summary, quizzes=quizzes)
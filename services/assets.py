@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from flask import current_app, request, send_from_directory
+
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+# Worth precompressing; images and fonts are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html')
+# Preferred first when the client accepts several.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+def init_app(app):
+    # `flask assets-build` writes static/dist/ and its manifest. Without a
+    # manifest (development) url_for('static') keeps the plain file names.
+    app.config.setdefault('STATIC_MANIFEST', os.path.join(app.static_folder, BUILD_DIR, MANIFEST))
+    app.extensions['static_manifest'] = _load_manifest(app.config['STATIC_MANIFEST'])
+    app.url_defaults(_fingerprint_url)
+    app.view_functions['static'] = serve_static
+
+def _load_manifest(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _fingerprint_url(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        built = current_app.extensions['static_manifest'].get(values['filename'])
+        if built is not None:
+            values['filename'] = built
+
+def serve_static(filename):
+    # The stock static view, except for built files: those get the
+    # precompressed variant the client accepts and a one-year immutable
+    # lifetime (the name changes whenever the content does).
+    if not filename.startswith(BUILD_DIR + '/'):
+        return current_app.send_static_file(filename)
+    accepted = _accepted_encodings()
+    path = filename
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if name in accepted and os.path.isfile(os.path.join(current_app.static_folder, filename + suffix)):
+            path, encoding = filename + suffix, name
+            break
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(current_app.static_folder, path, mimetype=mimetype, max_age=31536000)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if filename.endswith(COMPRESSIBLE):
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+def _accepted_encodings():
+    accepted = set()
+    for value, quality in request.accept_encodings:
+        if quality > 0:
+            accepted.add(value)
+    return accepted
+
+def build(static_folder):
+    # Writes every source file to dist/ as name.<hash>.ext, plus .gz and (with
+    # the Brotli package installed) .br next to each compressible one, then
+    # swaps in the new manifest. Older builds stay, so workers still running
+    # with the previous manifest keep serving their files until reloaded.
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    output = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder:
+            dirs[:] = [name for name in dirs if name != BUILD_DIR]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            stem, extension = os.path.splitext(relative)
+            built = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+            target = os.path.join(output, built)
+            manifest[relative] = f'{BUILD_DIR}/{built}'
+            if os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if extension in COMPRESSIBLE:
+                # mtime=0 keeps builds byte-for-byte reproducible.
+                _write(target + '.gz', gzip.compress(data, 9, mtime=0), len(data))
+                if brotli is not None:
+                    _write(target + '.br', brotli.compress(data, quality=11), len(data))
+            _write(target, data)
+    _write(os.path.join(output, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest, brotli is not None
+
+def _write(path, data, original_size=None):
+    # Atomic, and a compressed variant that would not be smaller is skipped.
+    if original_size is not None and len(data) >= original_size:
+        return
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
@@ -0,0 +1,33 @@
+from sqlalchemy import func
+from extensions import db
+from models import QuizAttempt
+
+class AttemptStats:
+    def __init__(self, quiz_id, count, best_score, last_attempt_at, avg_time_seconds):
+        self.quiz_id = quiz_id
+        self.count = count
+        self.best_score = best_score or 0
+        self.last_attempt_at = last_attempt_at
+        self.avg_time_seconds = int(avg_time_seconds or 0)
+
+def ensure_attempt_indexes():
+    for index in QuizAttempt.__table__.indexes:
+        index.create(bind=db.engine, checkfirst=True)
+
+def attempt_stats(user_id, quiz_ids=None):
+    # One grouped query per call instead of loading every attempt per quiz.
+    if quiz_ids is not None and not quiz_ids:
+        return {}
+    query = db.session.query(
+        QuizAttempt.quiz_id,
+        func.count(QuizAttempt.id),
+        func.max(QuizAttempt.score),
+        func.max(QuizAttempt.finished_at),
+        func.avg(QuizAttempt.time_spent_seconds),
+    ).filter(
+        QuizAttempt.user_id == user_id,
+        QuizAttempt.completed.is_(True)
+    )
+    if quiz_ids is not None:
+        query = query.filter(QuizAttempt.quiz_id.in_(quiz_ids))
+    return {row[0]: AttemptStats(*row) for row in query.group_by(QuizAttempt.quiz_id)}
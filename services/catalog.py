@@ -0,0 +1,132 @@
+import threading
+from flask import abort, g
+from sqlalchemy import event, func
+from extensions import db
+from models import Discipline, Module, VideoLesson, Quiz, Material
+from services.generations import current_generation, bump_generation
+from services.playlist import build_playlists
+
+CATALOG = 'catalog'
+WATCHED_MODELS = (Discipline, Module, VideoLesson, Quiz, Material)
+
+class CatalogModule:
+    def __init__(self, module, discipline, videos, quiz_count, material_count):
+        self.id = module.id
+        self.name = module.name
+        self.description = module.description
+        self.order = module.order
+        self.discipline_id = module.discipline_id
+        self.discipline = discipline
+        # Ordered PlaylistEntry list; `watch` navigates it without queries.
+        self.videos = videos
+        self.video_count = len(videos)
+        self.quiz_count = quiz_count
+        self.material_count = material_count
+
+class CatalogDiscipline:
+    def __init__(self, discipline):
+        self.id = discipline.id
+        self.name = discipline.name
+        self.description = discipline.description
+        self.order = discipline.order
+        self.modules = []
+    
+    @property
+    def module_count(self):
+        return len(self.modules)
+
+class CatalogTree:
+    def __init__(self, generation, disciplines):
+        self.generation = generation
+        self.disciplines = disciplines
+        self.modules = [module for discipline in disciplines for module in discipline.modules]
+        self._disciplines = {discipline.id: discipline for discipline in disciplines}
+        self._modules = {module.id: module for module in self.modules}
+        self._videos = {video.id: video for module in self.modules for video in module.videos}
+        self.total_videos = sum(module.video_count for module in self.modules)
+        self.total_quizzes = sum(module.quiz_count for module in self.modules)
+        self.total_materials = sum(module.material_count for module in self.modules)
+    
+    def get_discipline(self, id):
+        return self._disciplines.get(id)
+    
+    def get_module(self, id):
+        return self._modules.get(id)
+    
+    def get_discipline_or_404(self, id):
+        return self._disciplines.get(id) or abort(404)
+    
+    def get_module_or_404(self, id):
+        return self._modules.get(id) or abort(404)
+    
+    def get_video_or_404(self, id):
+        return self._videos.get(id) or abort(404)
+    
+    def discipline_choices(self):
+        return [(discipline.id, discipline.name) for discipline in self.disciplines]
+    
+    def module_choices(self):
+        return [(module.id, f'{module.discipline.name} - {module.name}') for module in self.modules]
+
+class CatalogCache:
+    def __init__(self):
+        self._tree = None
+        self._lock = threading.Lock()
+    
+    def get(self):
+        generation = current_generation(CATALOG)
+        tree = self._tree
+        if tree is None or tree.generation != generation:
+            with self._lock:
+                tree = self._tree
+                if tree is None or tree.generation != generation:
+                    tree = self._tree = _build_tree(generation)
+        return tree
+    
+    def clear(self):
+        self._tree = None
+
+_cache = CatalogCache()
+
+def init_app(app):
+    if not event.contains(db.session, 'after_flush', _bump_after_flush):
+        event.listen(db.session, 'after_flush', _bump_after_flush)
+
+def get_catalog():
+    # The generation check costs one primary-key lookup, done once per request.
+    if 'catalog' not in g:
+        g.catalog = _cache.get()
+    return g.catalog
+
+def _counts(model):
+    return dict(db.session.query(model.module_id, func.count(model.id)).group_by(model.module_id).all())
+
+def _build_tree(generation):
+    disciplines = [CatalogDiscipline(d) for d in Discipline.query.order_by(Discipline.order, Discipline.name)]
+    by_id = {discipline.id: discipline for discipline in disciplines}
+    playlists, quizzes, materials = build_playlists(), _counts(Quiz), _counts(Material)
+    for module in Module.query.order_by(Module.order, Module.name):
+        discipline = by_id.get(module.discipline_id)
+        if discipline is not None:
+            videos = playlists.get(module.id, [])
+            catalog_module = CatalogModule(module, discipline, videos, quizzes.get(module.id, 0), materials.get(module.id, 0))
+            for video in videos:
+                video.module = catalog_module
+            discipline.modules.append(catalog_module)
+    return CatalogTree(generation, disciplines)
+
+def _touches_catalog(session):
+    for obj in session.new:
+        if isinstance(obj, WATCHED_MODELS):
+            return True
+    for obj in session.deleted:
+        if isinstance(obj, WATCHED_MODELS):
+            return True
+    for obj in session.dirty:
+        if isinstance(obj, WATCHED_MODELS) and session.is_modified(obj, include_collections=False):
+            return True
+    return False
+
+def _bump_after_flush(session, flush_context):
+    if _touches_catalog(session):
+        bump_generation(session.connection(), [CATALOG])
@@ -0,0 +1,155 @@
+import gzip
+import time
+import zlib
+from flask import current_app, request
+from services import instrumentation, metrics
+
+# Preferred first when the client accepts several.
+ENCODINGS = ('br', 'gzip')
+MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml', 'image/svg+xml',
+)
+
+def init_app(app):
+    # Compresses dynamic responses on the way out. Register after
+    # instrumentation: Flask runs it first, so the bytes saved make it into
+    # Server-Timing. File downloads (send_file/send_from_directory, including
+    # the precompressed static/dist files) are never touched.
+    app.config.setdefault('COMPRESS', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_MIMETYPES', MIMETYPES)
+    # zlib level for gzip (1-9) and Brotli quality (0-11). Dynamic pages are
+    # compressed on every request, so both stay well below the maximum.
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_LEVEL', 4)
+    # Streamed templates are flushed to the client every this many bytes.
+    app.config.setdefault('COMPRESS_STREAM_BUFFER', 16 * 1024)
+    if not app.config['COMPRESS']:
+        return
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    app.extensions['compression_brotli'] = brotli
+    app.after_request(compress_response)
+
+def _choose_encoding():
+    accepted = {}
+    for value, quality in request.accept_encodings:
+        accepted[value] = quality
+    for name in ENCODINGS:
+        if name == 'br' and current_app.extensions.get('compression_brotli') is None:
+            continue
+        if accepted.get(name, accepted.get('*', 0)) > 0:
+            return name
+    return None
+
+def _skip(response, config):
+    if request.method == 'HEAD' or response.direct_passthrough:
+        return True
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code in (204, 206):
+        return True
+    if 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', ''):
+        return True
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return True
+    # Streamed bodies have no length yet; templates are only streamed when large.
+    return not response.is_streamed and (response.content_length or 0) < config['COMPRESS_MIN_SIZE']
+
+def compress_response(response):
+    config = current_app.config
+    if _skip(response, config):
+        return response
+    # Whatever the outcome, caches must key this URL on Accept-Encoding.
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = _compress_stream(
+            response.response, response.iter_encoded(), _compressor(encoding, config), encoding,
+            config['COMPRESS_STREAM_BUFFER'], request.endpoint or '<unmatched>',
+            instrumentation.enabled(current_app),
+        )
+        response.headers.pop('Content-Length', None)
+    else:
+        started = time.perf_counter()
+        data = response.get_data()
+        compressed = _compress(data, encoding, config)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        saved = len(data) - len(compressed)
+        metrics.compressed(encoding, len(data), len(compressed))
+        instrumentation.add_bytes_saved(saved)
+        instrumentation.add_timing('compress', (time.perf_counter() - started) * 1000, f'{encoding}; {saved} bytes saved')
+    response.headers['Content-Encoding'] = encoding
+    # The compressed body is a different representation of the same page.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def _compress(data, encoding, config):
+    if encoding == 'br':
+        return current_app.extensions['compression_brotli'].compress(data, quality=config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(data, config['COMPRESS_LEVEL'], mtime=0)
+
+class _Compressor:
+    # Incremental gzip or Brotli with the same three calls.
+    def __init__(self, encoding, level, brotli=None):
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=level)
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+    
+    def compress(self, data):
+        return self._brotli.process(data) if self._brotli else self._zlib.compress(data)
+    
+    def flush(self):
+        return self._brotli.flush() if self._brotli else self._zlib.flush(zlib.Z_SYNC_FLUSH)
+    
+    def finish(self):
+        return self._brotli.finish() if self._brotli else self._zlib.flush()
+
+def _compressor(encoding, config):
+    if encoding == 'br':
+        return _Compressor(encoding, config['COMPRESS_BR_LEVEL'], current_app.extensions['compression_brotli'])
+    return _Compressor(encoding, config['COMPRESS_LEVEL'])
+
+def _compress_stream(body, chunks, compressor, encoding, buffer_size, endpoint, instrumented):
+    # Runs after the request has returned, so everything it needs is passed
+    # in. Template chunks are tiny; they are batched up to buffer_size before
+    # each flush, which keeps the ratio close to compressing the whole page
+    # while the browser still gets the head of it early.
+    size = compressed = 0
+    pending = []
+    pending_size = 0
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            pending.append(chunk)
+            pending_size += len(chunk)
+            if pending_size >= buffer_size:
+                data = b''.join(pending)
+                size += len(data)
+                output = compressor.compress(data) + compressor.flush()
+                compressed += len(output)
+                pending, pending_size = [], 0
+                yield output
+        data = b''.join(pending)
+        size += len(data)
+        output = compressor.compress(data) + compressor.finish()
+        compressed += len(output)
+        yield output
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+        if size:
+            metrics.compressed(encoding, size, compressed)
+            if instrumented:
+                instrumentation.endpoints.add_bytes_saved(endpoint, size - compressed)
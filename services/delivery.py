@@ -0,0 +1,72 @@
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import abort, current_app, request, send_from_directory
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+from services import storage
+
+MODES = ('direct', 'x-accel', 'x-sendfile')
+
+def init_app(app):
+    # direct: Flask streams the file (conditional GETs and ranges via Werkzeug).
+    # x-accel / x-sendfile: the front server streams it and handles ranges;
+    # Flask only checks access and answers revalidations.
+    app.config.setdefault('FILE_DELIVERY', 'direct')
+    app.config.setdefault('FILE_ACCEL_PREFIX', '/_uploads/')
+    app.config.setdefault('FILE_MAX_AGE', 0)
+    if app.config['FILE_DELIVERY'] not in MODES:
+        raise ValueError(f"FILE_DELIVERY must be one of {', '.join(MODES)}")
+
+def send_material(material, as_attachment=False):
+    directory, path = storage.locate(material)
+    full_path = safe_join(directory, path)
+    if full_path is None or not os.path.isfile(full_path):
+        abort(404)
+    # Content-addressed files get the hash as a strong validator.
+    etag = material.stored_file.sha256 if material.stored_file is not None else None
+    
+    mode = current_app.config['FILE_DELIVERY']
+    if mode == 'direct':
+        response = send_from_directory(
+            directory, path,
+            as_attachment=as_attachment,
+            download_name=material.file_path,
+            etag=etag or True,
+            conditional=True,
+        )
+    else:
+        response = _offload(mode, full_path, material.file_path, as_attachment, etag)
+    
+    # Materials are behind login: never let shared caches keep them.
+    response.cache_control.public = False
+    response.cache_control.private = True
+    max_age = current_app.config['FILE_MAX_AGE']
+    if max_age:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = max_age
+        response.expires = None
+    else:
+        response.cache_control.no_cache = True
+        response.cache_control.max_age = None
+    return response
+
+def _offload(mode, full_path, download_name, as_attachment, etag):
+    stat = os.stat(full_path)
+    etag = etag or f'{int(stat.st_mtime)}-{stat.st_size}'
+    response = current_app.response_class()
+    response.set_etag(etag)
+    response.last_modified = int(stat.st_mtime)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=response.last_modified):
+        response.status_code = 304
+        return response
+    
+    response.mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline', filename=download_name)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if mode == 'x-accel':
+        relative = os.path.relpath(full_path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = current_app.config['FILE_ACCEL_PREFIX'] + quote(relative)
+    else:
+        response.headers['X-Sendfile'] = full_path
+    return response
@@ -0,0 +1,233 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import get_history
+from extensions import db
+from models import Material, StoredFile, ContentExtract
+from services import search, storage
+
+# Bump when the extraction output changes, so `flask materials-extract` redoes old rows.
+VERSION = 1
+MAX_TEXT_CHARS = 100000
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_DIR = 'thumbs'
+# A pending row older than this belonged to a worker that died; it may be claimed again.
+STALE_AFTER = timedelta(minutes=15)
+
+_executor = None
+_executor_lock = threading.Lock()
+_running = set()
+_running_changed = threading.Condition()
+_SPACE_RE = re.compile(r'\s+')
+
+def init_app(app):
+    # 0 runs extraction in the calling thread (tests, small installs).
+    app.config.setdefault('EXTRACT_WORKERS', 1)
+    if not event.contains(db.session, 'before_flush', _assign_keys):
+        event.listen(db.session, 'before_flush', _assign_keys)
+        event.listen(db.session, 'after_flush', _queue_changed)
+        event.listen(db.session, 'after_commit', _submit_after_commit)
+        event.listen(db.session, 'after_rollback', _forget_after_rollback)
+
+def ensure_extraction():
+    index = next(index for index in Material.__table__.indexes if 'content_key' in index.columns)
+    index.create(db.engine, checkfirst=True)
+    os.makedirs(thumbnail_folder(), exist_ok=True)
+
+def thumbnail_folder():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], THUMBNAIL_DIR)
+
+def thumbnail_path(key):
+    return f'{StoredFile.path_for(key)}.jpg'
+
+def content_key(material):
+    if material.stored_file_id:
+        # By id: routes assign stored_file_id, leaving the relationship stale.
+        return db.session.get(StoredFile, material.stored_file_id).sha256
+    if material.external_url:
+        return hashlib.sha256(material.external_url.encode()).hexdigest()
+    return None
+
+def _job(material):
+    # (key, source, locator) for the worker, or None when there is nothing to extract.
+    if not material.content_key:
+        return None
+    if material.stored_file_id:
+        if material.file_type != 'pdf':
+            return None
+        return material.content_key, 'file', storage.stored_path(material.content_key)
+    return material.content_key, 'url', material.external_url
+
+def _assign_keys(session, flush_context, instances):
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, Material) and (obj in session.new or any(
+                    get_history(obj, attr).has_changes() for attr in ('stored_file_id', 'external_url'))):
+                obj.content_key = content_key(obj)
+
+def _queue_changed(session, flush_context):
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Material) and get_history(obj, 'content_key').added:
+            job = _job(obj)
+            if job:
+                session.info.setdefault('extract_jobs', {})[job[0]] = job
+
+def _submit_after_commit(session):
+    if session.in_nested_transaction():
+        return
+    jobs = session.info.pop('extract_jobs', None)
+    if jobs:
+        submit(jobs.values())
+
+def _forget_after_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('extract_jobs', None)
+
+def _claim(connection, key, source, force):
+    # Idempotent per key: a finished row of the current version, or one a
+    # live worker is on, is left alone.
+    table = ContentExtract.__table__
+    now = datetime.utcnow()
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(key=key, source=source, version=VERSION, status='pending', updated_at=now))
+        return True
+    except IntegrityError:
+        pass
+    claimable = or_(
+        table.c.version != VERSION,
+        table.c.status == 'failed',
+        (table.c.status == 'pending') & (table.c.updated_at < now - STALE_AFTER),
+    )
+    query = table.update().where(table.c.key == key)
+    if not force:
+        query = query.where(claimable)
+    result = connection.execute(query.values(version=VERSION, status='pending', error=None, updated_at=now))
+    return result.rowcount > 0
+
+def submit(jobs, force=False):
+    app = current_app._get_current_object()
+    with db.engine.begin() as connection:
+        claimed = [job for job in jobs if _claim(connection, job[0], job[1], force)]
+    
+    for key, source, locator in claimed:
+        thumbnail = os.path.join(thumbnail_folder(), thumbnail_path(key)) if source == 'file' else None
+        if not app.config['EXTRACT_WORKERS']:
+            _finish(app, key, lambda: extract(source, locator, thumbnail))
+            continue
+        try:
+            future = _pool(app).submit(extract, source, locator, thumbnail)
+        except BrokenProcessPool:
+            # A worker died (a PDF crashing pdfium, the OOM killer); start a new pool.
+            future = _pool(app, replace=True).submit(extract, source, locator, thumbnail)
+        with _running_changed:
+            _running.add(future)
+        future.add_done_callback(lambda future, key=key: _done(app, key, future))
+    return len(claimed)
+
+def _done(app, key, future):
+    try:
+        _finish(app, key, future.result)
+    finally:
+        with _running_changed:
+            _running.discard(future)
+            _running_changed.notify_all()
+
+def wait_for_running(timeout=None):
+    # Until every submitted job has also had its result written.
+    with _running_changed:
+        return _running_changed.wait_for(lambda: not _running, timeout)
+
+def _pool(app, replace=False):
+    global _executor
+    with _executor_lock:
+        if _executor is not None and replace:
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            # spawn: the children must not inherit the parent's DB connections or threads.
+            _executor = ProcessPoolExecutor(
+                max_workers=app.config['EXTRACT_WORKERS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                max_tasks_per_child=50,
+            )
+        return _executor
+
+def _finish(app, key, result):
+    with app.app_context():
+        table = ContentExtract.__table__
+        try:
+            values = dict(result(), status='done', error=None)
+        except Exception as error:
+            app.logger.warning('extraction of %s failed: %s', key, error)
+            values = {'status': 'failed', 'error': str(error)[:1000]}
+        with db.engine.begin() as connection:
+            connection.execute(table.update().where(table.c.key == key).values(updated_at=datetime.utcnow(), **values))
+            ids = connection.execute(select(Material.id).where(Material.content_key == key)).scalars().all()
+            if ids and values['status'] == 'done':
+                search.reindex(connection, 'material', ids)
+
+def extract_all(force=False):
+    materials = Material.query.filter(or_(Material.stored_file_id.isnot(None), Material.external_url.isnot(None))).all()
+    for material in materials:
+        if not material.content_key:
+            material.content_key = content_key(material)
+    # Materials keyed just now are queued by the commit itself.
+    db.session.commit()
+    jobs = {job[0]: job for job in map(_job, materials) if job}
+    return submit(jobs.values(), force=force)
+
+# Runs in the worker processes: no app, no database.
+
+def extract(source, locator, thumbnail):
+    if source == 'file':
+        return _extract_pdf(locator, thumbnail)
+    return _extract_url(locator)
+
+def _clean(parts):
+    return _SPACE_RE.sub(' ', ' '.join(parts)).strip()[:MAX_TEXT_CHARS]
+
+def _extract_pdf(path, thumbnail):
+    import pypdfium2 as pdfium
+    
+    pdf = pdfium.PdfDocument(path)
+    try:
+        page_count = len(pdf)
+        parts, length = [], 0
+        for index in range(page_count):
+            page = pdf[index]
+            if index == 0:
+                _render_thumbnail(page, thumbnail)
+            textpage = page.get_textpage()
+            parts.append(textpage.get_text_bounded())
+            length += len(parts[-1])
+            textpage.close()
+            page.close()
+            if length >= MAX_TEXT_CHARS:
+                break
+    finally:
+        pdf.close()
+    return {'page_count': page_count, 'text': _clean(parts), 'has_thumbnail': page_count > 0}
+
+def _render_thumbnail(page, thumbnail):
+    image = page.render(scale=THUMBNAIL_WIDTH / page.get_width()).to_pil().convert('RGB')
+    os.makedirs(os.path.dirname(thumbnail), exist_ok=True)
+    temp = f'{thumbnail}.{os.getpid()}.tmp'
+    image.save(temp, 'JPEG', quality=80, optimize=True)
+    os.replace(temp, thumbnail)
+
+def _extract_url(url):
+    import trafilatura
+    
+    downloaded = trafilatura.fetch_url(url)
+    text = trafilatura.extract(downloaded) if downloaded else None
+    return {'page_count': None, 'text': _clean([text or '']), 'has_thumbnail': False}
@@ -0,0 +1,235 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from services import instrumentation
+from services.catalog import get_catalog
+
+class LRUStore:
+    # Per-worker store: fastest, but every worker renders each fragment once.
+    def __init__(self, max_size=500):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+class FileSystemStore:
+    # Shared by every worker on the host, standing in for Redis/memcached:
+    # one JSON file per key, written atomically. Files of old catalog
+    # generations expire and are pruned every PRUNE_EVERY writes.
+    PRUNE_EVERY = 100
+    
+    def __init__(self, directory, max_size=2000):
+        self.directory = directory
+        self.max_size = max_size
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.json')
+    
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                expires, stored_key, value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if expires <= time.time() or stored_key != key:
+            return None
+        return value
+    
+    def set(self, key, value, ttl):
+        handle, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'w', encoding='utf-8') as f:
+            json.dump([time.time() + ttl, key, value], f)
+        os.replace(path, self._path(key))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+    
+    def prune(self):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith('.tmp'):
+                    if os.path.getmtime(path) < now - 60:
+                        os.remove(path)
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    expires = json.load(f)[0]
+            except (OSError, ValueError):
+                continue
+            if expires <= now:
+                _remove(path)
+            else:
+                entries.append((expires, path))
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self.max_size, 0)]:
+            _remove(path)
+    
+    def clear(self):
+        for name in os.listdir(self.directory):
+            _remove(os.path.join(self.directory, name))
+    
+    def size(self):
+        return sum(1 for name in os.listdir(self.directory) if name.endswith('.json'))
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class FragmentStats:
+    # Per-worker totals. `saved` is the render time recorded when each hit's
+    # fragment was rendered, i.e. the work the hit skipped.
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.render_seconds = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, hit, seconds):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.saved_seconds += seconds
+            else:
+                self.misses += 1
+                self.render_seconds += seconds
+    
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else 0,
+                'saved_ms': round(self.saved_seconds * 1000, 1),
+                'render_ms': round(self.render_seconds * 1000, 1),
+            }
+
+fragment_stats = FragmentStats()
+
+class FragmentCacheExtension(Extension):
+    # {% cache key[, ttl] %}...{% endcache %}. The stored key adds the
+    # template and line, so equal keys in different blocks never collide,
+    # and the catalog generation, so admin edits invalidate every fragment.
+    # Only cache markup that is the same for every user.
+    tags = {'cache'}
+    
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(f'{parser.name}:{lineno}'), parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+    
+    def _render(self, location, key, ttl, caller):
+        return render(location, key, ttl, caller)
+
+def init_app(app):
+    # FRAGMENT_CACHE: 'lru' (per worker), 'filesystem' (shared, in
+    # FRAGMENT_CACHE_DIR), '' to render everything, or any object with
+    # get(key) / set(key, value, ttl).
+    app.config.setdefault('FRAGMENT_CACHE', 'lru')
+    app.config.setdefault('FRAGMENT_CACHE_TTL', 300)
+    app.config.setdefault('FRAGMENT_CACHE_SIZE', 500)
+    app.config.setdefault('FRAGMENT_CACHE_DIR', os.path.join(app.instance_path, 'fragments'))
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.extensions['fragment_cache'] = _make_store(app.config)
+    app.after_request(_report_saved)
+
+def _make_store(config):
+    kind = config['FRAGMENT_CACHE']
+    if not kind:
+        return None
+    if kind == 'lru':
+        return LRUStore(config['FRAGMENT_CACHE_SIZE'])
+    if kind == 'filesystem':
+        return FileSystemStore(config['FRAGMENT_CACHE_DIR'], config['FRAGMENT_CACHE_SIZE'])
+    if isinstance(kind, str):
+        raise ValueError(f'Unknown FRAGMENT_CACHE {kind!r}')
+    return kind
+
+def store():
+    return current_app.extensions.get('fragment_cache')
+
+def render(location, key, ttl, caller):
+    cache = store()
+    if cache is None:
+        return caller()
+    full_key = f'{location}:{key}:{get_catalog().generation}'
+    entry = cache.get(full_key)
+    if entry is not None:
+        body, seconds = entry
+        _record(True, seconds)
+        return Markup(body)
+    started = time.perf_counter()
+    body = caller()
+    seconds = time.perf_counter() - started
+    cache.set(full_key, [str(body), seconds], ttl or current_app.config['FRAGMENT_CACHE_TTL'])
+    _record(False, seconds)
+    return body
+
+def _record(hit, seconds):
+    fragment_stats.record(hit, seconds)
+    hits, misses, saved = g.get('fragment_cache', (0, 0, 0.0))
+    g.fragment_cache = (hits + hit, misses + (not hit), saved + (seconds if hit else 0))
+
+def _report_saved(response):
+    # Registered after instrumentation, so Flask runs it first and the entry
+    # makes it into the Server-Timing header.
+    totals = g.pop('fragment_cache', None)
+    if totals is not None:
+        hits, misses, saved = totals
+        instrumentation.add_timing('fragments', saved * 1000, f'saved; {hits} hits, {misses} misses')
+    return response
+
+def stats():
+    cache = store()
+    size = cache.size() if hasattr(cache, 'size') else None
+    return dict(fragment_stats.stats(), store=type(cache).__name__ if cache is not None else None, size=size)
+
+def clear():
+    cache = store()
+    if cache is not None:
+        cache.clear()
@@ -0,0 +1,14 @@
+from extensions import db
+from models import CacheGeneration
+from services.sql import upsert
+
+def current_generation(name):
+    return db.session.query(CacheGeneration.generation).filter_by(name=name).scalar() or 0
+
+def bump_generation(connection, names):
+    # Runs inside the writer's transaction, so every worker sees the new
+    # generation exactly when the change itself becomes visible.
+    table = CacheGeneration.__table__
+    upsert(connection, table, [{'name': name, 'generation': 1} for name in sorted(set(names))], ['name'], lambda excluded: {
+        'generation': table.c.generation + 1,
+    })
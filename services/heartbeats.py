@@ -0,0 +1,183 @@
+import atexit
+import math
+import os
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import case, func, tuple_
+from extensions import db
+from models import UserProgress
+from services import metrics, progress
+from services.sql import add_missing_columns, insert_missing, upsert
+
+class HeartbeatQueue:
+    # Per-worker write-behind buffer. A newer heartbeat for the same
+    # (user, video) replaces the pending one, so a flush writes one row per
+    # viewer however often the players report.
+    def __init__(self):
+        self.received = 0
+        self.written = 0
+        self.failures = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._app = None
+    
+    def put(self, row):
+        key = (row['user_id'], row['video_id'])
+        with self._lock:
+            previous = self._pending.get(key)
+            if previous is not None:
+                row['watched_percent'] = max(row['watched_percent'], previous['watched_percent'])
+            self._pending[key] = row
+            self.received += 1
+            full = len(self._pending) >= current_app.config['HEARTBEAT_MAX_PENDING']
+        if not current_app.config['HEARTBEAT_FLUSH_INTERVAL']:
+            self.flush()
+            return
+        self._start()
+        if full:
+            self._wakeup.set()
+    
+    def pending(self, user_id, video_id):
+        with self._lock:
+            return self._pending.get((user_id, video_id))
+    
+    def flush(self):
+        with self._lock:
+            rows, self._pending = list(self._pending.values()), {}
+        if not rows:
+            return 0
+        try:
+            write(rows)
+        except Exception:
+            # Put the batch back under anything newer that arrived meanwhile.
+            with self._lock:
+                self.failures += 1
+                for row in rows:
+                    self._pending.setdefault((row['user_id'], row['video_id']), row)
+            raise
+        with self._lock:
+            self.written += len(rows)
+        return len(rows)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'received': self.received,
+                'written': self.written,
+                'failures': self.failures,
+            }
+    
+    def _start(self):
+        # Lazily, so every forked worker runs its own flusher.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._app = current_app._get_current_object()
+            threading.Thread(target=self._run, name='heartbeat-flush', daemon=True).start()
+            atexit.register(self._flush_logged)
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._app.config['HEARTBEAT_FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            self._flush_logged()
+    
+    def _flush_logged(self):
+        with self._app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                self._app.logger.exception('heartbeat flush failed')
+
+queue = HeartbeatQueue()
+
+def init_app(app):
+    # Seconds between player reports, and between batched writes per worker
+    # (0 writes every heartbeat immediately: tests, small installs).
+    app.config.setdefault('HEARTBEAT_INTERVAL', 15)
+    app.config.setdefault('HEARTBEAT_FLUSH_INTERVAL', 10)
+    app.config.setdefault('HEARTBEAT_MAX_PENDING', 5000)
+    app.config.setdefault('VIDEO_COMPLETE_PERCENT', 90)
+
+def ensure_heartbeats():
+    with db.engine.begin() as connection:
+        add_missing_columns(connection, UserProgress.__table__)
+
+def record(user_id, video_id, position, duration):
+    # Returns the watched percentage, or None for a report that makes no sense.
+    if not (math.isfinite(position) and math.isfinite(duration)) or position < 0 or duration <= 0:
+        return None
+    percent = round(min(100.0, position * 100 / duration), 1)
+    queue.put({
+        'user_id': user_id,
+        'video_id': video_id,
+        'completed': False,
+        'position_seconds': int(min(position, duration)),
+        'watched_percent': percent,
+        'last_watched_at': datetime.utcnow(),
+    })
+    return percent
+
+def resume_position(progress_row, user_id, video_id):
+    pending = queue.pending(user_id, video_id)
+    if pending is not None:
+        return pending['position_seconds']
+    if progress_row is None:
+        return 0
+    return progress_row.position_seconds or 0
+
+def write(rows):
+    table = UserProgress.__table__
+    threshold = current_app.config['VIDEO_COMPLETE_PERCENT']
+    with db.engine.begin() as connection:
+        upsert(connection, table, rows, ['user_id', 'video_id'], lambda excluded: {
+            'position_seconds': excluded.position_seconds,
+            'watched_percent': case(
+                (excluded.watched_percent > func.coalesce(table.c.watched_percent, 0), excluded.watched_percent),
+                else_=table.c.watched_percent,
+            ),
+            'last_watched_at': excluded.last_watched_at,
+        })
+        keys = [(row['user_id'], row['video_id']) for row in rows if row['watched_percent'] >= threshold]
+        if not keys:
+            return
+        # The completed filter makes concurrent flushes agree on who completed
+        # a video, so the rollups count each completion once.
+        completed = connection.execute(table.update().where(
+            tuple_(table.c.user_id, table.c.video_id).in_(keys),
+            table.c.completed.isnot(True),
+        ).values(completed=True, completed_at=datetime.utcnow()).returning(table.c.user_id, table.c.video_id)).all()
+        if completed:
+            progress.apply_deltas(connection, {(user_id, video_id): 1 for user_id, video_id in completed})
+    metrics.videos_completed(len(completed), 'player')
+
+def set_completed(user_id, video_id, completed):
+    # The "Marcar como concluído" button. One conditional UPDATE or INSERT, so
+    # a double submit changes the row (and the rollups) at most once.
+    table = UserProgress.__table__
+    connection = db.session.connection()
+    values = {'completed': completed, 'completed_at': datetime.utcnow() if completed else None}
+    if not completed:
+        # Watching past the threshold again completes it again.
+        values['watched_percent'] = 0
+    changed = connection.execute(table.update().where(
+        table.c.user_id == user_id,
+        table.c.video_id == video_id,
+        table.c.completed.isnot(True) if completed else table.c.completed.is_(True),
+    ).values(values)).rowcount > 0
+    if not changed:
+        changed = insert_missing(connection, table, dict(values, user_id=user_id, video_id=video_id),
+                                 ['user_id', 'video_id']) and completed
+    if changed:
+        progress.apply_deltas(connection, {(user_id, video_id): 1 if completed else -1})
+    db.session.commit()
+    if changed and completed:
+        metrics.videos_completed(1, 'button')
+    return changed
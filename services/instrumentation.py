@@ -0,0 +1,206 @@
+import hashlib
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Placeholder lists (expanded IN), quoted strings and numbers all fingerprint alike.
+_PARAM_LIST_RE = re.compile(r'\(\s*(?:\?|%\(\w+\)s|%s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|:\w+))*\s*\)')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE_RE = re.compile(r'\s+')
+SAMPLE_LENGTH = 300
+
+def fingerprint(statement):
+    # (short id, normalised SQL) for statements that differ only in their values.
+    normalised = _SPACE_RE.sub(' ', statement).strip()
+    normalised = _STRING_RE.sub('?', normalised)
+    normalised = _NUMBER_RE.sub('?', normalised)
+    normalised = _PARAM_LIST_RE.sub('(?)', normalised)
+    return hashlib.sha1(normalised.encode()).hexdigest()[:12], normalised[:SAMPLE_LENGTH]
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_seconds', 'shapes', 'samples', 'timings', 'bytes_saved')
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.shapes = Counter()
+        self.samples = {}
+        # Extra Server-Timing entries: (name, milliseconds, description).
+        self.timings = []
+        self.bytes_saved = 0
+    
+    def record(self, statement, seconds):
+        key, sample = fingerprint(statement)
+        self.queries += 1
+        self.db_seconds += seconds
+        self.shapes[key] += 1
+        self.samples.setdefault(key, sample)
+    
+    def repeated(self, threshold):
+        return [(key, count) for key, count in self.shapes.most_common() if count >= threshold]
+
+class EndpointStats:
+    # Per-worker totals by endpoint for the admin page.
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+    
+    def add(self, endpoint, stats, total_seconds, repeated):
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = self._endpoints[endpoint] = {
+                    'endpoint': endpoint, 'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'db_ms': 0.0,
+                    'queries': 0, 'max_queries': 0, 'n_plus_one': 0, 'shapes': {}, 'bytes_saved': 0,
+                }
+            entry['requests'] += 1
+            entry['total_ms'] += total_seconds * 1000
+            entry['max_ms'] = max(entry['max_ms'], total_seconds * 1000)
+            entry['db_ms'] += stats.db_seconds * 1000
+            entry['queries'] += stats.queries
+            entry['max_queries'] = max(entry['max_queries'], stats.queries)
+            entry['bytes_saved'] += stats.bytes_saved
+            if repeated:
+                entry['n_plus_one'] += 1
+            for key, count in repeated:
+                shape = entry['shapes'].setdefault(key, {'sql': stats.samples[key], 'requests': 0, 'max_repeats': 0})
+                shape['requests'] += 1
+                shape['max_repeats'] = max(shape['max_repeats'], count)
+    
+    def add_bytes_saved(self, endpoint, saved):
+        # Streamed responses finish after add() ran for their request.
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is not None:
+                entry['bytes_saved'] += saved
+    
+    def report(self, sort='total_ms'):
+        with self._lock:
+            rows = []
+            for entry in self._endpoints.values():
+                requests = entry['requests']
+                rows.append(dict(
+                    entry,
+                    avg_ms=entry['total_ms'] / requests,
+                    avg_db_ms=entry['db_ms'] / requests,
+                    avg_queries=entry['queries'] / requests,
+                    avg_kb_saved=entry['bytes_saved'] / requests / 1024,
+                    shapes=sorted(entry['shapes'].values(), key=lambda shape: -shape['max_repeats']),
+                ))
+        return sorted(rows, key=lambda row: -row[sort])
+    
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+endpoints = EndpointStats()
+SORTS = {
+    'total_ms': 'Tempo total',
+    'avg_ms': 'Tempo médio',
+    'avg_queries': 'Consultas por requisição',
+    'avg_db_ms': 'Tempo no banco por requisição',
+    'n_plus_one': 'Requisições com N+1',
+    'avg_kb_saved': 'Economia da compressão',
+}
+
+def init_app(app):
+    # Opt-in: with it off no listener is installed and requests pay nothing.
+    app.config.setdefault('SQL_INSTRUMENTATION', False)
+    app.config.setdefault('SQL_REPEAT_THRESHOLD', 5)
+    app.extensions['sql_instrumentation'] = app.config['SQL_INSTRUMENTATION']
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+def enabled(app):
+    return app.extensions.get('sql_instrumentation', False)
+
+def current():
+    # This request's RequestStats, or None outside instrumented requests.
+    return g.get('sql_stats') if has_app_context() else None
+
+def add_timing(name, milliseconds, description=None):
+    stats = current()
+    if stats is not None:
+        stats.timings.append((name, milliseconds, description))
+
+def add_bytes_saved(saved):
+    stats = current()
+    if stats is not None:
+        stats.bytes_saved += saved
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    stats = current()
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+def _start_request():
+    g.sql_stats = RequestStats()
+
+def _finish_request(response):
+    from flask import current_app
+    
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats.started
+    repeated = stats.repeated(current_app.config['SQL_REPEAT_THRESHOLD'])
+    endpoint = request.endpoint or '<unmatched>'
+    endpoints.add(endpoint, stats, total, repeated)
+    for key, count in repeated:
+        current_app.logger.warning('N+1 on %s: %d x %s', endpoint, count, stats.samples[key])
+    
+    entries = [f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"']
+    entries += [
+        f'{name};dur={milliseconds:.1f}' + (f';desc="{description}"' if description else '')
+        for name, milliseconds, description in stats.timings
+    ]
+    entries.append(f'app;dur={total * 1000:.1f}')
+    response.headers.add('Server-Timing', ', '.join(entries))
+    return response
+
+class QueryLog(list):
+    # Statements run inside count_queries(); len() is the count.
+    def shapes(self):
+        return Counter(fingerprint(statement)[1] for statement in self)
+
+@contextmanager
+def count_queries():
+    # Works whether or not SQL_INSTRUMENTATION is on; only this thread counts.
+    log = QueryLog()
+    thread = threading.get_ident()
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            log.append(statement)
+    
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        yield log
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+
+@contextmanager
+def assert_max_queries(limit):
+    # with assert_max_queries(3): client.get('/videoaulas/watch/1')
+    with count_queries() as log:
+        yield log
+    if len(log) > limit:
+        repeated = [f'{count} x {sql}' for sql, count in log.shapes().most_common() if count > 1]
+        details = '\n'.join(repeated or log)
+        raise AssertionError(f'{len(log)} queries, expected at most {limit}:\n{details}')
@@ -0,0 +1,207 @@
+import math
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import and_, or_, select
+from extensions import db
+from models import QuizAttempt, ItemAnalysisState, ItemOptionStatistic
+from services.quiz_cache import OPTIONS, compiled_quiz
+from services.responses import BLANK, CHOICES, answer_matrix
+from services.sql import insert_missing, upsert
+
+CHUNK_SIZE = 2000
+# Attempts finished more recently than this are left for the next run, so a
+# submit still committing cannot slip behind the watermark.
+SETTLE_TIME = timedelta(seconds=60)
+# Column per choice: A-E, then blank.
+_CODES = tuple(range(len(OPTIONS))) + (BLANK,)
+
+class OptionStatistics:
+    def __init__(self, letter, text, responses, total_sum, attempts, is_key):
+        self.letter = letter
+        self.text = text
+        self.responses = responses
+        self.rate = responses / attempts if attempts else 0
+        self.mean_total = total_sum / responses if responses else None
+        self.is_key = is_key
+
+class ItemStatistics:
+    def __init__(self, position, question, options, attempts, mean_total, std_total):
+        self.position = position
+        self.question = question
+        self.options = options
+        self.blank = options[-1]
+        key = next((option for option in options if option.is_key), None)
+        correct = key.responses if key else 0
+        self.p_value = correct / attempts if attempts else None
+        self.discrimination = None
+        if key and 0 < correct < attempts and std_total:
+            # Point-biserial between item correctness and the attempt's total.
+            others = (mean_total * attempts - key.mean_total * correct) / (attempts - correct)
+            p = correct / attempts
+            self.discrimination = (key.mean_total - others) / std_total * math.sqrt(p * (1 - p))
+        self.weak_distractors = [
+            option for option in options[:-1]
+            if not option.is_key and option.text and key and key.mean_total is not None
+            and option.mean_total is not None and option.mean_total >= key.mean_total
+        ]
+    
+    @property
+    def flags(self):
+        flags = []
+        if self.p_value is not None and self.p_value < 0.2:
+            flags.append('muito difícil')
+        if self.p_value is not None and self.p_value > 0.9:
+            flags.append('muito fácil')
+        if self.discrimination is not None and self.discrimination < 0.2:
+            flags.append('baixa discriminação')
+        if self.weak_distractors:
+            flags.append('distrator atrai bons alunos')
+        return flags
+
+class QuizAnalysis:
+    def __init__(self, compiled, state, items):
+        self.compiled = compiled
+        self.attempts = state.attempts
+        self.updated_at = state.updated_at
+        self.items = items
+        self.mean_total = state.total_sum / state.attempts if state.attempts else 0
+        self.std_total = _std(state)
+        self.reliability = None
+        k = len(items)
+        if k > 1 and self.std_total:
+            # KR-20 from the item p-values and the total-score variance.
+            pq = sum(item.p_value * (1 - item.p_value) for item in items if item.p_value is not None)
+            self.reliability = k / (k - 1) * (1 - pq / self.std_total ** 2)
+
+def _std(state):
+    if not state.attempts:
+        return 0
+    mean = state.total_sum / state.attempts
+    return math.sqrt(max(state.total_sq_sum / state.attempts - mean * mean, 0))
+
+def quiz_analysis(quiz_id, rebuild=False, chunk_size=CHUNK_SIZE):
+    compiled = compiled_quiz(quiz_id)
+    state = db.session.get(ItemAnalysisState, quiz_id)
+    if state is None or rebuild or state.version != compiled.version:
+        state = _reset(quiz_id, compiled.version, rebuild)
+    state = _fold_new_attempts(compiled, state, chunk_size)
+    return _analysis(compiled, state)
+
+def _reset(quiz_id, version, rebuild):
+    # Workers building the same quiz at once: the row is created without a
+    # conflict, then locked, and whoever comes second finds it already reset.
+    insert_missing(db.session.connection(), ItemAnalysisState.__table__,
+                   {'quiz_id': quiz_id, 'version': ''}, ['quiz_id'])
+    state = db.session.execute(
+        select(ItemAnalysisState).where(ItemAnalysisState.quiz_id == quiz_id).with_for_update(),
+        execution_options={'populate_existing': True},
+    ).scalar_one()
+    if state.version == version and not rebuild:
+        db.session.commit()
+        return state
+    table = ItemOptionStatistic.__table__
+    db.session.execute(table.delete().where(table.c.quiz_id == quiz_id))
+    state.version = version
+    state.last_finished_at = None
+    state.last_attempt_id = 0
+    state.attempts = 0
+    state.total_sum = state.total_sq_sum = 0
+    state.updated_at = datetime.utcnow()
+    db.session.commit()
+    return state
+
+def _new_attempts(quiz_id, state, cutoff, chunk_size):
+    # Keyset over (finished_at, id): regrades and late submits never reorder it.
+    query = select(QuizAttempt.id, QuizAttempt.finished_at, QuizAttempt.answers).where(
+        QuizAttempt.quiz_id == quiz_id,
+        QuizAttempt.completed.is_(True),
+        QuizAttempt.finished_at <= cutoff
+    ).order_by(QuizAttempt.finished_at, QuizAttempt.id).limit(chunk_size)
+    last_finished_at, last_id = state.last_finished_at, state.last_attempt_id
+    while True:
+        chunk = query
+        if last_finished_at is not None:
+            chunk = chunk.where(or_(
+                QuizAttempt.finished_at > last_finished_at,
+                and_(QuizAttempt.finished_at == last_finished_at, QuizAttempt.id > last_id)
+            ))
+        rows = db.session.execute(chunk).all()
+        if not rows:
+            return
+        yield rows
+        last_finished_at, last_id = rows[-1].finished_at, rows[-1].id
+
+def _fold_new_attempts(compiled, state, chunk_size):
+    key = np.array([CHOICES.get(answer, -2) for answer in compiled.answer_key], dtype=np.int8)
+    responses = np.zeros((len(compiled.question_ids), len(_CODES)), dtype=np.int64)
+    total_sums = np.zeros((len(compiled.question_ids), len(_CODES)), dtype=np.float64)
+    attempts, total_sum, total_sq_sum = 0, 0.0, 0.0
+    last = None
+    
+    cutoff = datetime.utcnow() - SETTLE_TIME
+    for rows in _new_attempts(compiled.quiz_id, state, cutoff, chunk_size):
+        matrix = answer_matrix(rows, compiled.question_ids)
+        totals = (matrix == key).sum(axis=1).astype(np.float64)
+        for column, code in enumerate(_CODES):
+            chosen = matrix == code
+            responses[:, column] += chosen.sum(axis=0)
+            total_sums[:, column] += totals @ chosen
+        attempts += len(rows)
+        total_sum += float(totals.sum())
+        total_sq_sum += float((totals ** 2).sum())
+        last = rows[-1]
+    
+    if last is None:
+        return state
+    
+    # Only the run that still sees the watermark it started from may add its sums.
+    table = ItemAnalysisState.__table__
+    result = db.session.execute(table.update().where(
+        table.c.quiz_id == compiled.quiz_id,
+        table.c.version == state.version,
+        table.c.last_attempt_id == state.last_attempt_id
+    ).values(
+        last_finished_at=last.finished_at,
+        last_attempt_id=last.id,
+        attempts=table.c.attempts + attempts,
+        total_sum=table.c.total_sum + total_sum,
+        total_sq_sum=table.c.total_sq_sum + total_sq_sum,
+        updated_at=datetime.utcnow(),
+    ))
+    if result.rowcount:
+        options = ItemOptionStatistic.__table__
+        upsert(db.session.connection(), options, [
+            {'quiz_id': compiled.quiz_id, 'question_id': question_id, 'choice': code,
+             'responses': int(responses[row, column]), 'total_sum': float(total_sums[row, column])}
+            for row, question_id in enumerate(compiled.question_ids)
+            for column, code in enumerate(_CODES) if responses[row, column]
+        ], ['quiz_id', 'question_id', 'choice'], lambda excluded: {
+            'responses': options.c.responses + excluded.responses,
+            'total_sum': options.c.total_sum + excluded.total_sum,
+        })
+        db.session.commit()
+    else:
+        db.session.rollback()
+    db.session.expire(state)
+    return db.session.get(ItemAnalysisState, compiled.quiz_id)
+
+def _analysis(compiled, state):
+    rows = {
+        (row.question_id, row.choice): row
+        for row in ItemOptionStatistic.query.filter_by(quiz_id=compiled.quiz_id)
+    }
+    mean_total = state.total_sum / state.attempts if state.attempts else 0
+    std_total = _std(state)
+    items = []
+    for position, question in enumerate(compiled.questions, start=1):
+        options = []
+        for code in _CODES:
+            row = rows.get((question.id, code))
+            letter = OPTIONS[code] if code != BLANK else ''
+            text = getattr(question, f'option_{letter.lower()}') if letter else 'Em branco'
+            options.append(OptionStatistics(
+                letter, text, row.responses if row else 0, row.total_sum if row else 0,
+                state.attempts, letter == question.correct_answer
+            ))
+        items.append(ItemStatistics(position, question, options, state.attempts, mean_total, std_total))
+    return QuizAnalysis(compiled, state, items)
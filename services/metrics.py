@@ -0,0 +1,160 @@
+import hmac
+import os
+import threading
+import time
+from flask import Response, abort, current_app, g, request
+from flask_login import current_user
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+# With PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py does it) every worker
+# writes its samples to mmap'd files there and /metrics sums all of them.
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ['blueprint', 'endpoint', 'method'],
+)
+REQUESTS = Counter(
+    'http_requests_total', 'Responses by endpoint and status.', ['blueprint', 'endpoint', 'method', 'status'],
+)
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being handled.', ['blueprint'], multiprocess_mode='livesum',
+)
+POOL_WAIT = Histogram(
+    'db_pool_checkout_seconds', 'Time to get a connection from the pool (waiting or connecting).',
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+)
+POOL_TIMEOUTS = Counter('db_pool_timeouts_total', 'Checkouts that gave up after pool_timeout.')
+POOL_SIZE = Gauge('db_pool_size', 'Configured pool_size.', multiprocess_mode='livesum')
+POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Connections in use.', multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('db_pool_overflow', 'Connections open beyond pool_size.', multiprocess_mode='livesum')
+CACHE_LOOKUPS = Counter('cache_lookups_total', 'Per-worker cache lookups.', ['cache', 'result'])
+FRAGMENT_SAVED = Counter('fragment_cache_saved_seconds_total', 'Render time skipped by {% cache %} hits.')
+QUIZ_SUBMISSIONS = Counter('quiz_submissions_total', 'Quiz attempts submitted.')
+VIDEO_COMPLETIONS = Counter('video_completions_total', 'Videos marked completed.', ['source'])
+COMPRESSION_INPUT = Counter('http_compression_input_bytes_total', 'Response bytes before compression.', ['encoding'])
+COMPRESSION_OUTPUT = Counter('http_compression_output_bytes_total', 'Response bytes after compression.', ['encoding'])
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that reports checkout time and occupancy. _do_get and
+    # _do_return_conn are the hooks QueuePool itself implements.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        POOL_SIZE.set(self.size())
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started)
+            self._report()
+    
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._report()
+    
+    def _report(self):
+        POOL_CHECKED_OUT.set(self.checkedout())
+        POOL_OVERFLOW.set(max(self.overflow(), 0))
+
+class CacheCounters:
+    # The caches keep their own hit/miss totals; this forwards what grew since
+    # the last sync, so they need no knowledge of Prometheus.
+    def __init__(self):
+        self._seen = {}
+        self._lock = threading.Lock()
+    
+    def sync(self):
+        from services import user_cache, quiz_cache
+        from services.fragment_cache import fragment_stats
+        
+        fragments = fragment_stats.stats()
+        with self._lock:
+            for name, stats in (('user', user_cache.stats()), ('quiz', quiz_cache.stats()), ('fragment', fragments)):
+                for result in ('hits', 'misses'):
+                    delta = stats[result] - self._seen.get((name, result), 0)
+                    if delta > 0:
+                        CACHE_LOOKUPS.labels(name, result).inc(delta)
+                    self._seen[(name, result)] = stats[result]
+            delta = fragments['saved_ms'] - self._seen.get('fragment_saved_ms', 0)
+            if delta > 0:
+                FRAGMENT_SAVED.inc(delta / 1000)
+            self._seen['fragment_saved_ms'] = fragments['saved_ms']
+
+caches = CacheCounters()
+
+def init_app(app):
+    # Called before db.init_app: the engine is built with TimedQueuePool.
+    # /metrics is closed by default: a scraper sends METRICS_TOKEN as a bearer
+    # token, admins can open it logged in, and METRICS_PUBLIC opens it to all.
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.config.setdefault('METRICS_PUBLIC', False)
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if uri and not _in_memory(uri):
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).setdefault('poolclass', TimedQueuePool)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+def _in_memory(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def _labels():
+    return request.blueprint or '', request.endpoint or '<unmatched>'
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    IN_FLIGHT.labels(request.blueprint or '').inc()
+
+def _finish_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        blueprint, endpoint = _labels()
+        REQUEST_LATENCY.labels(blueprint, endpoint, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(blueprint, endpoint, request.method, str(response.status_code)).inc()
+        caches.sync()
+    return response
+
+def _end_request(exc):
+    if g.pop('metrics_started', None) is not None:
+        IN_FLIGHT.labels(request.blueprint or '').dec()
+
+def quiz_submitted():
+    QUIZ_SUBMISSIONS.inc()
+
+def videos_completed(count, source):
+    if count:
+        VIDEO_COMPLETIONS.labels(source).inc(count)
+
+def compressed(encoding, size, compressed_size):
+    COMPRESSION_INPUT.labels(encoding).inc(size)
+    COMPRESSION_OUTPUT.labels(encoding).inc(compressed_size)
+
+def _registry():
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def _authorized(config):
+    if config['METRICS_PUBLIC']:
+        return True
+    token = config['METRICS_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return current_user.is_authenticated and current_user.is_admin
+
+def metrics_view():
+    if not _authorized(current_app.config):
+        # Without a token there is nothing to retry with, so the page is hidden.
+        abort(401 if current_app.config['METRICS_TOKEN'] else 404)
+    caches.sync()
+    return Response(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,139 @@
+from datetime import datetime
+from flask import current_app, request, url_for
+from itsdangerous import BadData, URLSafeSerializer
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from extensions import db
+from models import User
+from services.sql import create_missing_indexes
+
+PER_PAGE = 50
+
+class Sort:
+    # Keys are column expressions, optionally .desc(); the last one must be
+    # unique (the id) so every row has a distinct position. Keys must not be
+    # NULL: wrap nullable columns in coalesce().
+    def __init__(self, label, *keys):
+        self.label = label
+        self.keys = []
+        for key in keys:
+            descending = isinstance(key, UnaryExpression) and key.modifier is operators.desc_op
+            if isinstance(key, UnaryExpression) and key.modifier in (operators.desc_op, operators.asc_op):
+                key = key.element
+            self.keys.append((key, descending))
+    
+    def order_by(self, backwards=False):
+        return [
+            key.desc() if descending != backwards else key.asc()
+            for key, descending in self.keys
+        ]
+    
+    def after(self, values, backwards=False):
+        # Rows strictly past `values` in this order (before them when backwards).
+        directions = {descending != backwards for _, descending in self.keys}
+        if len(directions) == 1:
+            # One direction: a row-value comparison the index can seek on directly.
+            keys, bound = tuple_(*(key for key, _ in self.keys)), tuple_(*values)
+            return keys < bound if directions.pop() else keys > bound
+        clauses = []
+        for position, (key, descending) in enumerate(self.keys):
+            equal = [self.keys[i][0] == values[i] for i in range(position)]
+            past = key < values[position] if descending != backwards else key > values[position]
+            clauses.append(and_(*equal, past))
+        return or_(*clauses)
+
+class KeysetPage:
+    def __init__(self, items, sort_name, sorts, has_prev, has_next, first_key, last_key):
+        self.items = items
+        self.sort_name = sort_name
+        self.sorts = sorts
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self._first_key = first_key
+        self._last_key = last_key
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def __len__(self):
+        return len(self.items)
+    
+    @property
+    def sort(self):
+        return self.sorts[self.sort_name]
+    
+    @property
+    def prev_url(self):
+        return self._url(_encode(self.sort_name, 'prev', self._first_key)) if self.has_prev else None
+    
+    @property
+    def next_url(self):
+        return self._url(_encode(self.sort_name, 'next', self._last_key)) if self.has_next else None
+    
+    @property
+    def first_url(self):
+        return self._url(None)
+    
+    def _url(self, cursor):
+        args = request.args.to_dict()
+        args.pop('cursor', None)
+        if cursor:
+            args['cursor'] = cursor
+        return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+def _serializer():
+    return URLSafeSerializer(current_app.secret_key, salt='keyset-cursor')
+
+def _encode(sort_name, direction, values):
+    encoded = [{'dt': value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    return _serializer().dumps({'s': sort_name, 'd': direction, 'k': encoded})
+
+def _decode(token, sort_name):
+    # A cursor from another sort (or a tampered one) starts from the top.
+    try:
+        payload = _serializer().loads(token)
+    except BadData:
+        return None, None
+    if payload.get('s') != sort_name or payload.get('d') not in ('next', 'prev'):
+        return None, None
+    values = [datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value for value in payload['k']]
+    return payload['d'], values
+
+def paginate(query, sorts, default_sort=None, per_page=PER_PAGE):
+    # Seek pagination: every page is one indexed range scan of per_page + 1
+    # rows, however deep it is. `sorts` maps the `sort` request arg to Sort.
+    sort_name = request.args.get('sort')
+    if sort_name not in sorts:
+        sort_name = default_sort or next(iter(sorts))
+    sort = sorts[sort_name]
+    direction, values = None, None
+    if request.args.get('cursor'):
+        direction, values = _decode(request.args['cursor'], sort_name)
+        if values is not None and len(values) != len(sort.keys):
+            direction, values = None, None
+    backwards = direction == 'prev'
+    
+    keys = [key.label(f'_key{position}') for position, (key, _) in enumerate(sort.keys)]
+    query = query.add_columns(*keys).order_by(None).order_by(*sort.order_by(backwards))
+    if values is not None:
+        query = query.filter(sort.after(values, backwards))
+    rows = query.limit(per_page + 1).all()
+    
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    items = [row[0] for row in rows]
+    first_key = tuple(rows[0][1:]) if rows else None
+    last_key = tuple(rows[-1][1:]) if rows else None
+    if backwards:
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = values is not None, more
+    return KeysetPage(items, sort_name, sorts, has_prev and bool(rows), has_next and bool(rows), first_key, last_key)
+
+def ensure_listing_indexes():
+    # The quiz_attempts ones come with attempt_stats.ensure_attempt_indexes().
+    with db.engine.begin() as connection:
+        create_missing_indexes(connection, User.__table__)
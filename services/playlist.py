@@ -0,0 +1,62 @@
+import re
+from collections import defaultdict
+from extensions import db
+from models import VideoLesson
+
+YOUTUBE_RE = re.compile(r'(?:youtube\.com\/(?:[^\/]+\/.+\/|(?:v|e(?:mbed)?)\/|.*[?&]v=)|youtu\.be\/)([^"&?\/\s]{11})')
+VIMEO_RE = re.compile(r'vimeo\.com\/(?:.*\/)?(\d+)')
+
+def embed_url(url, video_type, start=None):
+    # `start` (seconds) only applies to a player URL built here; other links are returned as is.
+    if video_type == 'youtube':
+        match = YOUTUBE_RE.search(url)
+        if match:
+            resume = f'&start={start}' if start else ''
+            return f'https://www.youtube.com/embed/{match.group(1)}?rel=0&modestbranding=1&enablejsapi=1{resume}'
+    elif video_type == 'vimeo':
+        match = VIMEO_RE.search(url)
+        if match:
+            resume = f'#t={start}s' if start else ''
+            return f'https://player.vimeo.com/video/{match.group(1)}?dnt=1{resume}'
+    return url
+
+class PlaylistEntry:
+    # Plain copy of a VideoLesson row, linked to its neighbours in the module.
+    __slots__ = ('id', 'title', 'description', 'duration_minutes', 'order', 'module_id', 'module',
+                 'video_type', 'video_url', 'embed_url', 'position', 'prev', 'next')
+    
+    def __init__(self, video):
+        self.id = video.id
+        self.title = video.title
+        self.description = video.description
+        self.duration_minutes = video.duration_minutes
+        self.order = video.order
+        self.module_id = video.module_id
+        self.module = None
+        self.video_type = video.video_type
+        self.video_url = video.video_url
+        self.embed_url = embed_url(video.video_url, video.video_type)
+        self.position = 0
+        self.prev = None
+        self.next = None
+
+def sort_key(video):
+    # Same order as the module page; the id breaks ties between equal `order`s.
+    return (video.order or 0, video.title, video.id)
+
+def build_playlists():
+    # {module_id: [PlaylistEntry, ...]} for every module, in one query.
+    videos = db.session.query(
+        VideoLesson.id, VideoLesson.title, VideoLesson.description, VideoLesson.duration_minutes,
+        VideoLesson.order, VideoLesson.module_id, VideoLesson.video_url, VideoLesson.video_type,
+    ).all()
+    playlists = defaultdict(list)
+    for video in sorted(videos, key=sort_key):
+        playlists[video.module_id].append(PlaylistEntry(video))
+    for entries in playlists.values():
+        for position, entry in enumerate(entries):
+            entry.position = position
+            if position:
+                entry.prev = entries[position - 1]
+                entries[position - 1].next = entry
+    return playlists
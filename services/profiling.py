@@ -0,0 +1,289 @@
+import json
+import marshal
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app, g, request
+from flask_login import current_user
+
+REASONS = {'sample': 'Amostra', 'slow': 'Lenta', 'header': 'Cabeçalho'}
+# <started>-<pid>-<endpoint>-<duration>ms-<reason>.json, so the listing never opens the files.
+FILENAME_RE = re.compile(r'^(\d{8}T\d{12})-(\d+)-([\w.]+)-(\d+)ms-(sample|slow|header)\.json$')
+
+class Capture:
+    # Stack samples of one request thread, weighted by the seconds since the
+    # previous sample.
+    def __init__(self, thread, reason):
+        self.thread = thread
+        self.reason = reason
+        self.started_at = datetime.utcnow()
+        self.started = self.last = time.perf_counter()
+        self.status = None
+        self._frames = {}
+        self._samples = defaultdict(float)
+    
+    def add(self, frame, now):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            index = self._frames.get(code)
+            if index is None:
+                index = self._frames[code] = len(self._frames)
+            stack.append(index)
+            frame = frame.f_back
+        stack.reverse()
+        self._samples[tuple(stack)] += now - self.last
+        self.last = now
+    
+    def profile(self, endpoint, method, path, duration, interval):
+        frames = sorted(self._frames.items(), key=lambda item: item[1])
+        return {
+            'endpoint': endpoint,
+            'method': method,
+            'path': path,
+            'status': self.status,
+            'reason': self.reason,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(duration * 1000, 1),
+            'interval_ms': interval,
+            'pid': os.getpid(),
+            'frames': [[code.co_name, code.co_filename, code.co_firstlineno] for code, _ in frames],
+            'samples': [list(stack) for stack in self._samples],
+            'weights': [round(weight, 6) for weight in self._samples.values()],
+        }
+
+class Sampler:
+    # One thread per worker reads sys._current_frames() every interval while
+    # a captured request is running, and writes finished profiles to disk so
+    # the request itself never waits on the file.
+    def __init__(self):
+        self._active = {}
+        self._finished = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._app = None
+    
+    def begin(self, capture):
+        self._start()
+        with self._lock:
+            self._active[capture.thread] = capture
+        self._wakeup.set()
+    
+    def set_status(self, thread, status):
+        with self._lock:
+            capture = self._active.get(thread)
+            if capture is not None:
+                capture.status = status
+    
+    def end(self, thread):
+        with self._lock:
+            return self._active.pop(thread, None)
+    
+    def save(self, profile):
+        with self._lock:
+            self._finished.append(profile)
+        self._wakeup.set()
+    
+    def _start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._app = current_app._get_current_object()
+            threading.Thread(target=self._run, name='profile-sampler', daemon=True).start()
+    
+    def _run(self):
+        config = self._app.config
+        while True:
+            with self._lock:
+                # Under the lock: end() must not return a capture still being added to.
+                if self._active:
+                    frames = sys._current_frames()
+                    now = time.perf_counter()
+                    for capture in self._active.values():
+                        frame = frames.get(capture.thread)
+                        if frame is not None:
+                            capture.add(frame, now)
+                active = bool(self._active)
+                finished, self._finished = self._finished, []
+            for profile in finished:
+                try:
+                    write(config['PROFILE_DIR'], profile, config['PROFILE_KEEP'])
+                except OSError:
+                    self._app.logger.exception('could not save profile')
+            if active:
+                time.sleep(config['PROFILE_INTERVAL_MS'] / 1000)
+            else:
+                self._wakeup.wait()
+                self._wakeup.clear()
+
+sampler = Sampler()
+
+def init_app(app):
+    # Opt-in; with PROFILING off no hook is installed. When on, a request is
+    # captured if it is 1 of PROFILE_SAMPLE_RATE, carries PROFILE_HEADER from
+    # an admin, or (PROFILE_SLOW_MS > 0) every request is captured and kept
+    # only when it took longer than that.
+    app.config.setdefault('PROFILING', False)
+    app.config.setdefault('PROFILE_SAMPLE_RATE', 0)
+    app.config.setdefault('PROFILE_SLOW_MS', 0)
+    app.config.setdefault('PROFILE_HEADER', 'X-Profile')
+    app.config.setdefault('PROFILE_INTERVAL_MS', 5)
+    app.config.setdefault('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+    app.config.setdefault('PROFILE_KEEP', 200)
+    app.extensions['profiling'] = app.config['PROFILING']
+    if not app.config['PROFILING']:
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+
+def enabled(app):
+    return app.extensions.get('profiling', False)
+
+def _reason(config):
+    if request.headers.get(config['PROFILE_HEADER']) and current_user.is_authenticated and current_user.is_admin:
+        return 'header'
+    rate = config['PROFILE_SAMPLE_RATE']
+    if rate and random.randrange(rate) == 0:
+        return 'sample'
+    if config['PROFILE_SLOW_MS']:
+        return 'slow'
+    return None
+
+def _start_request():
+    reason = _reason(current_app.config)
+    if reason is not None:
+        g.profile_thread = threading.get_ident()
+        sampler.begin(Capture(g.profile_thread, reason))
+
+def _finish_request(response):
+    thread = g.get('profile_thread')
+    if thread is not None:
+        sampler.set_status(thread, response.status_code)
+    return response
+
+def _end_request(exc):
+    thread = g.pop('profile_thread', None)
+    if thread is None:
+        return
+    capture = sampler.end(thread)
+    if capture is None:
+        return
+    duration = time.perf_counter() - capture.started
+    config = current_app.config
+    if capture.reason == 'slow' and duration * 1000 < config['PROFILE_SLOW_MS']:
+        return
+    if exc is not None:
+        capture.status = 500
+    sampler.save(capture.profile(request.endpoint or 'unmatched', request.method, request.full_path.rstrip('?'),
+                                 duration, config['PROFILE_INTERVAL_MS']))
+
+def write(directory, profile, keep):
+    os.makedirs(directory, exist_ok=True)
+    started = datetime.fromisoformat(profile['started_at']).strftime('%Y%m%dT%H%M%S%f')
+    name = f"{started}-{profile['pid']}-{profile['endpoint']}-{int(profile['duration_ms'])}ms-{profile['reason']}.json"
+    handle, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'w') as f:
+        json.dump(profile, f, separators=(',', ':'))
+    os.replace(path, os.path.join(directory, name))
+    # Ring buffer: the oldest files go once there are more than `keep`.
+    names = sorted(name for name in os.listdir(directory) if FILENAME_RE.match(name))
+    for old in names[:max(len(names) - keep, 0)]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except FileNotFoundError:
+            pass
+    return name
+
+def list_profiles(directory):
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        match = FILENAME_RE.match(name)
+        if match:
+            started, pid, endpoint, duration, reason = match.groups()
+            profiles.append({
+                'name': name[:-len('.json')],
+                'started_at': datetime.strptime(started, '%Y%m%dT%H%M%S%f'),
+                'pid': int(pid),
+                'endpoint': endpoint,
+                'duration_ms': int(duration),
+                'reason': reason,
+            })
+    return sorted(profiles, key=lambda profile: profile['started_at'], reverse=True)
+
+def load(directory, name):
+    # None for anything that is not a profile file (including path tricks).
+    if not FILENAME_RE.match(name + '.json'):
+        return None
+    try:
+        with open(os.path.join(directory, name + '.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def clear(directory):
+    for profile in list_profiles(directory):
+        try:
+            os.remove(os.path.join(directory, profile['name'] + '.json'))
+        except FileNotFoundError:
+            pass
+
+def to_speedscope(profile):
+    title = f"{profile['method']} {profile['path']} ({profile['duration_ms']} ms)"
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': title,
+        'exporter': 'nerds-plantao',
+        'shared': {'frames': [{'name': name, 'file': file, 'line': line} for name, file, line in profile['frames']]},
+        'profiles': [{
+            'type': 'sampled',
+            'name': title,
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': round(sum(profile['weights']) * 1000, 3),
+            'samples': profile['samples'],
+            'weights': [round(weight * 1000, 3) for weight in profile['weights']],
+        }],
+    }
+
+def to_pstats(profile):
+    # marshal'd dict in the layout pstats.Stats (and snakeviz) load: sampled
+    # time stands in for measured time, sample counts for call counts.
+    keys = [(file, line, name) for name, file, line in profile['frames']]
+    stats = {}
+    
+    def entry(key):
+        if key not in stats:
+            stats[key] = [0, 0, 0.0, 0.0, {}]
+        return stats[key]
+    
+    for stack, weight in zip(profile['samples'], profile['weights']):
+        seen = set()
+        for depth, index in enumerate(stack):
+            key = keys[index]
+            row = entry(key)
+            leaf = depth == len(stack) - 1
+            if leaf:
+                row[2] += weight
+            if key not in seen:
+                seen.add(key)
+                row[0] += 1
+                row[1] += 1
+                row[3] += weight
+            if depth:
+                caller = keys[stack[depth - 1]]
+                calls = row[4].get(caller, (0, 0, 0.0, 0.0))
+                row[4][caller] = (calls[0] + 1, calls[1] + 1, calls[2] + (weight if leaf else 0), calls[3] + weight)
+    return marshal.dumps({key: (cc, nc, tt, ct, callers) for key, (cc, nc, tt, ct, callers) in stats.items()})
@@ -0,0 +1,168 @@
+from collections import defaultdict
+from sqlalchemy import event, exists, func, select
+from sqlalchemy.orm.attributes import get_history
+from extensions import db
+from models import User, Module, VideoLesson, UserProgress, UserProgressSummary, ModuleProgressSummary
+from services.sql import upsert
+
+def init_app(app):
+    if not event.contains(db.session, 'after_flush', _sync_after_flush):
+        event.listen(db.session, 'after_flush', _sync_after_flush)
+
+def ensure_progress_rollups():
+    if db.session.query(UserProgressSummary.user_id).first() is None and \
+            db.session.query(UserProgress.id).filter_by(completed=True).first() is not None:
+        rebuild_rollups()
+
+def module_progress(user_id, module_ids):
+    if not module_ids:
+        return {}
+    rows = db.session.query(ModuleProgressSummary.module_id, ModuleProgressSummary.completed_videos).filter(
+        ModuleProgressSummary.user_id == user_id,
+        ModuleProgressSummary.module_id.in_(module_ids)
+    ).all()
+    return {module_id: completed for module_id, completed in rows}
+
+def _completed_per_module(module_ids=None):
+    query = select(
+        UserProgress.user_id,
+        Module.discipline_id,
+        VideoLesson.module_id,
+        func.count(UserProgress.id),
+    ).join_from(UserProgress, VideoLesson, UserProgress.video_id == VideoLesson.id).join(
+        Module, VideoLesson.module_id == Module.id
+    ).where(UserProgress.completed.is_(True)).group_by(
+        UserProgress.user_id, Module.discipline_id, VideoLesson.module_id
+    )
+    if module_ids is not None:
+        query = query.where(VideoLesson.module_id.in_(module_ids))
+    return query
+
+def rebuild_rollups():
+    modules = ModuleProgressSummary.__table__
+    users = UserProgressSummary.__table__
+    db.session.execute(users.delete())
+    db.session.execute(modules.delete())
+    db.session.execute(modules.insert().from_select(
+        ['user_id', 'discipline_id', 'module_id', 'completed_videos'], _completed_per_module()
+    ))
+    db.session.execute(users.insert().from_select(
+        ['user_id', 'completed_videos'],
+        select(modules.c.user_id, func.sum(modules.c.completed_videos)).group_by(modules.c.user_id)
+    ))
+    db.session.commit()
+
+def _user_totals_for(modules, module_ids, user_column):
+    return select(func.coalesce(func.sum(modules.c.completed_videos), 0)).where(
+        modules.c.user_id == user_column,
+        modules.c.module_id.in_(module_ids)
+    ).scalar_subquery()
+
+def _recompute_modules(connection, module_ids):
+    # Set-based refresh of the given modules; user totals are adjusted by
+    # subtracting the old module rows and adding the recomputed ones back.
+    modules = ModuleProgressSummary.__table__
+    users = UserProgressSummary.__table__
+    module_ids = list(module_ids)
+    affected_users = select(modules.c.user_id).where(modules.c.module_id.in_(module_ids))
+    
+    connection.execute(users.update().where(users.c.user_id.in_(affected_users)).values(
+        completed_videos=users.c.completed_videos - _user_totals_for(modules, module_ids, users.c.user_id)
+    ))
+    connection.execute(modules.delete().where(modules.c.module_id.in_(module_ids)))
+    connection.execute(modules.insert().from_select(
+        ['user_id', 'discipline_id', 'module_id', 'completed_videos'], _completed_per_module(module_ids)
+    ))
+    connection.execute(users.update().where(users.c.user_id.in_(affected_users)).values(
+        completed_videos=users.c.completed_videos + _user_totals_for(modules, module_ids, users.c.user_id)
+    ))
+    connection.execute(users.insert().from_select(
+        ['user_id', 'completed_videos'],
+        select(modules.c.user_id, func.sum(modules.c.completed_videos)).where(
+            modules.c.module_id.in_(module_ids),
+            ~exists().where(users.c.user_id == modules.c.user_id)
+        ).group_by(modules.c.user_id)
+    ))
+
+def _apply_deltas(connection, deltas, stale_modules):
+    video_ids = {video_id for _, video_id in deltas}
+    locations = {
+        video_id: (module_id, discipline_id)
+        for video_id, module_id, discipline_id in connection.execute(
+            select(VideoLesson.id, VideoLesson.module_id, Module.discipline_id).join_from(
+                VideoLesson, Module, VideoLesson.module_id == Module.id
+            ).where(VideoLesson.id.in_(video_ids))
+        )
+    }
+    
+    module_deltas = defaultdict(int)
+    user_deltas = defaultdict(int)
+    for (user_id, video_id), delta in deltas.items():
+        location = locations.get(video_id)
+        # Videos that are gone or moved belong to a module that is recomputed anyway.
+        if not delta or location is None or location[0] in stale_modules:
+            continue
+        module_deltas[(user_id,) + location] += delta
+        user_deltas[user_id] += delta
+    
+    modules = ModuleProgressSummary.__table__
+    users = UserProgressSummary.__table__
+    upsert(connection, modules, [
+        {'user_id': user_id, 'module_id': module_id, 'discipline_id': discipline_id, 'completed_videos': delta}
+        for (user_id, module_id, discipline_id), delta in module_deltas.items() if delta
+    ], ['user_id', 'module_id'], lambda excluded: {
+        'completed_videos': modules.c.completed_videos + excluded.completed_videos,
+        'discipline_id': excluded.discipline_id,
+    })
+    upsert(connection, users, [
+        {'user_id': user_id, 'completed_videos': delta}
+        for user_id, delta in user_deltas.items() if delta
+    ], ['user_id'], lambda excluded: {
+        'completed_videos': users.c.completed_videos + excluded.completed_videos,
+    })
+
+def apply_deltas(connection, deltas):
+    # {(user_id, video_id): +1/-1} for Core writes to user_progress, which the
+    # flush hook below never sees.
+    _apply_deltas(connection, deltas, set())
+
+def _sync_after_flush(session, flush_context):
+    deltas = defaultdict(int)
+    stale_modules = set()
+    deleted_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    
+    for obj in session.new:
+        if isinstance(obj, UserProgress) and obj.completed:
+            deltas[(obj.user_id, obj.video_id)] += 1
+    
+    for obj in session.dirty:
+        if isinstance(obj, UserProgress):
+            history = get_history(obj, 'completed')
+            if history.has_changes():
+                was_completed = bool(history.deleted and history.deleted[0])
+                if was_completed != bool(obj.completed):
+                    deltas[(obj.user_id, obj.video_id)] += 1 if obj.completed else -1
+        elif isinstance(obj, VideoLesson):
+            history = get_history(obj, 'module_id')
+            if history.has_changes():
+                stale_modules.update(m for m in history.deleted + history.added if m is not None)
+        elif isinstance(obj, Module):
+            if get_history(obj, 'discipline_id').has_changes():
+                stale_modules.add(obj.id)
+    
+    for obj in session.deleted:
+        if isinstance(obj, VideoLesson):
+            stale_modules.add(obj.module_id)
+        elif isinstance(obj, Module):
+            stale_modules.add(obj.id)
+        elif isinstance(obj, UserProgress) and obj.completed and obj.user_id not in deleted_users:
+            deltas[(obj.user_id, obj.video_id)] -= 1
+    
+    if not deltas and not stale_modules:
+        return
+    
+    connection = session.connection()
+    if deltas:
+        _apply_deltas(connection, deltas, stale_modules)
+    if stale_modules:
+        _recompute_modules(connection, stale_modules)
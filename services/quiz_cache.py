@@ -0,0 +1,125 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import get_history
+from extensions import db
+from models import Quiz, Question
+from services.generations import current_generation, bump_generation
+
+OPTIONS = ('A', 'B', 'C', 'D', 'E')
+
+class CompiledQuestion:
+    # Plain copy of a Question row; templates use the same attribute names.
+    __slots__ = ('id', 'text', 'option_a', 'option_b', 'option_c', 'option_d', 'option_e',
+                 'correct_answer', 'explanation', 'order')
+    
+    def __init__(self, question):
+        for attr in self.__slots__:
+            setattr(self, attr, getattr(question, attr))
+        self.correct_answer = (question.correct_answer or '').upper()
+
+class CompiledQuiz:
+    def __init__(self, quiz_id, generation, questions):
+        self.quiz_id = quiz_id
+        self.generation = generation
+        self.questions = tuple(questions)
+        self.question_ids = tuple(question.id for question in self.questions)
+        self.field_names = tuple(f'question_{question_id}' for question_id in self.question_ids)
+        self.answer_key = tuple(question.correct_answer for question in self.questions)
+        digest = hashlib.sha1()
+        for question in self.questions:
+            digest.update(repr((question.id, question.text, question.option_a, question.option_b, question.option_c,
+                                question.option_d, question.option_e, question.correct_answer)).encode('utf-8'))
+        self.version = digest.hexdigest()[:16]
+    
+    def grade(self, form):
+        responses = [form.get(name, '') for name in self.field_names]
+        correct_count = sum(map(str.__eq__, [response.upper() for response in responses], self.answer_key))
+        answers = dict(zip(map(str, self.question_ids), responses))
+        return answers, correct_count
+    
+    def score(self, correct_count):
+        return (correct_count / len(self.questions)) * 100 if self.questions else 0
+
+class QuizCache:
+    # Per-worker LRU of compiled quizzes. Entries are checked against the
+    # quiz's generation, which admin question writes bump in-transaction.
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, quiz_id):
+        generation = current_generation(generation_name(quiz_id))
+        with self._lock:
+            compiled = self._entries.get(quiz_id)
+            if compiled is not None and compiled.generation == generation:
+                self.hits += 1
+                self._entries.move_to_end(quiz_id)
+                return compiled
+            self.misses += 1
+        
+        compiled = _compile(quiz_id, generation)
+        with self._lock:
+            self._entries[quiz_id] = compiled
+            self._entries.move_to_end(quiz_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return compiled
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_ratio': round(self.hits / total, 4) if total else 0,
+            }
+
+cache = QuizCache()
+
+def init_app(app):
+    app.config.setdefault('QUIZ_CACHE_SIZE', 256)
+    cache.max_size = app.config['QUIZ_CACHE_SIZE']
+    if not event.contains(db.session, 'after_flush', _bump_after_flush):
+        event.listen(db.session, 'after_flush', _bump_after_flush)
+
+def generation_name(quiz_id):
+    return f'quiz:{quiz_id}'
+
+def compiled_quiz(quiz_id):
+    return cache.get(quiz_id)
+
+def stats():
+    return cache.stats()
+
+def _compile(quiz_id, generation):
+    questions = Question.query.filter_by(quiz_id=quiz_id).order_by(Question.order, Question.id).all()
+    return CompiledQuiz(quiz_id, generation, [CompiledQuestion(question) for question in questions])
+
+def _bump_after_flush(session, flush_context):
+    quiz_ids = set()
+    for obj in session.new:
+        if isinstance(obj, Question):
+            quiz_ids.add(obj.quiz_id)
+    for obj in session.dirty:
+        if isinstance(obj, Question) and session.is_modified(obj, include_collections=False):
+            history = get_history(obj, 'quiz_id')
+            quiz_ids.update(history.sum())
+    for obj in session.deleted:
+        if isinstance(obj, Question):
+            quiz_ids.add(obj.quiz_id)
+        elif isinstance(obj, Quiz):
+            quiz_ids.add(obj.id)
+    
+    quiz_ids.discard(None)
+    if quiz_ids:
+        bump_generation(session.connection(), [generation_name(quiz_id) for quiz_id in quiz_ids])
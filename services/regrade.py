@@ -0,0 +1,182 @@
+import heapq
+import json
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from sqlalchemy import bindparam, case, func, literal, select
+from extensions import db
+from models import QuizAttempt, QuestionResponse, RegradeJob
+from services import score_stats
+from services.quiz_cache import compiled_quiz
+from services.responses import BLANK, CHOICES, answer_matrix
+
+CHUNK_SIZE = 2000
+SAMPLE_SIZE = 20
+# A running job that has not reported progress for this long is assumed dead.
+STALE_AFTER = timedelta(minutes=10)
+
+_NO_KEY = -2
+
+class RegradeSummary:
+    def __init__(self):
+        self.improved = 0
+        self.worsened = 0
+        self.delta_sum = 0.0
+        self.min_delta = 0.0
+        self.max_delta = 0.0
+        self.samples = []
+    
+    def add(self, attempt_ids, user_ids, old_scores, new_scores):
+        deltas = new_scores - old_scores
+        self.improved += int((deltas > 0).sum())
+        self.worsened += int((deltas < 0).sum())
+        self.delta_sum += float(deltas.sum())
+        self.min_delta = min(self.min_delta, float(deltas.min()))
+        self.max_delta = max(self.max_delta, float(deltas.max()))
+        candidates = self.samples + [
+            {'attempt_id': int(a), 'user_id': int(u), 'old_score': float(o), 'new_score': float(n)}
+            for a, u, o, n in zip(attempt_ids, user_ids, old_scores, new_scores)
+        ]
+        self.samples = heapq.nlargest(SAMPLE_SIZE, candidates, key=lambda s: abs(s['new_score'] - s['old_score']))
+    
+    def to_dict(self):
+        return {
+            'improved': self.improved,
+            'worsened': self.worsened,
+            'delta_sum': round(self.delta_sum, 4),
+            'min_delta': round(self.min_delta, 4),
+            'max_delta': round(self.max_delta, 4),
+            'samples': self.samples,
+        }
+
+def active_job(quiz_id):
+    job = RegradeJob.query.filter(
+        RegradeJob.quiz_id == quiz_id,
+        RegradeJob.status.in_(('pending', 'running'))
+    ).order_by(RegradeJob.id.desc()).first()
+    if job is not None and datetime.utcnow() - (job.updated_at or job.created_at) > STALE_AFTER:
+        job.status = 'failed'
+        job.error = 'Interrompido sem concluir.'
+        db.session.commit()
+        return None
+    return job
+
+def start_job(quiz_id, dry_run=True):
+    job = RegradeJob(quiz_id=quiz_id, dry_run=dry_run, status='pending', updated_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    app = current_app._get_current_object()
+    threading.Thread(target=_run_in_thread, args=(app, job.id), daemon=True, name=f'regrade-{job.id}').start()
+    return job
+
+def _run_in_thread(app, job_id):
+    with app.app_context():
+        run_job(job_id)
+
+def run_job(job_id, chunk_size=CHUNK_SIZE, on_progress=None):
+    job = db.session.get(RegradeJob, job_id)
+    job.status = 'running'
+    job.started_at = job.updated_at = datetime.utcnow()
+    job.total_attempts = QuizAttempt.query.filter_by(quiz_id=job.quiz_id, completed=True).count()
+    db.session.commit()
+    
+    try:
+        summary = RegradeSummary()
+        for processed, changed in regrade_quiz(job.quiz_id, dry_run=job.dry_run, chunk_size=chunk_size, summary=summary):
+            job.processed = processed
+            job.changed = changed
+            job.summary = json.dumps(summary.to_dict())
+            job.updated_at = datetime.utcnow()
+            db.session.commit()
+            if on_progress:
+                on_progress(job)
+        job.status = 'done'
+    except Exception as exc:
+        db.session.rollback()
+        current_app.logger.exception('Regrade job %s failed', job_id)
+        job = db.session.get(RegradeJob, job_id)
+        job.status = 'failed'
+        job.error = str(exc)
+    job.finished_at = job.updated_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+def _chunks(quiz_id, chunk_size):
+    # Keyset over (quiz_id, id) so each chunk is an index range, never an OFFSET scan.
+    query = select(
+        QuizAttempt.id,
+        QuizAttempt.user_id,
+        QuizAttempt.answers,
+        QuizAttempt.score,
+        QuizAttempt.correct_answers,
+        QuizAttempt.total_questions,
+        QuizAttempt.time_spent_seconds,
+        QuizAttempt.finished_at,
+    ).where(QuizAttempt.quiz_id == quiz_id, QuizAttempt.completed.is_(True)).order_by(QuizAttempt.id).limit(chunk_size)
+    last_id = 0
+    while True:
+        rows = db.session.execute(query.where(QuizAttempt.id > last_id)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+def key_vector(compiled):
+    return np.array([CHOICES.get(answer, _NO_KEY) for answer in compiled.answer_key], dtype=np.int8)
+
+def _responses_update(compiled, key):
+    # Flags each stored response against the current key; rows already right are left alone.
+    responses = QuestionResponse.__table__
+    expected = case(dict(zip(compiled.question_ids, key.tolist())), value=responses.c.question_id, else_=_NO_KEY) \
+        if compiled.question_ids else literal(_NO_KEY)
+    is_correct = func.coalesce(responses.c.choice, BLANK) == expected
+    return responses.update().where(
+        responses.c.attempt_id.in_(bindparam('attempt_ids', expanding=True)),
+        responses.c.is_correct != is_correct
+    ).values(is_correct=is_correct)
+
+def regrade_quiz(quiz_id, dry_run=True, chunk_size=CHUNK_SIZE, summary=None):
+    # Yields (processed, changed) after each committed chunk.
+    compiled = compiled_quiz(quiz_id)
+    key = key_vector(compiled)
+    total_questions = len(compiled.questions)
+    table = QuizAttempt.__table__
+    update = table.update().where(table.c.id == bindparam('attempt_id')).values(
+        score=bindparam('new_score'),
+        correct_answers=bindparam('new_correct'),
+        total_questions=bindparam('new_total'),
+    )
+    flag_responses = _responses_update(compiled, key)
+    processed = changed = 0
+    
+    for rows in _chunks(quiz_id, chunk_size):
+        correct = (answer_matrix(rows, compiled.question_ids) == key).sum(axis=1)
+        scores = correct / total_questions * 100 if total_questions else np.zeros(len(rows))
+        old_scores = np.array([row.score or 0 for row in rows], dtype=np.float64)
+        old_correct = np.array([row.correct_answers or 0 for row in rows])
+        old_totals = np.array([row.total_questions or 0 for row in rows])
+        mask = (correct != old_correct) | (old_totals != total_questions) | ~np.isclose(scores, old_scores)
+        
+        indices = np.flatnonzero(mask)
+        if len(indices) and summary is not None:
+            summary.add([rows[i].id for i in indices], [rows[i].user_id for i in indices],
+                        old_scores[indices], scores[indices])
+        if not dry_run:
+            connection = db.session.connection()
+            connection.execute(flag_responses, {'attempt_ids': [row.id for row in rows]})
+            if len(indices):
+                connection.execute(update, [
+                    {'attempt_id': rows[i].id, 'new_score': float(scores[i]), 'new_correct': int(correct[i]),
+                     'new_total': total_questions}
+                    for i in indices
+                ])
+                score_stats.apply_rescores(connection, quiz_id, [
+                    (rows[i].score, float(scores[i]), rows[i].time_spent_seconds, rows[i].finished_at)
+                    for i in indices
+                ])
+            db.session.commit()
+        
+        processed += len(rows)
+        changed += len(indices)
+        yield processed, changed
@@ -0,0 +1,132 @@
+import json
+from itertools import chain
+from sqlalchemy import func, insert, select
+from extensions import db
+from models import QuizAttempt, QuestionResponse
+from services.quiz_cache import OPTIONS, compiled_quiz
+
+BATCH_SIZE = 2000
+BLANK = -1
+CHOICES = {letter: code for code, letter in enumerate(OPTIONS)}
+
+def encode_choice(answer):
+    return CHOICES.get((answer or '').upper())
+
+def _response_rows(attempt_id, answers, keys):
+    rows = []
+    for question_id, answer in answers.items():
+        choice = encode_choice(answer)
+        rows.append({
+            'attempt_id': attempt_id,
+            'question_id': int(question_id),
+            'choice': choice,
+            'is_correct': choice is not None and keys.get(int(question_id)) == OPTIONS[choice],
+        })
+    return rows
+
+def record_responses(attempt_id, compiled, answers):
+    # `answers` as returned by CompiledQuiz.grade: one entry per current question.
+    rows = _response_rows(attempt_id, answers, dict(zip(compiled.question_ids, compiled.answer_key)))
+    if rows:
+        db.session.execute(insert(QuestionResponse), rows)
+
+def attempt_answers(attempt):
+    rows = db.session.query(QuestionResponse.question_id, QuestionResponse.choice).filter_by(attempt_id=attempt.id).all()
+    if rows:
+        return {str(question_id): OPTIONS[choice] if choice is not None else '' for question_id, choice in rows}
+    # Attempts not yet moved by `flask responses-backfill` still carry the JSON blob.
+    return json.loads(attempt.answers) if attempt.answers else {}
+
+def choice_counts(question_id):
+    rows = db.session.query(QuestionResponse.choice, func.count()).filter(
+        QuestionResponse.question_id == question_id
+    ).group_by(QuestionResponse.choice).all()
+    return {OPTIONS[choice] if choice is not None else '': count for choice, count in rows}
+
+def answer_matrix(attempts, question_ids):
+    # attempts: rows with .id and .answers; one matrix row per attempt, in order.
+    # NumPy is imported here: quiz submission uses this module, the matrices only admin jobs.
+    import numpy as np
+    
+    matrix = np.full((len(attempts), len(question_ids)), BLANK, dtype=np.int8)
+    if not attempts or not question_ids:
+        return matrix
+    
+    ids = np.array([attempt.id for attempt in attempts], dtype=np.int64)
+    stored = db.session.execute(select(QuestionResponse.attempt_id, QuestionResponse.question_id, QuestionResponse.choice).where(
+        # No question_id filter: it would steer SQLite onto the (question_id, choice) index.
+        QuestionResponse.attempt_id.in_(ids.tolist()),
+        QuestionResponse.choice.isnot(None)
+    )).all()
+    if stored:
+        data = np.fromiter(chain.from_iterable(stored), dtype=np.int64, count=len(stored) * 3).reshape(-1, 3)
+        columns, current = _positions(np.array(question_ids, dtype=np.int64), data[:, 1])
+        rows, _ = _positions(ids, data[:, 0])
+        matrix[rows[current], columns[current]] = data[current, 2]
+    
+    for i, attempt in enumerate(attempts):
+        if attempt.answers:
+            answers = json.loads(attempt.answers)
+            matrix[i] = [CHOICES.get((answers.get(str(question_id)) or '').upper(), BLANK) for question_id in question_ids]
+    return matrix
+
+def _positions(keys, values):
+    # Index of each value in `keys`, plus a mask of the values actually present.
+    import numpy as np
+    
+    order = np.argsort(keys)
+    positions = order[np.minimum(np.searchsorted(keys, values, sorter=order), len(keys) - 1)]
+    return positions, keys[positions] == values
+
+def backfill(batch_size=BATCH_SIZE, on_progress=None):
+    # Moves legacy answers JSON into question_responses, one committed batch at
+    # a time; each batch clears the blobs it copied, so reruns resume.
+    # is_correct can only be derived from the current answer key. The stored
+    # correct_answers stays authoritative: an attempt whose answers grade
+    # differently now (questions edited, added or removed since) is skipped
+    # and keeps its JSON, which every reader still understands. Running
+    # `flask quiz-regrade` on its quiz rescores it, and the next backfill moves it.
+    # Returns (moved, skipped).
+    table = QuizAttempt.__table__
+    query = select(
+        QuizAttempt.id, QuizAttempt.quiz_id, QuizAttempt.answers, QuizAttempt.correct_answers, QuizAttempt.total_questions
+    ).where(QuizAttempt.answers.isnot(None)).order_by(QuizAttempt.id).limit(batch_size)
+    keys_by_quiz = {}
+    last_id = 0
+    migrated = 0
+    skipped = 0
+    
+    while True:
+        rows = db.session.execute(query.where(QuizAttempt.id > last_id)).all()
+        if not rows:
+            return migrated, skipped
+        
+        responses = []
+        moved = []
+        for row in rows:
+            if row.quiz_id not in keys_by_quiz:
+                compiled = compiled_quiz(row.quiz_id)
+                keys_by_quiz[row.quiz_id] = dict(zip(compiled.question_ids, compiled.answer_key))
+            keys = keys_by_quiz[row.quiz_id]
+            try:
+                answers = json.loads(row.answers) if row.answers else {}
+            except ValueError:
+                answers = {}
+            attempt_responses = _response_rows(row.id, answers, keys)
+            correct = sum(response['is_correct'] for response in attempt_responses)
+            if correct != (row.correct_answers or 0) or (row.total_questions and row.total_questions != len(keys)):
+                skipped += 1
+                continue
+            responses.extend(attempt_responses)
+            moved.append(row.id)
+        
+        if responses:
+            db.session.execute(insert(QuestionResponse), responses)
+        if moved:
+            db.session.execute(table.update().where(table.c.id.in_(moved)).values(answers=None))
+        db.session.commit()
+        
+        migrated += len(moved)
+        last_id = rows[-1].id
+        if on_progress:
+            on_progress(migrated)
@@ -0,0 +1,221 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import String, case, cast, event, func, literal, literal_column, select
+from sqlalchemy.orm.attributes import get_history
+from extensions import db
+from models import Discipline, Module, Quiz, QuizAttempt, ScoreStatistic, ScoreDistribution
+from services.sql import upsert
+
+BUCKETS = 10
+SCOPES = ('global', 'discipline', 'quiz', 'day')
+
+def init_app(app):
+    if not event.contains(db.session, 'after_flush', _sync_after_flush):
+        event.listen(db.session, 'after_flush', _sync_after_flush)
+
+def ensure_score_statistics():
+    if db.session.query(ScoreStatistic.id).first() is None and \
+            db.session.query(QuizAttempt.id).filter_by(completed=True).first() is not None:
+        rebuild_statistics()
+
+def score_bucket(score):
+    return min(max(int((score or 0) // 10), 0), BUCKETS - 1)
+
+def _bucket_expression():
+    # Inline constants so Postgres sees the same expression in SELECT and GROUP BY.
+    return case(
+        *[(QuizAttempt.score < literal_column(str((i + 1) * 10)), literal_column(str(i))) for i in range(BUCKETS - 1)],
+        else_=literal_column(str(BUCKETS - 1))
+    )
+
+def _scope_key(scope):
+    if scope == 'quiz':
+        return cast(QuizAttempt.quiz_id, String)
+    if scope == 'discipline':
+        return cast(Module.discipline_id, String)
+    if scope == 'day':
+        return cast(func.date(QuizAttempt.finished_at), String)
+    return None
+
+def _completed_attempts(scope, *columns):
+    query = select(*columns).where(QuizAttempt.completed.is_(True))
+    if scope == 'discipline':
+        query = query.join_from(QuizAttempt, Quiz, QuizAttempt.quiz_id == Quiz.id).join(Module, Quiz.module_id == Module.id)
+    return query
+
+def _insert_scope(executor, scope):
+    key = _scope_key(scope)
+    statistics = _completed_attempts(
+        scope,
+        literal(scope),
+        key if key is not None else literal(''),
+        func.count(QuizAttempt.id),
+        func.coalesce(func.sum(QuizAttempt.score), 0),
+        func.coalesce(func.sum(QuizAttempt.time_spent_seconds), 0),
+    )
+    bucket = _bucket_expression()
+    distribution = _completed_attempts(
+        scope,
+        literal(scope),
+        key if key is not None else literal(''),
+        bucket,
+        func.count(QuizAttempt.id),
+    )
+    if key is not None:
+        statistics = statistics.group_by(key)
+        distribution = distribution.group_by(key, bucket)
+    else:
+        distribution = distribution.group_by(bucket)
+    
+    executor.execute(ScoreStatistic.__table__.insert().from_select(
+        ['scope', 'scope_key', 'attempts', 'score_sum', 'time_sum'], statistics
+    ))
+    executor.execute(ScoreDistribution.__table__.insert().from_select(
+        ['scope', 'scope_key', 'bucket', 'attempts'], distribution
+    ))
+
+def rebuild_statistics(scopes=SCOPES):
+    for scope in scopes:
+        db.session.execute(ScoreStatistic.__table__.delete().where(ScoreStatistic.scope == scope))
+        db.session.execute(ScoreDistribution.__table__.delete().where(ScoreDistribution.scope == scope))
+        _insert_scope(db.session, scope)
+    db.session.commit()
+
+def global_statistic():
+    return ScoreStatistic.query.filter_by(scope='global', scope_key='').first()
+
+def score_distribution(scope='global', scope_key=''):
+    counts = [0] * BUCKETS
+    for bucket, attempts in db.session.query(ScoreDistribution.bucket, ScoreDistribution.attempts).filter_by(
+            scope=scope, scope_key=scope_key):
+        counts[bucket] = attempts
+    return counts
+
+def daily_statistics(days=30, today=None):
+    today = today or datetime.utcnow().date()
+    keys = [(today - timedelta(days=offset)).isoformat() for offset in range(days - 1, -1, -1)]
+    rows = {row.scope_key: row for row in ScoreStatistic.query.filter(
+        ScoreStatistic.scope == 'day',
+        ScoreStatistic.scope_key >= keys[0]
+    )}
+    return [(key, rows.get(key)) for key in keys]
+
+def discipline_statistics():
+    rows = {row.scope_key: row for row in ScoreStatistic.query.filter_by(scope='discipline')}
+    disciplines = Discipline.query.order_by(Discipline.order, Discipline.name).all()
+    return [(discipline, rows.get(str(discipline.id))) for discipline in disciplines]
+
+def _previous(obj, attr):
+    history = get_history(obj, attr)
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
+
+def _sync_after_flush(session, flush_context):
+    # (sign, quiz_id, score, time_spent_seconds, finished_at)
+    changes = []
+    deleted_quizzes = {}
+    disciplines_stale = False
+    
+    for obj in session.new:
+        if isinstance(obj, QuizAttempt) and obj.completed:
+            changes.append((1, obj.quiz_id, obj.score, obj.time_spent_seconds, obj.finished_at))
+    
+    for obj in session.dirty:
+        if isinstance(obj, QuizAttempt):
+            attrs = ('completed', 'quiz_id', 'score', 'time_spent_seconds', 'finished_at')
+            if not any(get_history(obj, attr).has_changes() for attr in attrs):
+                continue
+            if _previous(obj, 'completed'):
+                changes.append((-1, _previous(obj, 'quiz_id'), _previous(obj, 'score'),
+                                _previous(obj, 'time_spent_seconds'), _previous(obj, 'finished_at')))
+            if obj.completed:
+                changes.append((1, obj.quiz_id, obj.score, obj.time_spent_seconds, obj.finished_at))
+        elif isinstance(obj, Quiz):
+            disciplines_stale = disciplines_stale or get_history(obj, 'module_id').has_changes()
+        elif isinstance(obj, Module):
+            disciplines_stale = disciplines_stale or get_history(obj, 'discipline_id').has_changes()
+    
+    for obj in session.deleted:
+        if isinstance(obj, QuizAttempt) and obj.completed:
+            changes.append((-1, obj.quiz_id, obj.score, obj.time_spent_seconds, obj.finished_at))
+        elif isinstance(obj, Quiz):
+            deleted_quizzes[obj.id] = obj.module_id
+        elif isinstance(obj, (Module, Discipline)):
+            disciplines_stale = True
+    
+    if not changes and not deleted_quizzes and not disciplines_stale:
+        return
+    _apply_changes(session.connection(), changes, deleted_quizzes, disciplines_stale)
+
+def apply_rescores(connection, quiz_id, rescores):
+    # For bulk UPDATEs that bypass the ORM: (old_score, new_score, time_spent_seconds, finished_at).
+    changes = []
+    for old_score, new_score, time_spent, finished_at in rescores:
+        changes.append((-1, quiz_id, old_score, time_spent, finished_at))
+        changes.append((1, quiz_id, new_score, time_spent, finished_at))
+    if changes:
+        _apply_changes(connection, changes)
+
+def _apply_changes(connection, changes, deleted_quizzes=None, disciplines_stale=False):
+    deleted_quizzes = deleted_quizzes or {}
+    quiz_ids = {quiz_id for _, quiz_id, _, _, _ in changes}
+    disciplines = {}
+    if quiz_ids and not disciplines_stale:
+        disciplines = dict(connection.execute(
+            select(Quiz.id, Module.discipline_id).join_from(Quiz, Module, Quiz.module_id == Module.id).where(Quiz.id.in_(quiz_ids))
+        ).all())
+        # Deleted quizzes are already gone from the table; their module still knows the discipline.
+        orphaned = {deleted_quizzes[quiz_id] for quiz_id in quiz_ids if quiz_id in deleted_quizzes}
+        if orphaned:
+            module_disciplines = dict(connection.execute(
+                select(Module.id, Module.discipline_id).where(Module.id.in_(orphaned))
+            ).all())
+            for quiz_id in quiz_ids & deleted_quizzes.keys():
+                if deleted_quizzes[quiz_id] in module_disciplines:
+                    disciplines[quiz_id] = module_disciplines[deleted_quizzes[quiz_id]]
+    
+    statistics = defaultdict(lambda: [0, 0.0, 0])
+    distribution = defaultdict(int)
+    for sign, quiz_id, score, time_spent, finished_at in changes:
+        keys = [('global', '')]
+        if quiz_id not in deleted_quizzes:
+            keys.append(('quiz', str(quiz_id)))
+        if quiz_id in disciplines:
+            keys.append(('discipline', str(disciplines[quiz_id])))
+        if finished_at:
+            keys.append(('day', finished_at.date().isoformat()))
+        for key in keys:
+            totals = statistics[key]
+            totals[0] += sign
+            totals[1] += sign * (score or 0)
+            totals[2] += sign * (time_spent or 0)
+            distribution[key + (score_bucket(score),)] += sign
+    
+    table = ScoreStatistic.__table__
+    upsert(connection, table, [
+        {'scope': scope, 'scope_key': key, 'attempts': attempts, 'score_sum': score_sum, 'time_sum': time_sum}
+        for (scope, key), (attempts, score_sum, time_sum) in statistics.items() if attempts or score_sum
+    ], ['scope', 'scope_key'], lambda excluded: {
+        'attempts': table.c.attempts + excluded.attempts,
+        'score_sum': table.c.score_sum + excluded.score_sum,
+        'time_sum': table.c.time_sum + excluded.time_sum,
+    })
+    buckets = ScoreDistribution.__table__
+    upsert(connection, buckets, [
+        {'scope': scope, 'scope_key': key, 'bucket': bucket, 'attempts': attempts}
+        for (scope, key, bucket), attempts in distribution.items() if attempts
+    ], ['scope', 'scope_key', 'bucket'], lambda excluded: {
+        'attempts': buckets.c.attempts + excluded.attempts,
+    })
+    
+    if deleted_quizzes:
+        keys = [str(quiz_id) for quiz_id in deleted_quizzes]
+        connection.execute(table.delete().where(table.c.scope == 'quiz', table.c.scope_key.in_(keys)))
+        connection.execute(buckets.delete().where(buckets.c.scope == 'quiz', buckets.c.scope_key.in_(keys)))
+    if disciplines_stale:
+        connection.execute(table.delete().where(table.c.scope == 'discipline'))
+        connection.execute(buckets.delete().where(buckets.c.scope == 'discipline'))
+        _insert_scope(connection, 'discipline')
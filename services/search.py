@@ -0,0 +1,368 @@
+import re
+from collections import defaultdict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, func, literal, or_, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import get_history
+from extensions import db
+from models import VideoLesson, Quiz, Material, Discipline, Module, SearchDocument, ContentExtract
+
+PER_PAGE = 20
+MAX_TERMS = 10
+# Matches are counted up to this many pages past the current one; beyond
+# that the total is shown as "N+".
+COUNT_PAGES_AHEAD = 10
+# Extracted material text kept stored (services/extraction.py MAX_TEXT_CHARS)
+# is much longer than what is worth indexing: the first pages carry the
+# terms students search for, and every indexed character costs on write.
+INDEXED_EXTRACT_CHARS = 20000
+
+# doc_type -> (model, title attribute, body attribute)
+INDEXED_MODELS = {
+    'video': (VideoLesson, 'title', 'description'),
+    'quiz': (Quiz, 'title', 'description'),
+    'material': (Material, 'title', 'description'),
+    'discipline': (Discipline, 'name', 'description'),
+    'module': (Module, 'name', 'description'),
+}
+
+_DOC_TYPES = {model: doc_type for doc_type, (model, _, _) in INDEXED_MODELS.items()}
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+_PG_VECTOR = ("setweight(to_tsvector('{config}', coalesce(title, '')), 'A') || "
+              "setweight(to_tsvector('{config}', coalesce(body, '')), 'B')")
+
+_SQLITE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_documents_fts USING fts5("
+    "title, body, content='search_documents', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+    "INSERT INTO search_documents_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+    "INSERT INTO search_documents_fts(search_documents_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+    "INSERT INTO search_documents_fts(search_documents_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO search_documents_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+
+class SearchHit:
+    def __init__(self, doc_type, obj, rank):
+        self.doc_type = doc_type
+        self.obj = obj
+        self.rank = rank
+
+class SearchResults:
+    def __init__(self, query, hits, page, per_page, total, total_capped=False):
+        self.query = query
+        self.hits = hits
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.total_capped = total_capped
+    
+    @property
+    def pages(self):
+        # A capped total has at least one more page past the counted ones.
+        return max(1, -(-self.total // self.per_page)) + self.total_capped
+    
+    @property
+    def has_prev(self):
+        return self.page > 1
+    
+    @property
+    def has_next(self):
+        return self.page < self.pages
+    
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+    
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+def init_app(app):
+    app.config.setdefault('SEARCH_TS_CONFIG', 'portuguese_unaccent')
+    if not event.contains(db.session, 'after_flush', _sync_after_flush):
+        event.listen(db.session, 'after_flush', _sync_after_flush)
+
+def ensure_search_index():
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        _ensure_postgres()
+    elif dialect == 'sqlite':
+        for statement in _SQLITE_SCHEMA:
+            db.session.execute(text(statement))
+        db.session.commit()
+    
+    if db.session.query(SearchDocument.id).first() is None and _has_content():
+        rebuild_index()
+
+def _ensure_postgres():
+    config = current_app.config['SEARCH_TS_CONFIG']
+    exists = db.session.execute(
+        text('SELECT 1 FROM pg_ts_config WHERE cfgname = :name'), {'name': config}
+    ).scalar()
+    if not exists:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(text('CREATE EXTENSION IF NOT EXISTS unaccent'))
+                db.session.execute(text(f'CREATE TEXT SEARCH CONFIGURATION {config} (COPY = portuguese)'))
+                db.session.execute(text(
+                    f'ALTER TEXT SEARCH CONFIGURATION {config} '
+                    'ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem'
+                ))
+        except DBAPIError:
+            current_app.logger.warning('unaccent extension unavailable, search falls back to accent-sensitive portuguese config')
+            config = current_app.config['SEARCH_TS_CONFIG'] = 'portuguese'
+    
+    current_app.extensions['search_ts_config'] = config
+    # The vector is stored, so ranking reads it instead of re-tokenising every
+    # matching document; the older expression index is replaced.
+    db.session.execute(text('ALTER TABLE search_documents ADD COLUMN IF NOT EXISTS search_vector tsvector'))
+    db.session.execute(text(f'DROP INDEX IF EXISTS ix_search_documents_tsv_{config}'))
+    db.session.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_search_documents_search_vector ON search_documents USING gin (search_vector)'
+    ))
+    db.session.execute(text(
+        f'UPDATE search_documents SET search_vector = {_PG_VECTOR.format(config=config)} WHERE search_vector IS NULL'
+    ))
+    db.session.commit()
+
+def _ts_config(connection):
+    # Workers never run _ensure_postgres: fall back to the stock config the
+    # same way when init-db could not create the unaccent one.
+    config = current_app.extensions.get('search_ts_config')
+    if config is None:
+        config = current_app.config['SEARCH_TS_CONFIG']
+        exists = connection.execute(
+            text('SELECT 1 FROM pg_ts_config WHERE cfgname = :name'), {'name': config}
+        ).scalar()
+        if not exists:
+            config = 'portuguese'
+        current_app.extensions['search_ts_config'] = config
+    return config
+
+def _write_vectors(connection, doc_type=None, ids=None):
+    # Fills search_vector for the given documents (all of them without a
+    # doc_type) right after they are inserted.
+    if connection.dialect.name != 'postgresql':
+        return
+    sql = f'UPDATE search_documents SET search_vector = {_PG_VECTOR.format(config=_ts_config(connection))}'
+    if doc_type is None:
+        connection.execute(text(sql))
+    else:
+        connection.execute(text(sql + ' WHERE doc_type = :doc_type AND doc_id = ANY(:ids)'),
+                           {'doc_type': doc_type, 'ids': list(ids)})
+
+def _has_content():
+    return any(db.session.query(model.id).first() is not None for model, _, _ in INDEXED_MODELS.values())
+
+def _document_rows(doc_type, now):
+    model, title_attr, body_attr = INDEXED_MODELS[doc_type]
+    body = func.coalesce(getattr(model, body_attr), '')
+    rows = select(literal(doc_type), model.id, getattr(model, title_attr), body, literal(now))
+    if model is Material:
+        # Text extracted from the file or page (services/extraction.py) follows the description.
+        rows = select(
+            literal(doc_type), model.id, getattr(model, title_attr),
+            body + ' ' + func.coalesce(func.substr(ContentExtract.text, 1, INDEXED_EXTRACT_CHARS), ''), literal(now),
+        ).select_from(model).outerjoin(ContentExtract, ContentExtract.key == model.content_key)
+    return rows
+
+def rebuild_index():
+    table = SearchDocument.__table__
+    now = datetime.utcnow()
+    db.session.execute(table.delete())
+    for doc_type in INDEXED_MODELS:
+        rows = _document_rows(doc_type, now)
+        db.session.execute(table.insert().from_select(['doc_type', 'doc_id', 'title', 'body', 'updated_at'], rows))
+    _write_vectors(db.session.connection())
+    db.session.commit()
+
+def reindex(connection, doc_type, ids):
+    model = INDEXED_MODELS[doc_type][0]
+    table = SearchDocument.__table__
+    rows = _document_rows(doc_type, datetime.utcnow()).where(model.id.in_(ids))
+    connection.execute(table.delete().where(table.c.doc_type == doc_type, table.c.doc_id.in_(ids)))
+    connection.execute(table.insert().from_select(['doc_type', 'doc_id', 'title', 'body', 'updated_at'], rows))
+    _write_vectors(connection, doc_type, ids)
+
+def _document_for(doc_type, obj, now, connection):
+    _, title_attr, body_attr = INDEXED_MODELS[doc_type]
+    body = getattr(obj, body_attr) or ''
+    if doc_type == 'material' and obj.content_key:
+        extracted = connection.execute(
+            select(ContentExtract.text).where(ContentExtract.key == obj.content_key)
+        ).scalar()
+        body = f"{body} {(extracted or '')[:INDEXED_EXTRACT_CHARS]}"
+    return {
+        'doc_type': doc_type,
+        'doc_id': obj.id,
+        'title': getattr(obj, title_attr),
+        'body': body,
+        'updated_at': now,
+    }
+
+def _indexed_fields_changed(doc_type, obj):
+    _, title_attr, body_attr = INDEXED_MODELS[doc_type]
+    attrs = (title_attr, body_attr, 'content_key') if doc_type == 'material' else (title_attr, body_attr)
+    return any(get_history(obj, attr).has_changes() for attr in attrs)
+
+def _sync_after_flush(session, flush_context):
+    stale = defaultdict(set)
+    documents = []
+    now = datetime.utcnow()
+    connection = session.connection()
+    
+    for obj in session.new:
+        doc_type = _DOC_TYPES.get(type(obj))
+        if doc_type:
+            documents.append(_document_for(doc_type, obj, now, connection))
+    
+    for obj in session.dirty:
+        doc_type = _DOC_TYPES.get(type(obj))
+        if doc_type and _indexed_fields_changed(doc_type, obj):
+            stale[doc_type].add(obj.id)
+            documents.append(_document_for(doc_type, obj, now, connection))
+    
+    for obj in session.deleted:
+        doc_type = _DOC_TYPES.get(type(obj))
+        if doc_type:
+            stale[doc_type].add(obj.id)
+    
+    if not stale and not documents:
+        return
+    
+    table = SearchDocument.__table__
+    for doc_type, ids in stale.items():
+        connection.execute(table.delete().where(table.c.doc_type == doc_type, table.c.doc_id.in_(ids)))
+    if documents:
+        connection.execute(table.insert(), documents)
+        written = defaultdict(list)
+        for document in documents:
+            written[document['doc_type']].append(document['doc_id'])
+        for doc_type, ids in written.items():
+            _write_vectors(connection, doc_type, ids)
+
+def _terms(query):
+    return _TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+def _tsquery(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+def _fts_match(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def _like_conditions(terms):
+    return [
+        or_(SearchDocument.title.ilike(f'%{term}%'), SearchDocument.body.ilike(f'%{term}%'))
+        for term in terms
+    ]
+
+def _ranked_rows_postgres(terms, limit, offset):
+    config = _ts_config(db.session.connection())
+    sql = text(
+        'SELECT doc_type, doc_id, ts_rank(search_vector, query) AS rank '
+        f"FROM search_documents, to_tsquery('{config}', :terms) AS query "
+        'WHERE search_vector @@ query '
+        'ORDER BY rank DESC, id LIMIT :limit OFFSET :offset'
+    )
+    return db.session.execute(sql, {'terms': _tsquery(terms), 'limit': limit, 'offset': offset}).all()
+
+def _count_postgres(terms, cap):
+    config = _ts_config(db.session.connection())
+    sql = text(
+        'SELECT count(*) FROM (SELECT 1 FROM search_documents '
+        f"WHERE search_vector @@ to_tsquery('{config}', :terms) LIMIT :cap) AS matches"
+    )
+    return db.session.execute(sql, {'terms': _tsquery(terms), 'cap': cap}).scalar()
+
+def _ranked_rows_sqlite(terms, limit, offset):
+    # bm25() is lower-is-better; titles weigh ten times the body.
+    sql = text(
+        'SELECT d.doc_type, d.doc_id, m.rank '
+        'FROM (SELECT rowid, bm25(search_documents_fts, 10.0, 1.0) AS rank '
+        'FROM search_documents_fts WHERE search_documents_fts MATCH :match) AS m '
+        'JOIN search_documents d ON d.id = m.rowid '
+        'ORDER BY m.rank, d.id LIMIT :limit OFFSET :offset'
+    )
+    return db.session.execute(sql, {'match': _fts_match(terms), 'limit': limit, 'offset': offset}).all()
+
+def _count_sqlite(terms, cap):
+    sql = text(
+        'SELECT count(*) FROM (SELECT 1 FROM search_documents_fts '
+        'WHERE search_documents_fts MATCH :match LIMIT :cap)'
+    )
+    return db.session.execute(sql, {'match': _fts_match(terms), 'cap': cap}).scalar()
+
+def _ranked_rows_like(terms, limit, offset):
+    return db.session.query(
+        SearchDocument.doc_type, SearchDocument.doc_id, literal(0).label('rank')
+    ).filter(*_like_conditions(terms)).order_by(SearchDocument.title, SearchDocument.id).limit(limit).offset(offset).all()
+
+def _count_like(terms, cap):
+    matches = db.session.query(SearchDocument.id).filter(*_like_conditions(terms)).limit(cap).subquery()
+    return db.session.query(func.count()).select_from(matches).scalar()
+
+def _load_hits(rows):
+    ids_by_type = defaultdict(list)
+    for row in rows:
+        ids_by_type[row.doc_type].append(row.doc_id)
+    
+    objects = {}
+    for doc_type, ids in ids_by_type.items():
+        model = INDEXED_MODELS[doc_type][0]
+        query = model.query.filter(model.id.in_(ids))
+        if model is Module:
+            query = query.options(joinedload(Module.discipline))
+        elif model is not Discipline:
+            query = query.options(joinedload(model.module).joinedload(Module.discipline))
+        for obj in query:
+            objects[(doc_type, obj.id)] = obj
+    
+    return [
+        SearchHit(row.doc_type, objects[(row.doc_type, row.doc_id)], row.rank)
+        for row in rows if (row.doc_type, row.doc_id) in objects
+    ]
+
+def search(query, page=1, per_page=PER_PAGE):
+    page = max(page, 1)
+    terms = _terms(query)
+    if not terms:
+        return SearchResults(query, [], page, per_page, 0)
+    
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        ranked_rows, count = _ranked_rows_postgres, _count_postgres
+    elif dialect == 'sqlite':
+        ranked_rows, count = _ranked_rows_sqlite, _count_sqlite
+    else:
+        ranked_rows, count = _ranked_rows_like, _count_like
+    
+    offset = (page - 1) * per_page
+    rows = ranked_rows(terms, per_page, offset)
+    if len(rows) < per_page and (rows or page == 1):
+        # The last page: the total is known without counting.
+        total, capped = offset + len(rows), False
+    else:
+        # Counting stops at the cap instead of visiting every match.
+        cap = (page + COUNT_PAGES_AHEAD) * per_page
+        total = count(terms, cap + 1)
+        total, capped = min(total, cap), total > cap
+    
+    return SearchResults(query, _load_hits(rows), page, per_page, total, capped)
+
+def ilike_search(query):
+    # Unindexed substring scan over every content table; kept as the baseline for bench/bench_search.py.
+    search_term = f'%{query}%'
+    results = {}
+    for doc_type, (model, title_attr, body_attr) in INDEXED_MODELS.items():
+        results[doc_type] = model.query.filter(
+            or_(getattr(model, title_attr).ilike(search_term), getattr(model, body_attr).ilike(search_term))
+        ).all()
+    return results
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+def upsert(connection, table, rows, index_elements, update):
+    # `update` receives the row being inserted (the `excluded` pseudo-table) and
+    # returns the column assignments to apply when the key already exists.
+    if not rows:
+        return
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = insert(table).values(rows)
+        statement = statement.on_conflict_do_update(index_elements=index_elements, set_=update(statement.excluded))
+        connection.execute(statement)
+        return
+    
+    for row in rows:
+        excluded = SimpleNamespace(**{key: literal(value) for key, value in row.items()})
+        where = [table.c[key] == row[key] for key in index_elements]
+        result = connection.execute(table.update().where(*where).values(update(excluded)))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(row))
+
+def insert_missing(connection, table, row, index_elements):
+    # True when the row was inserted, False when its key already existed.
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = insert(table).values(row).on_conflict_do_nothing(index_elements=index_elements)
+        return connection.execute(statement).rowcount > 0
+    try:
+        with connection.begin_nested():
+            connection.execute(table.insert().values(row))
+    except IntegrityError:
+        return False
+    return True
+
+def add_missing_columns(connection, table):
+    # db.create_all() never alters existing tables; new columns must be nullable.
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    quote = connection.dialect.identifier_preparer.quote
+    for column in table.columns:
+        if column.name not in existing:
+            connection.execute(text(
+                f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=connection.dialect)}'
+            ))
+
+def create_missing_indexes(connection, table):
+    # Same for indexes declared after the table was created.
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, event, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import get_history
+from extensions import db
+from models import Material, MaterialUpload, StoredFile
+from services.sql import add_missing_columns
+
+CHUNK_SIZE = 1024 * 1024
+STORE_DIR = 'store'
+TEMP_DIR = 'tmp'
+# Files without references (an upload whose form failed, a deleted material)
+# are kept this long after losing the last one before `flask storage-gc`
+# removes them, so an upload still on its way to the Material keeps its file.
+ORPHAN_GRACE = timedelta(hours=1)
+
+def init_app(app):
+    if not event.contains(db.session, 'after_flush', _count_references):
+        event.listen(db.session, 'after_flush', _count_references)
+
+def ensure_storage():
+    with db.engine.begin() as connection:
+        add_missing_columns(connection, Material.__table__)
+        add_missing_columns(connection, StoredFile.__table__)
+        add_missing_columns(connection, MaterialUpload.__table__)
+    for name in (STORE_DIR, TEMP_DIR):
+        os.makedirs(_root(name), exist_ok=True)
+
+def _root(*parts):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], *parts)
+
+def temp_path():
+    os.makedirs(_root(TEMP_DIR), exist_ok=True)
+    handle, path = tempfile.mkstemp(dir=_root(TEMP_DIR))
+    os.close(handle)
+    return path
+
+def staging_path(name):
+    # Fixed-name temp file, for uploads that arrive over several requests.
+    os.makedirs(_root(TEMP_DIR), exist_ok=True)
+    return _root(TEMP_DIR, name)
+
+def store_stream(stream):
+    # Hash while spooling to a temp file on the same filesystem as the store,
+    # so the final move is an atomic rename.
+    digest = hashlib.sha256()
+    size = 0
+    path = temp_path()
+    try:
+        with open(path, 'wb') as temp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                temp.write(chunk)
+        return store_file(path, digest.hexdigest(), size)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def store_file(path, sha256, size):
+    # Takes ownership of a complete, already hashed file at `path`. The row is
+    # taken first: its grace restarts and, until this transaction ends, the
+    # garbage collector cannot delete it. Moving the file over an existing
+    # copy is harmless (same content) and restores one a collection unlinked
+    # just before.
+    stored = _take(sha256, size)
+    final = stored_path(sha256)
+    os.makedirs(os.path.dirname(final), exist_ok=True)
+    os.replace(path, final)
+    if os.path.exists(path):
+        # rename() does nothing when both names are links to the same file.
+        os.remove(path)
+    return stored
+
+def _take(sha256, size):
+    table = StoredFile.__table__
+    db.session.execute(table.update().where(table.c.sha256 == sha256, table.c.ref_count <= 0).values(
+        unreferenced_since=datetime.utcnow()
+    ))
+    existing = StoredFile.query.filter_by(sha256=sha256).first()
+    if existing is not None:
+        return existing
+    stored = StoredFile(sha256=sha256, size=size)
+    try:
+        with db.session.begin_nested():
+            db.session.add(stored)
+    except IntegrityError:
+        return StoredFile.query.filter_by(sha256=sha256).one()
+    return stored
+
+def stored_path(sha256):
+    return _root(STORE_DIR, StoredFile.path_for(sha256))
+
+def locate(material):
+    # (directory, relative path) for send_from_directory.
+    if material.stored_file is not None:
+        return _root(STORE_DIR), material.stored_file.path
+    return current_app.config['UPLOAD_FOLDER'], material.file_path
+
+def collect_garbage(older_than):
+    table = StoredFile.__table__
+    unreferenced = (table.c.ref_count <= 0) & (
+        func.coalesce(table.c.unreferenced_since, table.c.created_at) < older_than
+    )
+    with db.engine.connect() as connection:
+        candidates = connection.execute(select(table.c.id, table.c.sha256).where(unreferenced)).all()
+    
+    removed = 0
+    for stored_id, sha256 in candidates:
+        # The DELETE re-checks the condition, so a file referenced or taken
+        # again since the select survives. The file goes before the commit,
+        # while the deleted row still holds off store_file for the same content.
+        try:
+            with db.engine.begin() as connection:
+                deleted = connection.execute(table.delete().where(table.c.id == stored_id, unreferenced)).rowcount
+                path = stored_path(sha256)
+                if deleted and os.path.exists(path):
+                    os.remove(path)
+                    removed += 1
+        except IntegrityError:
+            continue
+    return removed
+
+def collect_orphans():
+    return collect_garbage(older_than=datetime.utcnow() - ORPHAN_GRACE)
+
+def import_legacy_files():
+    # Moves files saved by name in UPLOAD_FOLDER (before the store) into it.
+    imported = 0
+    paths = [path for (path,) in db.session.query(Material.file_path).filter(
+        Material.file_path.isnot(None), Material.stored_file_id.is_(None)
+    ).distinct()]
+    for path in paths:
+        full_path = os.path.join(current_app.config['UPLOAD_FOLDER'], path)
+        if not os.path.isfile(full_path):
+            continue
+        with open(full_path, 'rb') as legacy:
+            stored = store_stream(legacy)
+        db.session.flush()
+        # Core UPDATE, so the references are counted here rather than by the flush hook.
+        materials = Material.__table__
+        result = db.session.execute(materials.update().where(
+            materials.c.file_path == path, materials.c.stored_file_id.is_(None)
+        ).values(stored_file_id=stored.id))
+        table = StoredFile.__table__
+        db.session.execute(table.update().where(table.c.id == stored.id).values(
+            ref_count=table.c.ref_count + result.rowcount, unreferenced_since=None
+        ))
+        db.session.commit()
+        os.remove(full_path)
+        imported += 1
+    return imported
+
+def _count_references(session, flush_context):
+    deltas = defaultdict(int)
+    for obj in session.new:
+        if isinstance(obj, Material) and obj.stored_file_id:
+            deltas[obj.stored_file_id] += 1
+    for obj in session.dirty:
+        if isinstance(obj, Material):
+            history = get_history(obj, 'stored_file_id')
+            for stored_id in history.deleted:
+                if stored_id:
+                    deltas[stored_id] -= 1
+            for stored_id in history.added:
+                if stored_id:
+                    deltas[stored_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Material) and obj.stored_file_id:
+            deltas[obj.stored_file_id] -= 1
+    
+    deltas = {stored_id: delta for stored_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    
+    # Files left without references are removed by `flask storage-gc` once
+    # ORPHAN_GRACE has passed, not here.
+    table = StoredFile.__table__
+    connection = session.connection()
+    now = datetime.utcnow()
+    for stored_id, delta in deltas.items():
+        connection.execute(table.update().where(table.c.id == stored_id).values(
+            ref_count=table.c.ref_count + delta,
+            unreferenced_since=case((table.c.ref_count + delta <= 0, now), else_=None),
+        ))
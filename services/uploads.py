@@ -0,0 +1,175 @@
+import fcntl
+import hashlib
+import os
+import secrets
+import shutil
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event
+from extensions import db
+from models import MaterialUpload
+from services import storage
+
+# Size the client is asked to send per request; well under MAX_CONTENT_LENGTH.
+CHUNK_SIZE = 4 * 1024 * 1024
+# Unfinished (or finished but never attached) uploads are dropped after this.
+STALE_AFTER = timedelta(hours=24)
+# Running SHA-256 of the uploads this process took chunks for, as
+# {upload id: (bytes hashed, digest)}. hashlib state cannot be saved with the
+# row, so a process that missed chunks (another worker took them, a restart)
+# catches up from the staging file on its next chunk.
+_digests = {}
+DIGESTS_KEPT = 64
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, received=None):
+        super().__init__(message)
+        self.status = status
+        self.received = received
+
+def init_app(app):
+    app.config.setdefault('UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+    if not event.contains(db.session, 'after_commit', _remove_claimed_after_commit):
+        event.listen(db.session, 'after_commit', _remove_claimed_after_commit)
+        event.listen(db.session, 'after_rollback', _forget_after_rollback)
+
+def _staging(upload):
+    return storage.staging_path(f'upload-{upload.id}')
+
+def start_upload(user_id, filename, size):
+    if size < 0 or size > current_app.config['UPLOAD_MAX_SIZE']:
+        raise UploadError('Arquivo maior que o limite permitido.', 413)
+    upload = MaterialUpload(id=secrets.token_hex(16), user_id=user_id, filename=filename, size=size)
+    open(_staging(upload), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+def get_upload(upload_id, user_id):
+    return MaterialUpload.query.filter_by(id=upload_id, user_id=user_id).first()
+
+def append_chunk(upload, offset, stream, sha256=None):
+    if upload.is_complete:
+        raise UploadError('Envio já finalizado.', 409, upload.received)
+    path = _staging(upload)
+    if not os.path.exists(path):
+        raise UploadError('Envio expirado.', 404)
+    
+    with open(path, 'r+b') as staging:
+        # Serialises retries of the same chunk; the offset check below then
+        # turns a stale retry into a 409 before it can touch the file.
+        fcntl.flock(staging, fcntl.LOCK_EX)
+        db.session.refresh(upload)
+        if offset != upload.received:
+            raise UploadError('Posição do envio divergente.', 409, upload.received)
+        
+        running = _running_digest(upload, staging, offset)
+        # Bytes past the committed offset belong to a chunk that never committed.
+        staging.seek(offset)
+        staging.truncate()
+        digest = hashlib.sha256()
+        written = 0
+        for chunk in iter(lambda: stream.read(storage.CHUNK_SIZE), b''):
+            written += len(chunk)
+            if offset + written > upload.size:
+                staging.truncate(offset)
+                raise UploadError('Dados além do tamanho declarado.', 413, upload.received)
+            digest.update(chunk)
+            running.update(chunk)
+            staging.write(chunk)
+        if sha256 and digest.hexdigest() != sha256.lower():
+            staging.truncate(offset)
+            raise UploadError('Bloco corrompido no envio.', 400, upload.received)
+        staging.flush()
+        os.fsync(staging.fileno())
+        
+        upload.received = offset + written
+        upload.updated_at = datetime.utcnow()
+        db.session.commit()
+        _keep_digest(upload, running)
+    return upload.received
+
+def _running_digest(upload, staging, offset):
+    # Digest of the first `offset` bytes; taken out of the cache, so a chunk
+    # that fails leaves nothing behind. Called under the staging file's lock.
+    hashed, digest = _digests.pop(upload.id, (0, None))
+    if digest is None or hashed > offset:
+        hashed, digest = 0, hashlib.sha256()
+    staging.seek(hashed)
+    for chunk in iter(lambda: staging.read(min(storage.CHUNK_SIZE, offset - staging.tell())), b''):
+        digest.update(chunk)
+    return digest
+
+def _keep_digest(upload, digest):
+    _digests[upload.id] = (upload.received, digest)
+    while len(_digests) > DIGESTS_KEPT:
+        _digests.pop(next(iter(_digests)))
+
+def complete_upload(upload, sha256=None):
+    if upload.is_complete:
+        return upload
+    path = _staging(upload)
+    if upload.received != upload.size or not os.path.exists(path) or os.path.getsize(path) != upload.size:
+        raise UploadError('Envio incompleto.', 409, upload.received)
+    
+    with open(path, 'rb') as staging:
+        fcntl.flock(staging, fcntl.LOCK_EX)
+        # Usually nothing left to read: the chunks were hashed as they arrived.
+        digest = _running_digest(upload, staging, upload.size).hexdigest()
+    if sha256 and digest != sha256.lower():
+        raise UploadError('O arquivo recebido não confere com o original.', 400, upload.received)
+    
+    # The file stays in staging until the material form claims it.
+    upload.sha256 = digest
+    upload.updated_at = datetime.utcnow()
+    db.session.commit()
+    return upload
+
+def claim_upload(upload_id, user_id):
+    # (stored file, filename) of a completed upload for the material form, or
+    # None. Puts a copy of the file in the store and deletes the upload; the
+    # caller commits both with the Material, whose insert takes the reference.
+    # The staging file only goes after that commit, so a failed one leaves the
+    # upload ready to be claimed again.
+    upload = get_upload(upload_id, user_id)
+    if upload is None or not upload.is_complete:
+        return None
+    path = _staging(upload)
+    if not os.path.exists(path):
+        return None
+    copy = storage.temp_path()
+    os.remove(copy)
+    try:
+        os.link(path, copy)
+    except OSError:
+        shutil.copyfile(path, copy)
+    stored = storage.store_file(copy, upload.sha256, upload.size)
+    db.session.delete(upload)
+    db.session.info.setdefault('uploads_claimed', set()).add(path)
+    return stored, upload.filename
+
+def cancel_upload(upload):
+    _digests.pop(upload.id, None)
+    path = _staging(upload)
+    if os.path.exists(path):
+        os.remove(path)
+    db.session.delete(upload)
+    db.session.commit()
+
+def collect_stale():
+    stale = MaterialUpload.query.filter(MaterialUpload.updated_at < datetime.utcnow() - STALE_AFTER).all()
+    for upload in stale:
+        cancel_upload(upload)
+    return len(stale)
+
+def _remove_claimed_after_commit(session):
+    if session.in_nested_transaction():
+        return
+    for path in session.info.pop('uploads_claimed', ()):
+        if os.path.exists(path):
+            os.remove(path)
+
+def _forget_after_rollback(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop('uploads_claimed', None)
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from extensions import db
+from models import User
+
+class UserCache:
+    # Per-worker cache of User column values for Flask-Login's user_loader.
+    # Entries expire a fixed time after they were loaded (hits do not extend
+    # them), so a change made through another worker is visible within `ttl`.
+    def __init__(self, ttl=30, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def load(self, user_id):
+        values = self._lookup(user_id) if self.ttl > 0 else None
+        if values is not None:
+            return _attach(values)
+        
+        user = db.session.get(User, user_id)
+        if user is not None and self.ttl > 0:
+            self._store(user_id, _snapshot(user))
+        return user
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_ratio': round(self.hits / total, 4) if total else 0,
+                'ttl_seconds': self.ttl,
+            }
+    
+    def _lookup(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                self._entries.move_to_end(user_id)
+                return entry[0]
+            self.misses += 1
+            if entry is not None:
+                del self._entries[user_id]
+            return None
+    
+    def _store(self, user_id, values):
+        with self._lock:
+            self._entries[user_id] = (values, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+cache = UserCache()
+
+def init_app(app):
+    app.config.setdefault('USER_CACHE_TTL', 30)
+    app.config.setdefault('USER_CACHE_SIZE', 10000)
+    cache.ttl = app.config['USER_CACHE_TTL']
+    cache.max_size = app.config['USER_CACHE_SIZE']
+
+def load(user_id):
+    return cache.load(user_id)
+
+def invalidate(user_id):
+    cache.invalidate(user_id)
+
+def stats():
+    return cache.stats()
+
+def _snapshot(user):
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+def _attach(values):
+    # Rebuild the row as a detached instance and merge it without a SELECT, so
+    # the request gets a normal session-bound User (lazy loads, updates work).
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
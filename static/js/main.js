@@ -56,6 +56,7 @@ function markVideoComplete(videoId) {
         .then(response => response.json())
         .then(data => {
             if (data.success) {
+                form.querySelector('input[name="completed"]').value = data.completed ? '0' : '1';
                 const button = form.querySelector('button');
                 if (data.completed) {
                     button.classList.remove('btn-outline-success');